@@ -1,12 +1,38 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify, request
 from datetime import datetime
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+import base64
+import gzip
+import json
 import os
+import threading
+import time
+import uuid
+
+from path_finder import SubgraphExtractor
+from topology_index import node_labels
 
 app = Flask(__name__)
 
 # Global reference to topology manager
 topology_manager = None
 event_logger = None
+resource_watcher = None
+
+# Distinguishes ETags across restarts, since graph versions restart from zero
+BOOT_ID = uuid.uuid4().hex[:8]
+_view_cache_lock = threading.Lock()
+
+DEFAULT_PAGE_LIMIT = 500
+MAX_PAGE_LIMIT = 5000
+# Query parameters that don't change which records are returned
+_PASSIVE_ARGS = {'max_staleness'}
+# Subgraph/neighborhood results kept per graph version
+MAX_CACHED_QUERIES = 256
+# Filtered edge candidate lists (/edges with node predicates) kept per graph version
+MAX_CACHED_EDGE_FILTERS = 32
 
 @app.route('/healthz')
 def healthz():
@@ -15,27 +41,462 @@ def healthz():
     """
     return jsonify({"status": "ok"}), 200
 
-@app.route('/nodes')
-def get_nodes():
-    topology_manager.refresh_topology()  
-    return jsonify([{
+def _current_view():
+    """
+    Current in-memory graph view. Callers can pass ?max_staleness=<seconds> to first
+    refresh the topology if the view was last known to match the cluster longer ago
+    than that (watch events keep it current); concurrent callers share one in-flight
+    refresh.
+    """
+    max_staleness = request.args.get('max_staleness', type=float)
+    if max_staleness is not None:
+        topology_manager.refresh_if_stale(max_staleness)
+    return topology_manager.get_view()
+
+def _with_freshness(response, view):
+    """Attach headers describing which graph version the response was built from."""
+    response.headers['X-Topology-Version'] = str(view.version)
+    response.headers['X-Topology-Generation'] = str(view.generation)
+    response.headers['X-Topology-Age'] = f"{view.age:.3f}"
+    return response
+
+def _view_cached(view, key: str, build):
+    """Compute `build(view)` at most once per graph version, caching it on the view."""
+    value = view.cache.get(key)
+    if value is None:
+        with _view_cache_lock:
+            value = view.cache.get(key)
+            if value is None:
+                value = build(view)
+                view.cache[key] = value
+    return value
+
+def _view_cached_lru(view, name: str, key, build, max_size: int):
+    """
+    Compute `build(view)` per `key` at most once per graph version, caching the
+    `max_size` most recently used results on the view under `name`.
+    """
+    entries = _view_cached(view, name, lambda v: OrderedDict())
+    with _view_cache_lock:
+        value = entries.get(key)
+        if value is not None:
+            entries.move_to_end(key)
+            return value
+    value = build(view)
+    with _view_cache_lock:
+        entries[key] = value
+        while len(entries) > max_size:
+            entries.popitem(last=False)
+    return value
+
+def _cached_body(view, name, build, compressed: bool) -> bytes:
+    """
+    JSON body for `build(view)`, serialized at most once per graph version and
+    cached on the view together with its gzip-compressed copy.
+    """
+    raw = _view_cached(view, f"{name}.json",
+                       lambda v: json.dumps(build(v), separators=(',', ':')).encode('utf-8'))
+    if not compressed:
+        return raw
+    return _view_cached(view, f"{name}.json.gz", lambda v: gzip.compress(raw, compresslevel=5))
+
+def _cached_json_response(view, name, build):
+    """
+    Serve a cached JSON representation of the view. Unchanged polls carrying a
+    matching If-None-Match get a 304 without any serialization work.
+    """
+    compressed = request.accept_encodings['gzip'] > 0
+    etag = f"{BOOT_ID}-{view.version}-{name}" + ("-gz" if compressed else "")
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(_cached_body(view, name, build, compressed),
+                            mimetype='application/json')
+        if compressed:
+            response.headers['Content-Encoding'] = 'gzip'
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    return _with_freshness(response, view)
+
+def _node_record(node_id: str, attrs: Dict) -> Dict:
+    return {
         'id': node_id,
-        **{k: str(v) for k, v in topology_manager.graph.nodes[node_id].items()}  # Convert all values to strings
-    } for node_id in topology_manager.graph.nodes])
+        **{k: str(v) for k, v in attrs.items()}  # Convert all values to strings
+    }
 
-@app.route('/edges')
-def get_edges():
-    topology_manager.refresh_topology()  # Ensure latest state
-    return jsonify([{
+def _edge_record(source: str, target: str, attrs: Dict) -> Dict:
+    return {
         'source': source,
         'target': target,
         **attrs
-    } for source, target, attrs in topology_manager.graph.edges(data=True)])
+    }
+
+def _node_records(view):
+    return [_node_record(node_id, attrs) for node_id, attrs in view.graph.nodes(data=True)]
+
+def _edge_records(view):
+    return [_edge_record(source, target, attrs)
+            for source, target, attrs in view.graph.edges(data=True)]
+
+def _split_predicate(predicate: str) -> Tuple[str, Optional[str]]:
+    """'key=value' -> (key, value); a bare 'key' only requires the key to exist."""
+    key, sep, value = predicate.partition('=')
+    return key, (value if sep else None)
+
+class NodeFilter(NamedTuple):
+    """
+    Node predicates taken from the query string:
+      ?kind=Pod[,Service]  ?namespace=shop  ?label=app=web  ?label=tier  ?attr=uid=...
+    `label` and `attr` may be repeated; all predicates must hold.
+    """
+    kinds: Set[str]
+    namespace: Optional[str]
+    labels: List[Tuple[str, Optional[str]]]
+    attrs: List[Tuple[str, Optional[str]]]
+
+    @classmethod
+    def from_args(cls, args) -> 'NodeFilter':
+        return cls(
+            kinds={k for arg in args.getlist('kind') for k in arg.split(',') if k},
+            namespace=args.get('namespace'),
+            labels=[_split_predicate(p) for p in args.getlist('label')],
+            attrs=[_split_predicate(p) for p in args.getlist('attr')]
+        )
+
+    @property
+    def key(self) -> Tuple:
+        """Hashable form of the filter, for caching."""
+        return (tuple(sorted(self.kinds)), self.namespace, tuple(self.labels), tuple(self.attrs))
+
+    @property
+    def active(self) -> bool:
+        return bool(self.kinds or self.namespace is not None or self.labels or self.attrs)
+
+    def matches(self, attrs: Dict) -> bool:
+        if self.kinds and attrs.get('kind') not in self.kinds:
+            return False
+        if self.namespace is not None and (attrs.get('namespace') or "") != self.namespace:
+            return False
+        if self.labels:
+            labels = node_labels(attrs)
+            for key, value in self.labels:
+                if key not in labels or (value is not None and str(labels[key]) != value):
+                    return False
+        for key, value in self.attrs:
+            if key not in attrs or (value is not None and str(attrs[key]) != value):
+                return False
+        return True
+
+def _build_node_index(view) -> Dict:
+    """Sorted node IDs overall, per kind and per namespace, for cursor pagination."""
+    by_kind, by_namespace = {}, {}
+    for node_id, attrs in view.graph.nodes(data=True):
+        by_kind.setdefault(attrs.get('kind'), []).append(node_id)
+        by_namespace.setdefault(attrs.get('namespace') or "", []).append(node_id)
+    for ids in (*by_kind.values(), *by_namespace.values()):
+        ids.sort()
+    return {'all': sorted(view.graph.nodes), 'kind': by_kind, 'namespace': by_namespace}
+
+def _node_candidates(view, node_filter: NodeFilter) -> List[str]:
+    """Smallest sorted ID list that can contain every node matching the filter."""
+    index = _view_cached(view, 'nodes.index', _build_node_index)
+    candidates = [index['all']]
+    if node_filter.kinds:
+        lists = [index['kind'].get(kind, []) for kind in node_filter.kinds]
+        candidates.append(lists[0] if len(lists) == 1 else sorted(i for ids in lists for i in ids))
+    if node_filter.namespace is not None:
+        candidates.append(index['namespace'].get(node_filter.namespace, []))
+    return min(candidates, key=len)
+
+def _iter_nodes(view, node_filter: NodeFilter, after=None):
+    """Yield (key, record) for matching nodes in ID order, starting after `after`."""
+    candidates = _node_candidates(view, node_filter)
+    nodes = view.graph.nodes
+    start = bisect_right(candidates, after) if after is not None else 0
+    for node_id in candidates[start:]:
+        attrs = nodes[node_id]
+        if node_filter.matches(attrs):
+            yield node_id, _node_record(node_id, attrs)
+
+def _edge_types(attrs: Dict) -> List[str]:
+    edge_type = attrs.get('type')
+    return edge_type if isinstance(edge_type, list) else [edge_type]
+
+def _touching_edges(view, node_filter: NodeFilter) -> List[Tuple[str, str]]:
+    """Sorted (source, target) keys of the edges touching at least one matching node."""
+    graph = view.graph
+    touching = set()
+    for node_id, _ in _iter_nodes(view, node_filter):
+        touching.update(graph.out_edges(node_id))
+        touching.update(graph.in_edges(node_id))
+    return sorted(touching)
+
+def _iter_edges(view, args, after=None):
+    """
+    Yield (key, record) for matching edges in (source, target) order, starting after
+    `after`. Supports ?type=, ?source=, ?target=, and the node predicates of NodeFilter,
+    which select edges touching at least one matching node.
+    """
+    graph = view.graph
+    node_filter = NodeFilter.from_args(args)
+    source, target = args.get('source'), args.get('target')
+    types = {t for arg in args.getlist('type') for t in arg.split(',') if t}
+
+    if source is not None:
+        candidates = sorted((source, t) for t in graph.successors(source)) if source in graph else []
+    elif target is not None:
+        candidates = sorted((s, target) for s in graph.predecessors(target)) if target in graph else []
+    elif node_filter.active:
+        candidates = _view_cached_lru(view, 'edges.touching', node_filter.key,
+                                      lambda v: _touching_edges(v, node_filter),
+                                      MAX_CACHED_EDGE_FILTERS)
+    else:
+        candidates = _view_cached(view, 'edges.index', lambda v: sorted(v.graph.edges))
+
+    # Without source/target, candidates already only touch matching nodes
+    check_nodes = node_filter.active and (source is not None or target is not None)
+    start = bisect_right(candidates, tuple(after)) if after is not None else 0
+    for key in candidates[start:]:
+        s, t = key
+        if target is not None and t != target:
+            continue
+        attrs = graph.edges[s, t]
+        if types and not types.intersection(_edge_types(attrs)):
+            continue
+        if check_nodes and not (node_filter.matches(graph.nodes[s]) or
+                                node_filter.matches(graph.nodes[t])):
+            continue
+        yield key, _edge_record(s, t, attrs)
+
+def _encode_cursor(key) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii').rstrip('=')
+
+def _decode_cursor(cursor: str, key_length: int):
+    """Decode a cursor; node keys are a single ID, edge keys a (source, target) pair."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"invalid cursor: {cursor}") from e
+    parts = [key] if key_length == 1 else key
+    if not isinstance(parts, list) or len(parts) != key_length or \
+            not all(isinstance(part, str) for part in parts):
+        raise ValueError(f"invalid cursor: {cursor}")
+    return key
+
+def _int_arg(name: str, default: Optional[int] = None) -> Optional[int]:
+    """Integer query parameter; raises ValueError unless it is one."""
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer: {value}") from None
+
+def _page_limit(default: Optional[int]) -> Optional[int]:
+    limit = _int_arg('limit')
+    if limit is None:
+        return default
+    if limit <= 0:
+        raise ValueError("limit must be positive")
+    return min(limit, MAX_PAGE_LIMIT)
+
+def _ndjson_stream(records, limit: Optional[int]):
+    """
+    Stream records as NDJSON. When `limit` cuts the listing short, the last line
+    is {"next_cursor": ...} instead of a record.
+    """
+    for count, (key, record) in enumerate(records):
+        if limit is not None and count >= limit:
+            yield json.dumps({'next_cursor': _encode_cursor(last_key)}) + "\n"
+            return
+        last_key = key
+        yield json.dumps(record, separators=(',', ':')) + "\n"
+
+def _listing_response(view, name, iterate, build_all, key_length: int):
+    """
+    Shared handler for /nodes and /edges:
+      - no query parameters: the whole cached listing as a JSON array (ETag/gzip aware)
+      - ?format=ndjson: chunked NDJSON streamed from the view, optionally with ?limit=
+      - otherwise: a JSON page {"items", "next_cursor", "version"} of at most ?limit= items
+    Pages continue from ?cursor=, which is opaque and only meaningful for the same
+    filters; records come from an immutable view, so streaming never sees a half-applied
+    update.
+    """
+    if not set(request.args) - _PASSIVE_ARGS:
+        return _cached_json_response(view, name, build_all)
+
+    streaming = request.args.get('format') == 'ndjson'
+    try:
+        cursor = request.args.get('cursor')
+        after = _decode_cursor(cursor, key_length) if cursor else None
+        limit = _page_limit(None if streaming else DEFAULT_PAGE_LIMIT)
+        records = iterate(view, request.args, after)
+        if streaming:
+            return _with_freshness(Response(_ndjson_stream(records, limit),
+                                            mimetype='application/x-ndjson'), view)
+
+        items, next_cursor = [], None
+        for key, record in records:
+            if len(items) >= limit:
+                next_cursor = _encode_cursor(last_key)
+                break
+            last_key = key
+            items.append(record)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return _with_freshness(jsonify({
+        'items': items,
+        'next_cursor': next_cursor,
+        'version': view.version
+    }), view)
+
+@app.route('/nodes')
+def get_nodes():
+    return _listing_response(
+        _current_view(), 'nodes',
+        lambda view, args, after: _iter_nodes(view, NodeFilter.from_args(args), after),
+        _node_records, key_length=1
+    )
+
+@app.route('/edges')
+def get_edges():
+    return _listing_response(_current_view(), 'edges', _iter_edges, _edge_records,
+                             key_length=2)
 
 @app.route('/graph')
 def get_graph():
-    topology_manager.refresh_topology()  # Ensure latest state
-    return jsonify(topology_manager._serialize_graph())
+    """Current graph, or with ?at=<epoch seconds | ISO 8601> the graph recorded at that time."""
+    if request.args.get('at') is not None:
+        return _historical_graph(request.args['at'])
+    return _cached_json_response(
+        _current_view(), 'graph',
+        lambda view: topology_manager._serialize_graph(view.graph)
+    )
+
+def _parse_time(value: str) -> float:
+    """Epoch seconds or an ISO 8601 timestamp (naive timestamps are local time)."""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        raise ValueError(f"invalid timestamp: {value}")
+
+def _history_or_error():
+    if topology_manager.history is None:
+        return None, (jsonify({"error": "topology history is disabled"}), 404)
+    return topology_manager.history, None
+
+def _historical_graph(at: str):
+    """Serve the topology as recorded at `at`, reconstructed from the snapshot history."""
+    history, error = _history_or_error()
+    if error:
+        return error
+    try:
+        timestamp = _parse_time(at)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    state = history.view_at(timestamp)
+    if state is None:
+        return jsonify({"error": f"no topology recorded at or before {at}"}), 404
+    graph, node_cache, state_time = state
+
+    # Recorded states never change, so the state time identifies the representation
+    etag = f"{BOOT_ID}-at-{state_time!r}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        data = topology_manager._serialize_graph(graph)
+        data['node_cache'] = node_cache
+        data['metadata']['as_of'] = state_time
+        response = jsonify(data)
+    response.set_etag(etag)
+    response.headers['X-Topology-As-Of'] = f"{state_time:.3f}"
+    return response
+
+@app.route('/diff')
+def get_diff():
+    """
+    Changes between the topology recorded at ?from= and at ?to= (default: the latest
+    recorded state). Both accept epoch seconds or ISO 8601 timestamps.
+    """
+    history, error = _history_or_error()
+    if error:
+        return error
+    if request.args.get('from') is None:
+        return jsonify({"error": "the 'from' parameter is required"}), 400
+    try:
+        from_time = _parse_time(request.args['from'])
+        to_time = _parse_time(request.args['to']) if request.args.get('to') else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    diff = history.diff(from_time, to_time)
+    if diff is None:
+        return jsonify({"error": "no topology recorded at or before the requested time"}), 404
+    return jsonify(diff)
+
+def _cached_query_response(view, key: str, compute):
+    """
+    Serve `compute(view)` as JSON, caching the serialized result on the view (bounded,
+    least recently used first out) so repeated queries against an unchanged graph are free.
+    """
+    body = _view_cached_lru(view, 'queries', key,
+                            lambda v: json.dumps(compute(v), separators=(',', ':')).encode('utf-8'),
+                            MAX_CACHED_QUERIES)
+    return _with_freshness(Response(body, mimetype='application/json'), view)
+
+def _query_error(e: ValueError, view, node_id: str):
+    status = 404 if node_id not in view.graph else 400
+    return jsonify({"error": str(e)}), status
+
+@app.route('/subgraph/<node_id>')
+def get_subgraph(node_id):
+    """
+    Ancestors and descendants of a node, as produced by SubgraphExtractor.
+    ?depth=N limits how many hops are followed in each direction.
+    """
+    view = _current_view()
+    try:
+        depth = _int_arg('depth')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if depth is not None and depth < 0:
+        return jsonify({"error": "depth must not be negative"}), 400
+    try:
+        return _cached_query_response(
+            view, f"subgraph:{node_id}:{depth}",
+            lambda v: SubgraphExtractor.from_graph(v.graph).extract_subgraph(node_id, depth=depth)
+        )
+    except ValueError as e:
+        return _query_error(e, view, node_id)
+
+@app.route('/neighbors/<node_id>')
+def get_neighbors(node_id):
+    """
+    Neighborhood of a node:
+      ?depth=N (default 1)  ?direction=up|down|both (default both)  ?edge_type=OWNS[,SELECTS]
+    """
+    view = _current_view()
+    try:
+        depth = _int_arg('depth', default=1)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    direction = request.args.get('direction', default='both')
+    edge_types = sorted({t for arg in request.args.getlist('edge_type')
+                         for t in arg.split(',') if t})
+    if depth < 0:
+        return jsonify({"error": "depth must not be negative"}), 400
+    try:
+        return _cached_query_response(
+            view, f"neighbors:{node_id}:{depth}:{direction}:{','.join(edge_types)}",
+            lambda v: SubgraphExtractor.from_graph(v.graph).neighbors(
+                node_id, depth=depth, direction=direction, edge_types=edge_types)
+        )
+    except ValueError as e:
+        return _query_error(e, view, node_id)
 
 @app.route('/events')
 def get_events():
@@ -51,14 +512,32 @@ def get_events():
     return jsonify(events)
 
 
+@app.route('/metrics')
+def get_metrics():
+    """Watch pipeline counters (queue depth, wait times, drops) and the current graph version."""
+    view = topology_manager.get_view()
+    metrics = {
+        'topology': {
+            'version': view.version,
+            'generation': view.generation,
+            'nodes': view.graph.number_of_nodes(),
+            'edges': view.graph.number_of_edges(),
+            'age_seconds': round(view.age, 3),
+        }
+    }
+    if resource_watcher is not None:
+        metrics.update(resource_watcher.metrics())
+    return jsonify(metrics)
+
 @app.route('/refresh')
 def refresh_topology():
     """Endpoint to manually trigger topology refresh"""
     topology_manager.refresh_topology()
     return jsonify({"status": "success"})
 
-def start_server(topology_mgr, evt_logger):
-    global topology_manager, event_logger
+def start_server(topology_mgr, evt_logger, watcher=None):
+    global topology_manager, event_logger, resource_watcher
     topology_manager = topology_mgr
     event_logger = evt_logger
+    resource_watcher = watcher
     app.run(host='0.0.0.0', port=8080)
\ No newline at end of file
@@ -0,0 +1,110 @@
+# bench_path_finder.py
+
+"""
+Benchmark for batch subgraph extraction: ancestor/descendant sets computed
+independently per seed (BFS) vs shared across the batch (SharedReachability),
+on a synthetic cluster, plus the degenerate shapes (a wide tree, a long chain)
+the shared memo has to stay bounded on.
+
+    python bench_path_finder.py [--namespaces 20] [--deployments 25] [--replicas 8]
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import networkx as nx
+
+from path_finder import SharedReachability, SubgraphExtractor
+
+def synthetic_cluster(namespaces: int, deployments: int, replicas: int, nodes: int = 50) -> nx.DiGraph:
+    """Cluster -> Namespace -> Deployment -> ReplicaSet -> Pod, Service -> Pod, Node -> Pod, Pod -> ConfigMap/Secret."""
+    graph = nx.DiGraph()
+    graph.add_node("cluster", kind="K8Cluster")
+    for n in range(nodes):
+        graph.add_edge("cluster", f"node/{n}")
+    pod_count = 0
+    for ns in range(namespaces):
+        namespace = f"ns/{ns}"
+        graph.add_edge("cluster", namespace)
+        config, secret = f"{namespace}/cm", f"{namespace}/secret"
+        graph.add_edge(namespace, config)
+        graph.add_edge(namespace, secret)
+        for d in range(deployments):
+            deployment, replicaset, service = (f"{namespace}/deploy/{d}", f"{namespace}/rs/{d}",
+                                               f"{namespace}/svc/{d}")
+            graph.add_edge(namespace, deployment)
+            graph.add_edge(namespace, service)
+            graph.add_edge(deployment, replicaset)
+            for r in range(replicas):
+                pod = f"{namespace}/pod/{d}-{r}"
+                graph.add_edge(replicaset, pod)
+                graph.add_edge(service, pod)
+                graph.add_edge(f"node/{pod_count % nodes}", pod)
+                graph.add_edge(pod, config)
+                graph.add_edge(pod, secret)
+                pod_count += 1
+    return graph
+
+def wide_tree(size: int, fanout: int = 8) -> nx.DiGraph:
+    graph = nx.DiGraph()
+    graph.add_node(0)
+    for node in range(1, size):
+        graph.add_edge((node - 1) // fanout, node)
+    return graph
+
+def chain(size: int) -> nx.DiGraph:
+    return nx.path_graph(size, create_using=nx.DiGraph)
+
+def _timed(func):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 2 ** 20
+
+def independent(graph: nx.DiGraph, seeds):
+    extractor = SubgraphExtractor.from_graph(graph)
+    return [extractor._find_paths_to_root(s) | extractor._find_paths_to_leaves(s) for s in seeds]
+
+def shared(graph: nx.DiGraph, seeds):
+    extractor = SubgraphExtractor.from_graph(graph)
+    memo = SharedReachability.for_graph(graph)
+    return [extractor._find_paths_to_root(s, shared=memo) | extractor._find_paths_to_leaves(s, shared=memo)
+            for s in seeds]
+
+def run(name: str, graph: nx.DiGraph, seeds):
+    base, base_time, base_mem = _timed(lambda: independent(graph, seeds))
+    result, shared_time, shared_mem = _timed(lambda: shared(graph, seeds))
+    assert result == base, f"{name}: shared results differ from per-seed BFS"
+    print(f"{name:<40} {len(seeds):>7} seeds  per-seed BFS {base_time:7.3f}s {base_mem:7.1f}MiB  "
+          f"shared {shared_time:7.3f}s {shared_mem:7.1f}MiB  ({base_time / shared_time:.1f}x)")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark batch subgraph extraction')
+    parser.add_argument('--namespaces', type=int, default=20)
+    parser.add_argument('--deployments', type=int, default=25)
+    parser.add_argument('--replicas', type=int, default=8)
+    parser.add_argument('--tree-size', type=int, default=200000)
+    parser.add_argument('--chain-size', type=int, default=20000)
+    args = parser.parse_args()
+
+    graph = synthetic_cluster(args.namespaces, args.deployments, args.replicas)
+    print(f"synthetic cluster: {graph.number_of_nodes()} nodes, {graph.number_of_edges()} edges")
+    namespace = "ns/0"
+    run("every node of one namespace", graph,
+        [namespace] + sorted(n for n in nx.descendants(graph, namespace)))
+    run("every Deployment, ReplicaSet and Service", graph,
+        sorted(n for n in graph if "/deploy/" in n or "/rs/" in n or "/svc/" in n))
+    run("every Node", graph, sorted(n for n in graph if n.startswith("node/")))
+
+    tree = wide_tree(args.tree_size)
+    run(f"tree of {args.tree_size}: root + first 200", tree, list(range(200)))
+    line = chain(args.chain_size)
+    step = max(1, args.chain_size // 50)
+    run(f"chain of {args.chain_size}: 50 seeds", line, list(range(0, args.chain_size, step)))
+
+if __name__ == "__main__":
+    main()
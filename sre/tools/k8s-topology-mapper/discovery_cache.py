@@ -0,0 +1,97 @@
+# discovery_cache.py
+
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+class DiscoveryCache:
+    """
+    Caches API discovery results (the kinds served by each group/version).
+      - Entries are keyed by "group/version" and expire after `ttl` seconds.
+      - The whole cache is dropped when the cluster fingerprint (API groups + CRD set)
+        changes, so newly installed or removed CRDs are picked up immediately.
+      - The cache is persisted to `cache_file` so restarts can skip discovery.
+    """
+    FORMAT_VERSION = 1
+
+    def __init__(self, cache_file: Optional[str] = None, ttl: float = 600.0):
+        self.logger = logging.getLogger("discovery_cache")
+        self.cache_file = Path(cache_file) if cache_file else None
+        self.ttl = ttl
+        self.fingerprint: Optional[str] = None
+        self._entries: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def get(self, api_version: str) -> Optional[List[str]]:
+        """Return the cached kinds for `api_version`, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(api_version)
+            if not entry or time.time() - entry['fetched_at'] > self.ttl:
+                return None
+            return list(entry['kinds'])
+
+    def put(self, api_version: str, kinds: List[str]):
+        """Store the kinds discovered for `api_version`."""
+        with self._lock:
+            self._entries[api_version] = {'kinds': list(kinds), 'fetched_at': time.time()}
+
+    def validate(self, fingerprint: str) -> bool:
+        """
+        Compare the current cluster fingerprint with the cached one.
+        Invalidates every entry and returns False if it changed.
+        """
+        with self._lock:
+            if fingerprint == self.fingerprint:
+                return True
+            if self.fingerprint is not None:
+                self.logger.info("API groups or CRD set changed, invalidating discovery cache")
+            self.fingerprint = fingerprint
+            self._entries.clear()
+            return False
+
+    def invalidate(self):
+        """Drop all cached entries."""
+        with self._lock:
+            self.fingerprint = None
+            self._entries.clear()
+
+    def save(self):
+        """Persist the cache to disk (atomically) if a cache file is configured."""
+        if not self.cache_file:
+            return
+        with self._lock:
+            # Copied, since put() may change the entries while they are written out
+            data = {
+                'version': self.FORMAT_VERSION,
+                'fingerprint': self.fingerprint,
+                'entries': {api_version: dict(entry, kinds=list(entry['kinds']))
+                            for api_version, entry in self._entries.items()}
+            }
+        try:
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.cache_file.with_suffix('.tmp')
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_file, self.cache_file)
+        except Exception as e:
+            self.logger.warning(f"Error saving discovery cache to {self.cache_file}: {e}")
+
+    def _load(self):
+        """Load a previously persisted cache, ignoring unreadable or outdated files."""
+        if not self.cache_file or not self.cache_file.exists():
+            return
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != self.FORMAT_VERSION:
+                return
+            self.fingerprint = data.get('fingerprint')
+            self._entries = data.get('entries', {})
+            self.logger.info(f"Loaded {len(self._entries)} discovery entries from {self.cache_file}")
+        except Exception as e:
+            self.logger.warning(f"Ignoring unreadable discovery cache {self.cache_file}: {e}")
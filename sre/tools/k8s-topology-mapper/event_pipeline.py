@@ -0,0 +1,347 @@
+# event_pipeline.py
+
+"""
+Stages between the watch streams and the event processor.
+
+Watch events are dicts {'type', 'api_version', 'kind', 'object'} where
+'object' is a ResourceInstance. An event standing for several raw events
+(after coalescing) carries their number in 'coalesced'.
+
+A RELIST event carries a fresh LIST of a whole kind in 'items' (and no
+'object'); it replaces the state of every object of that kind, so it is
+never merged with other events and nothing is merged across it.
+"""
+
+import queue
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+EventKey = Tuple[str, str, str, str]
+
+RELIST = 'RELIST'
+
+def event_key(event: Dict) -> EventKey:
+    """(apiVersion, kind, namespace, name) of the object an event is about."""
+    if event['type'] == RELIST:
+        return (event['api_version'], event['kind'], "", "")
+    metadata = event['object'].metadata
+    return (event['api_version'], event['kind'],
+            getattr(metadata, 'namespace', None) or "", getattr(metadata, 'name', None) or "")
+
+class _Pending:
+    __slots__ = ('event', 'tombstone', 'count')
+
+    def __init__(self, event: Dict):
+        self.event = event
+        self.tombstone: Optional[Dict] = None
+        self.count = event.get('coalesced', 1)
+
+class EventCoalescer:
+    """
+    Collapses a burst of watch events to the latest state of each object:
+      - ADDED followed by MODIFIED stays ADDED, with the latest object
+      - MODIFIED followed by MODIFIED keeps only the latest
+      - DELETED always wins over earlier events and is kept as a tombstone
+      - DELETED followed by ADDED/MODIFIED (the object was recreated) keeps
+        the tombstone and then ADDED with the new object
+    Objects are emitted in the order they were first seen. Each emitted event
+    carries 'coalesced', the number of raw events it stands for.
+    """
+
+    def __init__(self):
+        self._pending: Dict[EventKey, _Pending] = {}
+        self.received = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, event: Dict):
+        self.received += 1
+        key = event_key(event)
+        pending = self._pending.get(key)
+        if pending is None:
+            self._pending[key] = _Pending(event)
+            return
+
+        pending.count += event.get('coalesced', 1)
+        previous = pending.event
+        if event['type'] == 'DELETED':
+            pending.event = event
+        elif previous['type'] == 'DELETED':
+            pending.tombstone = previous
+            pending.event = dict(event, type='ADDED')
+        elif previous['type'] == 'ADDED':
+            pending.event = dict(event, type='ADDED')
+        else:
+            pending.event = event
+
+    def drain(self) -> List[Dict]:
+        """The coalesced events; resets the coalescer."""
+        events = []
+        for pending in self._pending.values():
+            if pending.tombstone is not None:
+                tombstone_count = pending.tombstone.get('coalesced', 1)
+                events.append(dict(pending.tombstone, coalesced=tombstone_count))
+                pending.count -= tombstone_count
+            events.append(dict(pending.event, coalesced=pending.count))
+        self._pending.clear()
+        self.received = 0
+        return events
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# Kinds that shape the topology go first; high-churn, low-value kinds last
+DEFAULT_PRIORITIES = {
+    'Namespace': PRIORITY_HIGH, 'Node': PRIORITY_HIGH, 'CustomResourceDefinition': PRIORITY_HIGH,
+    'Deployment': PRIORITY_HIGH, 'StatefulSet': PRIORITY_HIGH, 'DaemonSet': PRIORITY_HIGH,
+    'Service': PRIORITY_HIGH,
+    'Lease': PRIORITY_LOW, 'Endpoints': PRIORITY_LOW, 'EndpointSlice': PRIORITY_LOW,
+    'Event': PRIORITY_LOW,
+}
+
+OVERFLOW_POLICIES = ('block', 'drop-oldest', 'coalesce')
+
+class _Entry:
+    __slots__ = ('event', 'key', 'enqueued_at')
+
+    def __init__(self, event: Dict, key: Optional[EventKey]):
+        self.event = event
+        self.key = key
+        self.enqueued_at = time.monotonic()
+
+class PriorityEventQueue:
+    """
+    Bounded queue of watch events, drained highest priority first and FIFO within
+    a priority. It keeps the queue.Queue interface used by the watcher (put/get
+    with block and timeout, get_nowait, task_done, empty, qsize), including the
+    None shutdown sentinel, which is never dropped and is returned only once
+    every queued event has been taken.
+
+    `policy` decides how the queue overflows:
+      - "block": when full, put() waits for room (raising queue.Full after
+        `timeout`), stalling the producer
+      - "drop-oldest": when full, the oldest event of the lowest queued priority
+        is dropped to make room; if only higher-priority events are queued, the
+        new one is dropped instead
+      - "coalesce": an event for an object that already has a queued event
+        replaces it in place, keeping its position (ADDED stays ADDED; a DELETED
+        tombstone is never replaced), so a burst on one object takes one slot;
+        when full and there is nothing to merge into, as "drop-oldest"
+    Dropped events are repaired by the watcher's periodic full refresh.
+    """
+
+    WAIT_SAMPLES = 1024
+
+    def __init__(self, maxsize: int = 10000, policy: str = "block",
+                 priorities: Optional[Dict[str, int]] = None):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {policy!r}; expected one of {', '.join(OVERFLOW_POLICIES)}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.priorities = DEFAULT_PRIORITIES if priorities is None else priorities
+        self._levels: List[Deque[_Entry]] = [deque() for _ in range(PRIORITY_LOW + 1)]
+        self._by_key: Dict[EventKey, _Entry] = {}
+        self._size = 0
+        self._sentinels = 0
+
+        self._mutex = threading.Lock()
+        self.not_empty = threading.Condition(self._mutex)
+        self.not_full = threading.Condition(self._mutex)
+        self.all_tasks_done = threading.Condition(self._mutex)
+        self.unfinished_tasks = 0
+
+        # Events accepted by put() (merged or dropped ones included) vs. those queued
+        self._received = 0
+        self._enqueued = 0
+        self._dequeued = 0
+        self._coalesced = 0
+        # Queued events dropped to make room; _dropped also counts those dropped on arrival
+        self._evicted = 0
+        self._dropped: Counter = Counter()
+        self._blocked_puts = 0
+        self._blocked_seconds = 0.0
+        self._waits: Deque[float] = deque(maxlen=self.WAIT_SAMPLES)
+        self._max_wait = 0.0
+
+    def priority_of(self, kind: str) -> int:
+        return self.priorities.get(kind, PRIORITY_NORMAL)
+
+    def qsize(self) -> int:
+        with self._mutex:
+            return self._size + self._sentinels
+
+    def empty(self) -> bool:
+        return self.qsize() == 0
+
+    def full(self) -> bool:
+        with self._mutex:
+            return self._size >= self.maxsize
+
+    def put(self, event: Optional[Dict], block: bool = True, timeout: Optional[float] = None):
+        with self.not_full:
+            if event is None:
+                self._sentinels += 1
+                self.unfinished_tasks += 1
+                self.not_empty.notify()
+                return
+
+            key = None
+            if event['type'] == RELIST:
+                self._forget_kind(event['api_version'], event['kind'])
+            elif self.policy == "coalesce":
+                key = event_key(event)
+            if key is not None and self._coalesce(key, event):
+                self._received += 1
+                return
+            priority = self.priority_of(event['kind'])
+            if self._size >= self.maxsize:
+                if self.policy == "block":
+                    self._wait_for_room(block, timeout)
+                elif not self._drop_for(priority, event):
+                    self._received += 1
+                    return
+
+            self._received += 1
+            self._enqueued += 1
+            entry = _Entry(event, key)
+            self._levels[priority].append(entry)
+            if key is not None:
+                self._by_key[key] = entry
+            self._size += 1
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    def put_nowait(self, event: Optional[Dict]):
+        self.put(event, block=False)
+
+    def _wait_for_room(self, block: bool, timeout: Optional[float]):
+        if not block:
+            raise queue.Full
+        started = time.monotonic()
+        self._blocked_puts += 1
+        try:
+            deadline = None if timeout is None else started + timeout
+            while self._size >= self.maxsize:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise queue.Full
+                self.not_full.wait(remaining)
+        finally:
+            self._blocked_seconds += time.monotonic() - started
+
+    def _coalesce(self, key: EventKey, event: Dict) -> bool:
+        """Merge `event` into the queued event for the same object, if possible."""
+        entry = self._by_key.get(key)
+        if entry is None or entry.event['type'] == 'DELETED':
+            return False
+        count = entry.event.get('coalesced', 1) + event.get('coalesced', 1)
+        if event['type'] == 'DELETED' or entry.event['type'] != 'ADDED':
+            entry.event = dict(event, coalesced=count)
+        else:
+            entry.event = dict(event, type='ADDED', coalesced=count)
+        self._coalesced += 1
+        return True
+
+    def _forget_kind(self, api_version: str, kind: str):
+        """Stop merging into queued events of a kind, so later ones stay behind its RELIST."""
+        for key in [key for key in self._by_key if key[0] == api_version and key[1] == kind]:
+            del self._by_key[key]
+
+    def _drop_for(self, priority: int, event: Dict) -> bool:
+        """Make room for an event of `priority`; False if the new event is dropped instead."""
+        for level in range(len(self._levels) - 1, priority - 1, -1):
+            if self._levels[level]:
+                victim = self._levels[level].popleft()
+                if victim.key is not None and self._by_key.get(victim.key) is victim:
+                    del self._by_key[victim.key]
+                self._size -= 1
+                self.unfinished_tasks -= 1
+                self._evicted += 1
+                self._dropped[victim.event['kind']] += victim.event.get('coalesced', 1)
+                return True
+        self._dropped[event['kind']] += event.get('coalesced', 1)
+        return False
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> Optional[Dict]:
+        with self.not_empty:
+            if not block:
+                if not self._size and not self._sentinels:
+                    raise queue.Empty
+            elif timeout is None:
+                while not self._size and not self._sentinels:
+                    self.not_empty.wait()
+            else:
+                deadline = time.monotonic() + timeout
+                while not self._size and not self._sentinels:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise queue.Empty
+                    self.not_empty.wait(remaining)
+
+            if not self._size:
+                self._sentinels -= 1
+                return None
+            entry = next(level for level in self._levels if level).popleft()
+            if entry.key is not None and self._by_key.get(entry.key) is entry:
+                del self._by_key[entry.key]
+            self._size -= 1
+            self._dequeued += 1
+            waited = time.monotonic() - entry.enqueued_at
+            self._waits.append(waited)
+            self._max_wait = max(self._max_wait, waited)
+            self.not_full.notify()
+            return entry.event
+
+    def get_nowait(self) -> Optional[Dict]:
+        return self.get(block=False)
+
+    def task_done(self):
+        with self.all_tasks_done:
+            if self.unfinished_tasks <= 0:
+                raise ValueError('task_done() called too many times')
+            self.unfinished_tasks -= 1
+            if self.unfinished_tasks == 0:
+                self.all_tasks_done.notify_all()
+
+    def join(self):
+        with self.all_tasks_done:
+            while self.unfinished_tasks:
+                self.all_tasks_done.wait()
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Queue depth, wait times (put to get, over the last WAIT_SAMPLES events) and drop
+        counters. `received` counts every event put, `enqueued` only those that took a
+        slot (not merged into a queued event, nor dropped on arrival), and `evicted`
+        the queued ones dropped to make room, so depth = enqueued - dequeued - evicted.
+        `dropped` counts the watch events lost either way, merged ones included.
+        """
+        with self._mutex:
+            waits = sorted(self._waits)
+            depth_by_priority = {name: len(self._levels[level]) for name, level in
+                                 (('high', PRIORITY_HIGH), ('normal', PRIORITY_NORMAL), ('low', PRIORITY_LOW))}
+            return {
+                'policy': self.policy,
+                'maxsize': self.maxsize,
+                'depth': self._size,
+                'depth_by_priority': depth_by_priority,
+                'received': self._received,
+                'enqueued': self._enqueued,
+                'dequeued': self._dequeued,
+                'coalesced': self._coalesced,
+                'evicted': self._evicted,
+                'dropped': sum(self._dropped.values()),
+                'dropped_by_kind': dict(self._dropped),
+                'blocked_puts': self._blocked_puts,
+                'blocked_seconds': round(self._blocked_seconds, 3),
+                'wait_seconds': {
+                    'avg': round(sum(waits) / len(waits), 6) if waits else 0.0,
+                    'p50': round(waits[len(waits) // 2], 6) if waits else 0.0,
+                    'p99': round(waits[min(len(waits) - 1, int(len(waits) * 0.99))], 6) if waits else 0.0,
+                    'max': round(self._max_wait, 6),
+                },
+            }
@@ -38,9 +38,38 @@ def parse_args():
     parser.add_argument('--data-dir', default='./topology_data',
                        help='Directory for storing topology data')
     parser.add_argument('--interval', type=int, default=300,
-                       help='Collection interval in seconds')
+                       help='Full snapshot interval in seconds (only used when history is disabled)')
     parser.add_argument('--max-snapshots', type=int, default=10,
-                       help='Maximum number of snapshots to keep')
+                       help='Maximum number of full snapshots to keep (only used when history is disabled)')
+    parser.add_argument('--collect-workers', type=int, default=8,
+                       help='Number of resource kinds listed concurrently during a refresh')
+    parser.add_argument('--collect-timeout', type=float, default=120.0,
+                       help='Timeout in seconds for listing a single resource kind')
+    parser.add_argument('--list-page-size', type=int, default=500,
+                       help='Number of objects requested per page when listing a resource kind')
+    parser.add_argument('--discovery-ttl', type=float, default=600.0,
+                       help='Seconds to cache API discovery results per group/version')
+    parser.add_argument('--snapshot-format', default='binary', choices=['binary', 'json'],
+                       help='Snapshot file format; convert binary snapshots for the offline '
+                            'tools with snapshot_format.py')
+    parser.add_argument('--delta-interval', type=int, default=0,
+                       help='Seconds between topology history deltas; enables the checkpoint + delta '
+                            'history in place of full snapshots every --interval (default: disabled)')
+    parser.add_argument('--checkpoint-interval', type=int, default=3600,
+                       help='Seconds between full history checkpoints')
+    parser.add_argument('--history-retention', type=int, default=3 * 24 * 3600,
+                       help='Seconds of topology history to keep')
+    parser.add_argument('--watch-threads', type=int, default=4,
+                       help='Threads multiplexing the resource watch streams')
+    parser.add_argument('--watch-start-rate', type=float, default=20.0,
+                       help='Maximum watch streams opened per second')
+    parser.add_argument('--coalesce-window', type=float, default=0.5,
+                       help='Seconds to collect watch events before collapsing them per object')
+    parser.add_argument('--event-queue-size', type=int, default=10000,
+                       help='Maximum watch events waiting to be processed')
+    parser.add_argument('--overflow-policy', default='coalesce',
+                       choices=['block', 'drop-oldest', 'coalesce'],
+                       help='What to do with watch events when the event queue is full')
     parser.add_argument('--log-level', default='INFO',
                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
                        help='Logging level')
@@ -52,30 +81,49 @@ def main():
     setup_logging(args.log_level)
     
     try:
-        k8s_client = K8sClient(kubeconfig_path=args.kubeconfig)
-        topology = K8sTopologyManager(k8s_client, persistence_dir=args.data_dir)
+        k8s_client = K8sClient(kubeconfig_path=args.kubeconfig,
+                               list_page_size=args.list_page_size,
+                               cache_dir=args.data_dir,
+                               discovery_ttl=args.discovery_ttl)
+        topology = K8sTopologyManager(k8s_client, persistence_dir=args.data_dir,
+                                      collect_workers=args.collect_workers,
+                                      collect_timeout=args.collect_timeout,
+                                      snapshot_format=args.snapshot_format,
+                                      history_dir=(os.path.join(args.data_dir, 'history')
+                                                   if args.delta_interval > 0 else None),
+                                      checkpoint_interval=args.checkpoint_interval,
+                                      history_retention=args.history_retention)
         event_logger = EventLogger(log_dir=args.data_dir)
         logger = logging.getLogger("k8s_client")
-        # Load existing topology if available
-        latest_snapshot = topology.get_latest_snapshot()
-        if latest_snapshot:
-            topology.load_snapshot(latest_snapshot)
-        else:
-            # Initial topology build
-            topology.refresh_topology()
+        # Load existing topology if available, preferring the snapshot history
+        if not topology.load_history():
+            latest_snapshot = topology.get_latest_snapshot()
+            if latest_snapshot:
+                topology.load_snapshot(latest_snapshot)
+            else:
+                # Initial topology build
+                topology.refresh_topology()
         
         # Start the watcher
-        watcher = K8sResourceWatcher(k8s_client, topology, event_logger)
+        watcher = K8sResourceWatcher(k8s_client, topology, event_logger,
+                                     watch_threads=args.watch_threads,
+                                     watch_start_rate=args.watch_start_rate,
+                                     coalesce_window=args.coalesce_window,
+                                     queue_size=args.event_queue_size,
+                                     overflow_policy=args.overflow_policy)
         watcher.start()
         
         # Start snapshot thread
         def run_snapshots():
             while True:
                 try:
-                    topology.save_snapshot()
-                    topology.cleanup_old_snapshots(args.max_snapshots)
+                    if topology.history:
+                        topology.record_history()
+                    else:
+                        topology.save_snapshot()
+                        topology.cleanup_old_snapshots(args.max_snapshots)
                     topology.cleanup_old_nodes(max_age_seconds=3600)  
-                    time.sleep(args.interval)
+                    time.sleep(args.delta_interval if topology.history else args.interval)
                 except Exception as e:
                     logger.error(f"Snapshot error: {e}")
                     time.sleep(60)
@@ -88,7 +136,7 @@ def main():
         
         # Start API server
         from app import start_server
-        start_server(topology, event_logger)
+        start_server(topology, event_logger, watcher)
         
     except Exception as e:
         logger.error(f"Fatal error: {e}", exc_info=True)
@@ -2,18 +2,34 @@ import networkx as nx
 import json
 import argparse
 import logging
-from typing import Set, Dict, Any
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Set, Dict, Any, FrozenSet, Iterable, List, Optional, Tuple
 from pathlib import Path
 
-logging.basicConfig(level=logging.DEBUG)
+from topology_index import NodeIndex
+
 logger = logging.getLogger(__name__)
 
+DIRECTIONS = ("up", "down", "both")
+
 class SubgraphExtractor:
     def __init__(self, topology_data: Dict):
         self.topology_data = topology_data
         self.graph = nx.DiGraph()
         self._build_graph()
+        self._index: Optional[NodeIndex] = None
         logger.debug(f"Built graph with {len(self.graph.nodes)} nodes and {len(self.graph.edges)} edges")
+
+    @classmethod
+    def from_graph(cls, graph: nx.DiGraph) -> 'SubgraphExtractor':
+        """Wrap an already built graph (e.g. the service's in-memory view) without copying it."""
+        extractor = cls.__new__(cls)
+        extractor.topology_data = None
+        extractor.graph = graph
+        extractor._index = None
+        return extractor
         
     def _build_graph(self):
         for node in self.topology_data.get("nodes", []):
@@ -21,65 +37,75 @@ class SubgraphExtractor:
         for edge in self.topology_data.get("edges", []):
             self.graph.add_edge(edge["source"], edge["target"], **edge.get("attributes", {}))
 
-    def _find_paths_to_root(self, start_node: str) -> Set[str]:
-        nodes_in_paths = set()
-        paths = [[start_node]]
-        explored_paths = set()
-        
-        while paths:
-            current_path = paths.pop(0)
-            current_node = current_path[-1]
-            path_key = ','.join(current_path)
-            
-            if path_key in explored_paths:
-                continue
-                
-            explored_paths.add(path_key)
-            nodes_in_paths.update(current_path)
-            
-            # Add paths through all predecessors
-            for pred in self.graph.predecessors(current_node):
-                if pred not in current_path:  # Avoid cycles
-                    new_path = current_path + [pred]
-                    paths.append(new_path)
-                    
-        return nodes_in_paths
-
-    def _find_paths_to_leaves(self, start_node: str) -> Set[str]:
-        nodes_in_paths = set()
-        paths = [[start_node]]
-        explored_paths = set()
-        
-        while paths:
-            current_path = paths.pop(0)
-            current_node = current_path[-1]
-            path_key = ','.join(current_path)
-            
-            if path_key in explored_paths:
-                continue
-                
-            explored_paths.add(path_key)
-            nodes_in_paths.update(current_path)
-            
-            # Add paths through all successors
-            successors = list(self.graph.successors(current_node))
-            if not successors:  # This is a leaf node
-                continue
-                
-            for succ in successors:
-                if succ not in current_path:  # Avoid cycles
-                    new_path = current_path + [succ]
-                    paths.append(new_path)
-                    
-        return nodes_in_paths
-
-    def extract_subgraph(self, node_id: str) -> Dict:
+    def _find_paths_to_root(self, start_node: str, depth: Optional[int] = None,
+                            shared: Optional['SharedReachability'] = None) -> Set[str]:
+        """Every node on some path from the root(s) down to `start_node` (its ancestors)."""
+        if depth is None and shared is not None:
+            return shared.reachable(start_node, "up")
+        return set(self._traverse(start_node, "up", depth))
+
+    def _find_paths_to_leaves(self, start_node: str, depth: Optional[int] = None,
+                              shared: Optional['SharedReachability'] = None) -> Set[str]:
+        """Every node on some path from `start_node` down to the leaves (its descendants)."""
+        if depth is None and shared is not None:
+            return shared.reachable(start_node, "down")
+        return set(self._traverse(start_node, "down", depth))
+
+    @property
+    def index(self) -> NodeIndex:
+        """Attribute index over the graph, built on first use."""
+        if self._index is None:
+            self._index = NodeIndex(self.graph)
+        return self._index
+
+    def select_nodes(self, kind: Optional[str] = None, namespace: Optional[str] = None,
+                     labels: Optional[Dict[str, Optional[str]]] = None) -> List[str]:
+        """
+        IDs of nodes matching a kind/namespace/label selector, sorted. A label value of
+        None only requires the key to be present.
+        """
+        return self.index.select(kind, namespace, labels)
+
+    def find_node_by_attributes(self, kind: Optional[str] = None, name: Optional[str] = None,
+                                namespace: Optional[str] = None, **attrs) -> str:
+        """
+        ID of the node with the given kind, name and (optional) namespace; any further
+        attributes must match too. Raises ValueError if no node or more than one matches.
+        """
+        if kind and name:
+            if attrs:
+                candidates = self.index.lookup(kind, name, namespace)
+            else:
+                node_id = self.index.find(kind, name, namespace)
+                candidates = [node_id] if node_id else []
+        else:
+            candidates = self.index.select(kind, namespace)
+            if name:
+                candidates = [n for n in candidates if self.graph.nodes[n].get('name') == name]
+
+        matches = [node_id for node_id in candidates
+                   if all(str(self.graph.nodes[node_id].get(k)) == str(v) for k, v in attrs.items())]
+        search = {'kind': kind, 'name': name, 'namespace': namespace, **attrs}
+        search = ', '.join(f"{k}={v}" for k, v in search.items() if v is not None)
+        if not matches:
+            raise ValueError(f"No node found matching {search}")
+        if len(matches) > 1:
+            raise ValueError(f"{len(matches)} nodes match {search}; narrow the search")
+        return matches[0]
+
+    def extract_subgraph(self, node_id: str, depth: Optional[int] = None,
+                         shared: Optional['SharedReachability'] = None) -> Dict:
+        """
+        Subgraph of every ancestor and descendant of `node_id`, optionally limited
+        to `depth` hops in each direction. Batch extraction passes `shared` so
+        seeds reuse each other's ancestor/descendant sets.
+        """
         if node_id not in self.graph:
             raise ValueError(f"Node {node_id} not found in graph")
             
         # Get all nodes in paths
-        nodes_to_root = self._find_paths_to_root(node_id)
-        nodes_to_leaves = self._find_paths_to_leaves(node_id)
+        nodes_to_root = self._find_paths_to_root(node_id, depth, shared)
+        nodes_to_leaves = self._find_paths_to_leaves(node_id, depth, shared)
         all_nodes = nodes_to_root.union(nodes_to_leaves)
         
         logger.debug(f"Found {len(nodes_to_root)} nodes to root")
@@ -90,14 +116,78 @@ class SubgraphExtractor:
         subgraph = self.graph.subgraph(all_nodes)
         
         # Debug edges
-        logger.debug("\nEdges in subgraph:")
-        for edge in subgraph.edges(data=True):
-            source_kind = subgraph.nodes[edge[0]].get('kind')
-            target_kind = subgraph.nodes[edge[1]].get('kind')
-            logger.debug(f"  {source_kind} -> {target_kind} ({edge[2]['type']})")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("\nEdges in subgraph:")
+            for edge in subgraph.edges(data=True):
+                source_kind = subgraph.nodes[edge[0]].get('kind')
+                target_kind = subgraph.nodes[edge[1]].get('kind')
+                logger.debug(f"  {source_kind} -> {target_kind} ({edge[2].get('type')})")
         
-        # Format result
-        result = {
+        return self._format_subgraph(subgraph)
+
+    def neighbors(self, node_id: str, depth: int = 1, direction: str = "both",
+                  edge_types: Optional[Iterable[str]] = None) -> Dict:
+        """
+        Neighborhood of a node up to `depth` hops away.
+          - direction "up" follows edges towards the root (predecessors), "down" towards
+            the leaves (successors), "both" follows either.
+          - edge_types, if given, restricts traversal and the returned edges to those types.
+        Nodes carry their hop `distance` from `node_id`.
+        """
+        if node_id not in self.graph:
+            raise ValueError(f"Node {node_id} not found in graph")
+        if direction not in DIRECTIONS:
+            raise ValueError(f"direction must be one of {', '.join(DIRECTIONS)}")
+        edge_types = set(edge_types) if edge_types else None
+
+        distances = self._traverse(node_id, direction, depth, edge_types)
+        subgraph = self.graph.subgraph(distances)
+        if edge_types:
+            subgraph = nx.subgraph_view(
+                subgraph, filter_edge=lambda u, v: self._edge_matches(self.graph, u, v, edge_types))
+        result = self._format_subgraph(subgraph)
+        for node in result["nodes"]:
+            node["distance"] = distances[node["id"]]
+        return result
+
+    def _traverse(self, start_node: str, direction: str, depth: Optional[int] = None,
+                  edge_types: Optional[Set[str]] = None) -> Dict[str, int]:
+        """
+        Breadth-first traversal with a visited set; returns {node: hop distance}
+        for every node reachable within `depth` hops (unbounded if None).
+        Each node and edge is visited at most once, so this is O(V+E) even on DAGs
+        with many parallel paths (e.g. Service->Endpoints->Pod and Service->Pod).
+        """
+        distances = {start_node: 0}
+        queue = deque([start_node])
+        while queue:
+            node = queue.popleft()
+            distance = distances[node]
+            if depth is not None and distance >= depth:
+                continue
+            neighbors = []
+            if direction in ("up", "both"):
+                neighbors.extend((pred, pred, node) for pred in self.graph.predecessors(node))
+            if direction in ("down", "both"):
+                neighbors.extend((succ, node, succ) for succ in self.graph.successors(node))
+            for neighbor, source, target in neighbors:
+                if neighbor in distances:
+                    continue
+                if edge_types and not self._edge_matches(self.graph, source, target, edge_types):
+                    continue
+                distances[neighbor] = distance + 1
+                queue.append(neighbor)
+        return distances
+
+    @staticmethod
+    def _edge_matches(graph: nx.DiGraph, source: str, target: str, edge_types: Set[str]) -> bool:
+        edge_type = graph.edges[source, target].get('type')
+        if isinstance(edge_type, list):
+            return not edge_types.isdisjoint(edge_type)
+        return edge_type in edge_types
+
+    def _format_subgraph(self, subgraph: nx.DiGraph) -> Dict:
+        return {
             "nodes": [
                 {
                     "id": node,
@@ -115,8 +205,6 @@ class SubgraphExtractor:
                 for source, target, data in subgraph.edges(data=True)
             ]
         }
-        
-        return result
 
     def _determine_position(self, node: str, graph: nx.DiGraph) -> str:
         """Determine node's position in the hierarchy."""
@@ -127,12 +215,182 @@ class SubgraphExtractor:
             return "leaf"
         else:
             return "intermediate"
-                                  
+
+class SharedReachability:
+    """
+    Unbounded ancestor/descendant sets of an acyclic graph, shared across the
+    seeds of one batch. Every node's reachable set is computed once, bottom-up
+    with an iterative post-order DFS, but only sets of at most `max_size` nodes
+    are kept; larger ones are marked as such. A seed whose own set is small is
+    answered from the memo. Otherwise a BFS expands only the "large" nodes and
+    takes the union of the memoized small sets it meets. Memory stays within
+    about max_size**2 / 2 entries even for long chains, and work per node is
+    bounded by max_size, however deep or wide the graph is.
+    """
+
+    MAX_MEMO_SIZE = 1024
+
+    def __init__(self, graph: nx.DiGraph, max_size: int = MAX_MEMO_SIZE):
+        self.graph = graph
+        self.max_size = max_size
+        # direction -> node -> reachable set (itself included), or None if larger than max_size
+        self._memo: Dict[str, Dict[str, Optional[FrozenSet[str]]]] = {"up": {}, "down": {}}
+
+    @classmethod
+    def for_graph(cls, graph: nx.DiGraph) -> Optional['SharedReachability']:
+        """A shared memo for `graph`, or None if it has cycles (seeds then use the plain BFS)."""
+        if not nx.is_directed_acyclic_graph(graph):
+            logger.info("Topology has cycles; batch seeds are extracted independently")
+            return None
+        return cls(graph)
+
+    def _neighbors(self, direction: str):
+        return self.graph.predecessors if direction == "up" else self.graph.successors
+
+    def _memoize(self, start_node: str, direction: str):
+        memo = self._memo[direction]
+        if start_node in memo:
+            return
+        neighbors = self._neighbors(direction)
+        stack = [(start_node, neighbors(start_node))]
+        while stack:
+            node, pending = stack[-1]
+            for neighbor in pending:
+                if neighbor not in memo:
+                    stack.append((neighbor, neighbors(neighbor)))
+                    break
+            else:
+                stack.pop()
+                reachable = {node}
+                for neighbor in neighbors(node):
+                    child = memo[neighbor]
+                    if child is None:
+                        reachable = None
+                        break
+                    reachable |= child
+                    if len(reachable) > self.max_size:
+                        reachable = None
+                        break
+                memo[node] = frozenset(reachable) if reachable is not None else None
+
+    def reachable(self, start_node: str, direction: str) -> Set[str]:
+        """Nodes reachable from `start_node` (itself included) following `direction` ("up"/"down")."""
+        self._memoize(start_node, direction)
+        memo = self._memo[direction]
+        cached = memo[start_node]
+        if cached is not None:
+            return set(cached)
+
+        # Any member of a small set only reaches members of that set, so it is
+        # never expanded again
+        neighbors = self._neighbors(direction)
+        result = {start_node}
+        queue = deque([start_node])
+        while queue:
+            node = queue.popleft()
+            for neighbor in neighbors(node):
+                if neighbor in result:
+                    continue
+                child = memo[neighbor]
+                if child is not None:
+                    result |= child
+                else:
+                    result.add(neighbor)
+                    queue.append(neighbor)
+        return result
+
+def _extract_to_file(extractor: SubgraphExtractor, node_id: str, output_dir: Path,
+                     depth: Optional[int], shared: Optional[SharedReachability] = None) -> str:
+    subgraph = extractor.extract_subgraph(node_id, depth=depth, shared=shared)
+    output_file = output_dir / f"{node_id}.json"
+    with open(output_file, 'w') as f:
+        json.dump(subgraph, f, indent=2)
+    return str(output_file)
+
+# Per-process extractor (and shared memo) used by batch workers; the topology is loaded once per worker
+_worker_extractor: Optional[SubgraphExtractor] = None
+_worker_shared: Optional[SharedReachability] = None
+
+def _init_worker(topology_file: str, log_level: str, share: bool):
+    global _worker_extractor, _worker_shared
+    logging.basicConfig(level=log_level)
+    with open(topology_file, 'r') as f:
+        _worker_extractor = SubgraphExtractor(json.load(f))
+    _worker_shared = SharedReachability.for_graph(_worker_extractor.graph) if share else None
+
+def _worker_extract(task: Tuple[str, str, Optional[int]]) -> Tuple[str, Optional[str], Optional[str]]:
+    node_id, output_dir, depth = task
+    try:
+        return node_id, _extract_to_file(_worker_extractor, node_id, Path(output_dir), depth,
+                                         _worker_shared), None
+    except Exception as e:
+        return node_id, None, str(e)
+
+def extract_batch(extractor: SubgraphExtractor, seeds: List[str], output_dir: str,
+                  depth: Optional[int] = None, workers: int = 1,
+                  topology_file: Optional[str] = None, log_level: str = "INFO") -> Dict[str, Dict]:
+    """
+    Extract one subgraph per seed into `output_dir/<node_id>.json` and write an
+    index.json manifest. Unbounded extractions share ancestor/descendant sets across
+    the seeds (see SharedReachability). With workers > 1 the seeds are spread over a
+    process pool whose workers each load `topology_file` once.
+    """
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    manifest = {}
+
+    share = depth is None and len(seeds) > 1
+    if workers > 1 and len(seeds) > 1:
+        tasks = [(node_id, str(output_path), depth) for node_id in seeds]
+        chunksize = max(1, len(seeds) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(topology_file, log_level, share)) as pool:
+            results = list(pool.map(_worker_extract, tasks, chunksize=chunksize))
+    else:
+        shared = SharedReachability.for_graph(extractor.graph) if share else None
+        results = []
+        for node_id in seeds:
+            try:
+                results.append((node_id, _extract_to_file(extractor, node_id, output_path, depth,
+                                                          shared), None))
+            except Exception as e:
+                results.append((node_id, None, str(e)))
+
+    for node_id, output_file, error in results:
+        attrs = extractor.graph.nodes[node_id] if node_id in extractor.graph else {}
+        entry = {key: attrs.get(key) for key in ('kind', 'namespace', 'name')}
+        if error:
+            entry['error'] = error
+            logger.error(f"Failed to extract subgraph for {node_id}: {error}")
+        else:
+            entry['output'] = output_file
+        manifest[node_id] = entry
+
+    with open(output_path / "index.json", 'w') as f:
+        json.dump(manifest, f, indent=2)
+    failed = sum(1 for entry in manifest.values() if 'error' in entry)
+    logger.info(f"Extracted {len(seeds) - failed}/{len(seeds)} subgraphs into {output_path}")
+    return manifest
+
+def _batch_seeds(args, extractor: SubgraphExtractor) -> List[str]:
+    """Seeds from --seeds/--seeds-file, plus every node matching the --select-* selector."""
+    seeds = list(args.seeds or [])
+    if args.seeds_file:
+        with open(args.seeds_file, 'r') as f:
+            seeds.extend(line.strip() for line in f if line.strip() and not line.startswith('#'))
+    if args.select_kind or args.select_namespace is not None or args.select_label:
+        labels = {}
+        for predicate in args.select_label or []:
+            key, sep, value = predicate.partition('=')
+            labels[key] = value if sep else None
+        seeds.extend(extractor.select_nodes(args.select_kind, args.select_namespace, labels))
+    return list(dict.fromkeys(seeds))  # de-duplicate, keep order
+
 def main():
     parser = argparse.ArgumentParser(description='Extract subgraph from K8s topology')
     parser.add_argument('--topology', required=True,
                       help='Input JSON file containing topology data')
-    parser.add_argument('--output', required=True,
+    parser.add_argument('--output',
                       help='Output JSON file for subgraph')
     parser.add_argument('--node-id',
                       help='Node ID to extract subgraph from')
@@ -142,8 +400,30 @@ def main():
                       help='Name of resource to find')
     parser.add_argument('--namespace',
                       help='Namespace of resource')
+    parser.add_argument('--depth', type=int,
+                      help='Maximum hops to follow towards the root and the leaves (default: unlimited)')
+
+    batch = parser.add_argument_group('batch mode', 'Extract one subgraph per seed into --output-dir')
+    batch.add_argument('--output-dir',
+                       help='Directory for per-seed subgraphs (<node_id>.json) and index.json')
+    batch.add_argument('--seeds', nargs='+',
+                       help='Seed node IDs')
+    batch.add_argument('--seeds-file',
+                       help='File with one seed node ID per line')
+    batch.add_argument('--select-kind',
+                       help='Use every node of this kind as a seed')
+    batch.add_argument('--select-namespace',
+                       help='Restrict selected seeds to this namespace')
+    batch.add_argument('--select-label', action='append',
+                       help='Restrict selected seeds by label (key=value or key); repeatable')
+    batch.add_argument('--workers', type=int, default=1,
+                       help='Number of worker processes (default: 1, in-process)')
+    parser.add_argument('--log-level', default='DEBUG',
+                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help='Logging level (default: DEBUG)')
     
     args = parser.parse_args()
+    logging.basicConfig(level=args.log_level)
     
     try:
         # Load topology data
@@ -151,6 +431,19 @@ def main():
             topology_data = json.load(f)
             
         extractor = SubgraphExtractor(topology_data)
+
+        if args.output_dir:
+            seeds = _batch_seeds(args, extractor)
+            if not seeds:
+                raise ValueError("Batch mode needs --seeds, --seeds-file or a --select-* selector")
+            manifest = extract_batch(extractor, seeds, args.output_dir, depth=args.depth,
+                                     workers=args.workers, topology_file=args.topology,
+                                     log_level=args.log_level)
+            if any('error' in entry for entry in manifest.values()):
+                sys.exit(1)
+            return
+        if not args.output:
+            raise ValueError("Must provide --output (or --output-dir for batch mode)")
         
         # Find node ID if not provided directly
         node_id = args.node_id
@@ -168,7 +461,7 @@ def main():
             node_id = extractor.find_node_by_attributes(**search_attrs)
             
         # Extract and save subgraph
-        subgraph = extractor.extract_subgraph(node_id)
+        subgraph = extractor.extract_subgraph(node_id, depth=args.depth)
         
         with open(args.output, 'w') as f:
             json.dump(subgraph, f, indent=2)
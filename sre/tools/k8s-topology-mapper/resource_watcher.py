@@ -4,10 +4,11 @@ import logging
 import threading
 import queue
 import time
-from typing import Optional, Dict, Any, List
-from kubernetes.client.rest import ApiException
+from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime, timedelta
 from event_manager import EventLogger
+from event_pipeline import RELIST, EventCoalescer, PriorityEventQueue
+from watch_mux import WatchMultiplexer
 import sys
 
 def LINE():
@@ -23,33 +24,53 @@ CLUSTER_SCOPED_RESOURCES = {
 
 class K8sResourceWatcher:
     """
-    Watches resources in the cluster and queues events for processing,
-    then processes them in batches to reduce lock contention and overhead.
+    Watches resources in the cluster and queues events for processing.
+    Each event is applied to the topology graph incrementally, with a periodic
+    full refresh as a consistency check.
     Also includes stable node ID, UID, and owner info in each event log.
     """
 
-    def __init__(self, k8s_client, topology_manager, event_logger):
+    def __init__(self, k8s_client, topology_manager, event_logger,
+                 watch_threads: int = 4, watch_start_rate: float = 20.0,
+                 coalesce_window: float = 0.5, queue_size: int = 10000,
+                 overflow_policy: str = "coalesce"):
         self.logger = logging.getLogger("resource_watcher")
         self.k8s_client = k8s_client
         self.topology = topology_manager
         self.event_logger = event_logger
         
-        self.watch_threads: Dict[str, threading.Thread] = {}
-        self.resource_versions: Dict[str, str] = {}
+        # All watch streams share a few event loop threads; new streams are
+        # opened at most `watch_start_rate` per second
+        self.watch_mux = WatchMultiplexer(
+            k8s_client,
+            on_event=self._queue_event,
+            list_version=self._list_resource_version,
+            num_threads=watch_threads,
+            start_rate=watch_start_rate
+        )
 
         self.stop_event = threading.Event()
         
-        # Bounded queue to prevent unbounded growth
-        self.event_queue = queue.Queue(maxsize=10000)
+        # Bounded queue to prevent unbounded growth. Structural kinds are
+        # processed first; `overflow_policy` decides what gives when it is full
+        self.event_queue = PriorityEventQueue(maxsize=queue_size, policy=overflow_policy)
         
         self.processor_thread = None
+        self.resync_thread = None
+
+        # Events for the same object arriving within this many seconds are
+        # collapsed to its latest state before logging and graph updates
+        self.coalesce_window = coalesce_window
+        self.MAX_BATCH = 5000
+        self.events_processed = 0
         
-        # Tuning parameters for batch refresh:
-        self.REFRESH_EVENT_COUNT = 100   # e.g., refresh after 100 relevant events
-        self.REFRESH_TIME_LIMIT = 30.0   # or 30 seconds
+        # Full refresh interval (seconds) used as a consistency check on top of
+        # the incremental per-event graph updates. Refreshes run on their own
+        # thread; events applied meanwhile are replayed onto the new generation
+        self.RESYNC_INTERVAL = 600.0
 
     def start(self):
-        """Start the watch threads and event processor."""
+        """Start the watch streams, the event processor and the resync timer."""
         self.stop_event.clear()
         
         # Start consumer thread to process queued events
@@ -59,14 +80,25 @@ class K8sResourceWatcher:
             name="event-processor"
         )
         self.processor_thread.start()
+
+        self.resync_thread = threading.Thread(
+            target=self._resync_loop,
+            daemon=True,
+            name="topology-resync"
+        )
+        self.resync_thread.start()
         
         # Start watches for each resource type
+        self.watch_mux.start()
         self._start_resource_watches()
 
     def stop(self):
-        """Stop all watch threads and gracefully shut down the processor."""
+        """Stop all watch streams and gracefully shut down the processor."""
         self.logger.info("Stopping resource watcher...")
         self.stop_event.set()
+
+        # Stop the watch loops first so nothing is queued after the sentinel
+        self.watch_mux.stop()
         
         # Put sentinel in the queue so _process_events will exit
         self.event_queue.put(None)
@@ -74,10 +106,8 @@ class K8sResourceWatcher:
         # Join the processor thread
         if self.processor_thread:
             self.processor_thread.join(timeout=5)
-
-        # Then stop each watch thread
-        for thread in self.watch_threads.values():
-            thread.join()
+        if self.resync_thread:
+            self.resync_thread.join(timeout=5)
 
         # (Optional) final refresh to capture last changes
         try:
@@ -89,88 +119,80 @@ class K8sResourceWatcher:
         self.logger.info("Resource watcher stopped.")
 
     def _start_resource_watches(self):
-        """Start watch threads for all supported resources."""
+        """Register watches for all supported resources; the multiplexer opens them concurrently."""
         core_resources = {
             'Pod', 'Service', 'ConfigMap', 'Secret', 'PersistentVolumeClaim',
             'PersistentVolume', 'Node', 'Namespace', 'ServiceAccount', 'Endpoints'
         }
         
-        # Start core resources first
+        # Core resources are queued first
         for kind in core_resources:
-            self._start_watch("v1", kind)
-            time.sleep(0.5)  # small delay to avoid spamming the API
+            self.watch_mux.add("v1", kind)
             
         # Then watch API group resources
         for api_version, kind in self.k8s_client.get_api_resources():
             if kind not in core_resources:
-                self._start_watch(api_version, kind)
-                time.sleep(0.5)
+                self.watch_mux.add(api_version, kind)
+        self.logger.info(f"Registered {len(self.watch_mux.streams)} watches")
 
-    def _start_watch(self, api_version: str, kind: str):
-        """Start a watch thread for a specific resource type."""
-        watch_key = f"{api_version}/{kind}"
-        
-        # Avoid duplicates
-        if watch_key in self.watch_threads:
-            if self.watch_threads[watch_key].is_alive():
-                return
-            else:
-                self.logger.info(f"Restarting dead watch thread for {kind}")
-                
-        self.logger.info(f"Starting watch for {kind}")
-        thread = threading.Thread(
-            target=self._watch_resource,
-            args=(api_version, kind),
-            name=f"watch-{kind.lower()}",
-            daemon=True
-        )
-        thread.start()
-        self.watch_threads[watch_key] = thread
+    @property
+    def resource_versions(self) -> Dict[str, str]:
+        """Latest resourceVersion per watched kind; reconnecting watches resume from it."""
+        return self.watch_mux.resource_versions()
 
-    def _watch_resource(self, api_version: str, kind: str):
-        """Watch a specific resource type and queue events."""
-        try:
-            resource = self.k8s_client.dynamic_client.resources.get(
-                api_version=api_version,
-                kind=kind
-            )
-            if not hasattr(resource, 'watch') or 'watch' not in resource.verbs:
-                self.logger.debug(f"Resource {kind} does not support watch operation")
-                return
+    def _list_resource_version(self, resource) -> str:
+        """
+        LIST a kind for a watch without a stored resourceVersion (first start and
+        after a 410) and return the LIST's resourceVersion. The listed objects are
+        queued as one RELIST event, so the processor reconciles the kind with them
+        in order with the events queued before: whatever changed while the kind
+        was not watched (or since the last refresh) is applied, not lost.
+        """
+        api_version, kind = resource.group_version, resource.kind
+        list_info = {}
+        items = list(self.k8s_client.iter_resources(api_version, kind, list_info=list_info,
+                                                    resource=resource))
+        if not list_info.get('resourceVersion'):
+            raise RuntimeError(f"LIST of {kind} returned no resourceVersion")
+        self._put_event({
+            'type': RELIST,
+            'api_version': api_version,
+            'kind': kind,
+            'object': None,
+            'items': items
+        })
+        return list_info['resourceVersion']
 
-            while not self.stop_event.is_set():
-                try:
-                    list_response = resource.get()
-                    resource_version = list_response.metadata.resourceVersion
-                    
-                    watch_iter = resource.watch(resource_version=resource_version)
-                    start_time = time.time()
-                    for event in watch_iter:
-                        if self.stop_event.is_set() or (time.time() - start_time > 3600):
-                            break
-                        
-                        event_type = event['type']
-                        obj = event['object']
-                        
-                        # If queue is full, this blocks
-                        self.event_queue.put({
-                            'type': event_type,
-                            'api_version': api_version,
-                            'kind': kind,
-                            'object': obj
-                        })
-
-                except ApiException as e:
-                    if e.status == 410:  # resourceVersion too old
-                        continue
-                    self.logger.error(f"API error watching {kind}: {str(e)}")
-                    time.sleep(5)
-                except Exception as e:
-                    self.logger.error(f"Error watching {kind}: {str(e)}", exc_info=True)
-                    time.sleep(5)
+    def _queue_event(self, api_version: str, kind: str, event_type: str, obj):
+        """Called from the watch loops for every watch event."""
+        self._put_event({
+            'type': event_type,
+            'api_version': api_version,
+            'kind': kind,
+            'object': obj
+        })
 
-        except Exception as e:
-            self.logger.error(f"Error setting up watch for {kind}: {e}", exc_info=True)
+    def _put_event(self, event: Dict[str, Any]):
+        # Only the "block" overflow policy can make this wait, and never past
+        # a stop request
+        while not self.stop_event.is_set():
+            try:
+                self.event_queue.put(event, timeout=1.0)
+                return
+            except queue.Full:
+                continue
+
+    def metrics(self) -> Dict[str, Any]:
+        """Watch and event pipeline counters, for the /metrics endpoint."""
+        return {
+            'watches': {
+                'registered': len(self.watch_mux.streams),
+                'active': self.watch_mux.active_streams(),
+                'resource_versions': len(self.resource_versions),
+            },
+            'event_queue': self.event_queue.metrics(),
+            'events_processed': self.events_processed,
+        }
 
     def _get_resource_info(self, obj) -> Dict[str, Any]:
         """
@@ -215,63 +237,143 @@ class K8sResourceWatcher:
 
     def _process_events(self):
         """
-        Main loop: pop events from the queue, log them (with ID/UID/owners),
-        and occasionally refresh topology. 
+        Main loop: pop events from the queue, coalesce bursts per object, log the
+        coalesced events (with ID/UID/owners), patch the topology graph for each
+        one, and publish a new read view per batch.
         """
         self.logger.info("Event processing thread started.")
 
-        last_refresh_time = time.time()
-        events_since_last_refresh = 0
-
         while True:
             # If stop requested AND queue is empty, exit
             if self.stop_event.is_set() and self.event_queue.empty():
                 break
 
+            events, received, stopping = self._next_batch()
+            self.events_processed += len(events)
             try:
-                event = self.event_queue.get(timeout=1.0)
-            except queue.Empty:
-                continue
-            
-            if event is None:
+                if received > len(events) and self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug(f"Coalesced {received} watch events into {len(events)}")
+                for event in events:
+                    self._handle_event(event)
+                if events:
+                    # One new read view per batch, however many events it held
+                    self._publish_view()
+                elif not received:
+                    # Nothing pending: the published view is still current
+                    self.topology.mark_synced()
+            finally:
+                for _ in range(received):
+                    self.event_queue.task_done()
+
+            if stopping:
                 # Sentinel for shutdown
                 break
 
+        self.logger.info("Event processing thread exiting.")
+
+    def _next_batch(self) -> Tuple[List[Dict[str, Any]], int, bool]:
+        """
+        Wait for an event, then keep collecting for COALESCE_WINDOW seconds, plus
+        whatever is already queued (up to MAX_BATCH events), and coalesce them per
+        object. A RELIST ends the batch (it is processed after everything before it).
+        Returns (coalesced events, raw events taken off the queue, whether
+        the shutdown sentinel was seen).
+        """
+        try:
+            event = self.event_queue.get(timeout=1.0)
+        except queue.Empty:
+            return [], 0, False
+        if event is None:
+            return [], 1, True
+        if event['type'] == RELIST:
+            return [event], 1, False
+
+        coalescer = EventCoalescer()
+        coalescer.add(event)
+        deadline = time.monotonic() + self.coalesce_window
+        received = 1
+        while received < self.MAX_BATCH:
+            remaining = deadline - time.monotonic()
             try:
-                # Build resource_info dict with ID, UID, owners
-                resource_info = self._get_resource_info(event['object'])
+                if remaining > 0:
+                    event = self.event_queue.get(timeout=remaining)
+                else:
+                    event = self.event_queue.get_nowait()
+            except queue.Empty:
+                break
+            received += 1
+            if event is None:
+                return coalescer.drain(), received, True
+            if event['type'] == RELIST:
+                # Nothing is coalesced across a RELIST; it ends the batch
+                return coalescer.drain() + [event], received, False
+            coalescer.add(event)
+        return coalescer.drain(), received, False
+
+    def _handle_event(self, event: Dict[str, Any]):
+        """Log a (coalesced) event and apply it to the graph."""
+        if event['type'] == RELIST:
+            self._reconcile(event)
+            return
+        try:
+            # Build resource_info dict with ID, UID, owners
+            resource_info = self._get_resource_info(event['object'])
 
-                # For the event logger "owner_info", we can pass the first owner (if any)
-                # You could also pass the entire list if needed by your design
-                owner_info = resource_info['owners'][0] if resource_info['owners'] else None
+            # For the event logger "owner_info", we can pass the first owner (if any)
+            # You could also pass the entire list if needed by your design
+            owner_info = resource_info['owners'][0] if resource_info['owners'] else None
 
-                # Record the event
-                self.event_logger.record_event(
+            # Record the event
+            coalesced = event.get('coalesced', 1)
+            self.event_logger.record_event(
+                event['type'],
+                resource_info,
+                owner_info=owner_info,
+                additional_data={'coalesced_events': coalesced} if coalesced > 1 else None
+            )
+
+            # Apply relevant events directly to the graph
+            if event['type'] in ('ADDED', 'MODIFIED', 'DELETED'):
+                self.topology.apply_event(
                     event['type'],
-                    resource_info,
-                    owner_info=owner_info
+                    event['api_version'],
+                    event['kind'],
+                    event['object']
                 )
 
-                # If relevant event, schedule a topology refresh
-                if event['type'] in ('ADDED', 'MODIFIED', 'DELETED'):
-                    events_since_last_refresh += 1
-
-                    now = time.time()
-                    elapsed = now - last_refresh_time
-                    if (events_since_last_refresh >= self.REFRESH_EVENT_COUNT) or \
-                       (elapsed >= self.REFRESH_TIME_LIMIT):
-                        # Perform one refresh
-                        self.logger.debug(f"Triggering refresh_topology() after "
-                                          f"{events_since_last_refresh} events or {int(elapsed)}s elapsed.")
-                        self.topology.refresh_topology()
-                        
-                        # Reset counters
-                        last_refresh_time = now
-                        events_since_last_refresh = 0
-
-            except Exception as e:
-                self.logger.error(f"Error processing event: {e}", exc_info=True)
-            finally:
-                self.event_queue.task_done()
+        except Exception as e:
+            self.logger.error(f"Error processing event: {e}", exc_info=True)
+
+    def _reconcile(self, event: Dict[str, Any]):
+        """Apply a RELIST: reconcile the graph's objects of one kind with the listed ones."""
+        try:
+            applied, deleted = self.topology.reconcile_kind(event['api_version'], event['kind'],
+                                                            event['items'])
+            if applied or deleted:
+                self.logger.info(f"Relisted {event['kind']}: {applied} objects applied, {deleted} deleted")
+        except Exception as e:
+            self.logger.error(f"Error reconciling relisted {event['kind']}: {e}", exc_info=True)
+
+    def _publish_view(self):
+        try:
+            self.topology.publish_view()
+        except Exception as e:
+            self.logger.error(f"Error publishing topology view: {e}", exc_info=True)
 
-        self.logger.info("Event processing thread exiting.")
\ No newline at end of file
+    def _resync_loop(self):
+        """
+        Run a full topology refresh every RESYNC_INTERVAL seconds, off the event
+        processor, which keeps applying events meanwhile. A topology loaded from a
+        snapshot has no base to patch events onto, so it is rebuilt right away.
+        """
+        if self.topology.needs_rebuild():
+            self._resync("rebuilding the topology loaded from a snapshot")
+        while not self.stop_event.wait(self.RESYNC_INTERVAL):
+            self._resync(f"consistency refresh after {int(self.RESYNC_INTERVAL)}s")
+
+    def _resync(self, reason: str):
+        try:
+            self.logger.debug(f"Triggering refresh_topology(): {reason}.")
+            self.topology.refresh_topology()
+        except Exception as e:
+            self.logger.error(f"Error during consistency refresh: {e}", exc_info=True)
@@ -0,0 +1,321 @@
+# snapshot_format.py
+
+"""
+Compact binary topology snapshots.
+
+Layout (all integers little-endian):
+
+    header   MAGIC (8 bytes) | format version (uint16) | codec (uint8)
+    payload  compressed with the codec:
+        metadata      uint32 length + UTF-8 JSON
+        string table  uint32 count + uint32[count] byte lengths + UTF-8 blob
+        nodes         uint32 count + uint32[count] node ID strings
+                      + attribute columns
+        edges         uint32 count + uint32[count] source strings
+                      + uint32[count] target strings + attribute columns
+        node cache    uint32 count + uint32[count] keys + uint32[count] values
+
+Attribute columns are sparse: uint32 column count, then per column the key
+string, a uint32 row count, uint32[rows] row positions and uint32[rows] values.
+A value is a string-table index. If VALUE_JSON is set, the string holds the
+JSON encoding of a non-string value (numbers, labels dicts, edge type lists).
+Every string is interned once, so repeated kinds, namespaces, IDs and labels
+cost four bytes per use.
+"""
+
+import argparse
+import gzip
+import json
+import os
+import struct
+import sys
+from array import array
+from itertools import accumulate, chain
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import networkx as nx
+
+try:
+    import zstandard
+except ImportError:  # optional; gzip is used instead
+    zstandard = None
+
+MAGIC = b"K8STOPO\x00"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sHB")
+
+CODEC_NONE = 0
+CODEC_GZIP = 1
+CODEC_ZSTD = 2
+CODEC_NAMES = {CODEC_NONE: "none", CODEC_GZIP: "gzip", CODEC_ZSTD: "zstd"}
+
+VALUE_JSON = 0x80000000
+
+SNAPSHOT_SUFFIX = ".snap"
+
+# Element types whose (type, value) pairs identify their JSON text; floats are left
+# out since -0.0 == 0.0 (and nan != nan) would break container dedupe
+_DEDUPE_TYPES = frozenset((str, int, bool, type(None)))
+
+def default_codec() -> int:
+    return CODEC_ZSTD if zstandard is not None else CODEC_GZIP
+
+def is_binary_snapshot(path) -> bool:
+    """True if the file starts with the binary snapshot magic."""
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+class _StringTable:
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.strings: List[str] = []
+        # Flat containers (labels, edge type lists) seen before, by content
+        self._containers: Dict[Tuple, int] = {}
+
+    def add(self, value: str) -> int:
+        idx = self.index.get(value)
+        if idx is None:
+            idx = self.index[value] = len(self.strings)
+            self.strings.append(value)
+        return idx
+
+    def add_value(self, value: Any) -> int:
+        if isinstance(value, str):
+            return self.add(value)
+        key = None
+        if isinstance(value, (dict, list, tuple)):
+            elements = tuple(chain.from_iterable(value.items()) if isinstance(value, dict) else value)
+            types = tuple(map(type, elements))
+            # Element types are part of the key: [1], [True] and [1.0] compare equal
+            if _DEDUPE_TYPES.issuperset(types):
+                key = (type(value), elements, types)
+                idx = self._containers.get(key)
+                if idx is not None:
+                    return idx
+        idx = self.add(json.dumps(value, separators=(',', ':'), default=str)) | VALUE_JSON
+        if key is not None:
+            self._containers[key] = idx
+        return idx
+
+def _uint32_array(values: Iterable[int]) -> bytes:
+    arr = array('I', values)
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    return arr.tobytes()
+
+class _Reader:
+    def __init__(self, data: bytes):
+        self.data = memoryview(data)
+        self.offset = 0
+
+    def uint32(self) -> int:
+        (value,) = struct.unpack_from("<I", self.data, self.offset)
+        self.offset += 4
+        return value
+
+    def uint32_array(self, count: int) -> array:
+        arr = array('I')
+        arr.frombytes(self.data[self.offset:self.offset + 4 * count])
+        if sys.byteorder == 'big':
+            arr.byteswap()
+        self.offset += 4 * count
+        return arr
+
+    def raw(self, length: int) -> bytes:
+        value = bytes(self.data[self.offset:self.offset + length])
+        self.offset += length
+        return value
+
+def _encode_columns(out: List[bytes], strings: _StringTable, rows: Iterable[Dict]):
+    columns: Dict[str, Tuple[List[int], List[int]]] = {}
+    index, add_value = strings.index, strings.add_value
+    for position, attrs in enumerate(rows):
+        for key, value in attrs.items():
+            column = columns.get(key)
+            if column is None:
+                column = columns[key] = ([], [])
+            column[0].append(position)
+            # Inlined fast path for the common case of an already interned string
+            idx = index.get(value) if type(value) is str else None
+            column[1].append(idx if idx is not None else add_value(value))
+    out.append(_uint32_array([len(columns)]))
+    for key, (positions, values) in columns.items():
+        out.append(_uint32_array([strings.add(key), len(positions)]))
+        out.append(_uint32_array(positions))
+        out.append(_uint32_array(values))
+
+def _decode_columns(reader: _Reader, strings: List[str], values_of, rows: List[Dict]):
+    """Fill the attribute dicts in `rows` (the graph's own node/edge dicts) column by column."""
+    for _ in range(reader.uint32()):
+        name = strings[reader.uint32()]
+        count = reader.uint32()
+        positions = reader.uint32_array(count)
+        values = [strings[v] if v < VALUE_JSON else values_of(v)
+                  for v in reader.uint32_array(count)]
+        if count == len(rows):  # dense column, positions are 0..count-1
+            for row, value in zip(rows, values):
+                row[name] = value
+        else:
+            for position, value in zip(positions, values):
+                rows[position][name] = value
+
+def encode_snapshot(graph: nx.DiGraph, node_cache: Optional[Dict[str, str]] = None,
+                    metadata: Optional[Dict] = None, codec: Optional[int] = None) -> bytes:
+    """Encode a graph (plus node cache and metadata) into the binary snapshot format."""
+    codec = default_codec() if codec is None else codec
+    node_cache = node_cache or {}
+    strings = _StringTable()
+    body: List[bytes] = []
+
+    node_ids = list(graph.nodes)
+    body.append(_uint32_array([len(node_ids)]))
+    body.append(_uint32_array(strings.add(node_id) for node_id in node_ids))
+    _encode_columns(body, strings, (attrs for _, attrs in graph.nodes(data=True)))
+
+    edges = list(graph.edges(data=True))
+    body.append(_uint32_array([len(edges)]))
+    body.append(_uint32_array(strings.add(source) for source, _, _ in edges))
+    body.append(_uint32_array(strings.add(target) for _, target, _ in edges))
+    _encode_columns(body, strings, (attrs for _, _, attrs in edges))
+
+    body.append(_uint32_array([len(node_cache)]))
+    body.append(_uint32_array(strings.add(key) for key in node_cache))
+    body.append(_uint32_array(strings.add(value) for value in node_cache.values()))
+
+    meta = json.dumps(metadata or {}).encode('utf-8')
+    encoded = [s.encode('utf-8') for s in strings.strings]
+    payload = b"".join([
+        _uint32_array([len(meta)]), meta,
+        _uint32_array([len(encoded)]), _uint32_array(len(s) for s in encoded), b"".join(encoded),
+        *body
+    ])
+    return HEADER.pack(MAGIC, FORMAT_VERSION, codec) + _compress(payload, codec)
+
+def decode_snapshot(data: bytes) -> Tuple[nx.DiGraph, Dict[str, str], Dict]:
+    """Decode a binary snapshot into (graph, node_cache, metadata)."""
+    magic, version, codec = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a binary topology snapshot")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format version {version}")
+    reader = _Reader(_decompress(data[HEADER.size:], codec))
+
+    metadata = json.loads(reader.raw(reader.uint32()))
+    count = reader.uint32()
+    lengths = reader.uint32_array(count)
+    blob = reader.raw(sum(lengths))
+    bounds = list(accumulate(lengths, initial=0))
+    text = blob.decode('utf-8')
+    if len(text) == len(blob):  # ASCII only: byte offsets are character offsets
+        strings = [text[start:end] for start, end in zip(bounds, bounds[1:])]
+    else:
+        strings = [blob[start:end].decode('utf-8') for start, end in zip(bounds, bounds[1:])]
+
+    parsed: Dict[int, Any] = {}
+
+    def values_of(idx: int) -> Any:
+        value = parsed.get(idx)
+        if value is None:
+            value = parsed[idx] = json.loads(strings[idx & ~VALUE_JSON])
+        # Containers (labels, edge type lists) are flat; copy them so rows never share one
+        if isinstance(value, dict):
+            return dict(value)
+        if isinstance(value, list):
+            return list(value)
+        return value
+
+    graph = nx.DiGraph()
+    node_ids = [strings[i] for i in reader.uint32_array(reader.uint32())]
+    graph.add_nodes_from(node_ids)
+    _decode_columns(reader, strings, values_of, [graph.nodes[n] for n in node_ids])
+
+    edge_count = reader.uint32()
+    edges = list(zip([strings[i] for i in reader.uint32_array(edge_count)],
+                     [strings[i] for i in reader.uint32_array(edge_count)]))
+    graph.add_edges_from(edges)
+    _decode_columns(reader, strings, values_of, [graph.succ[s][t] for s, t in edges])
+
+    cache_count = reader.uint32()
+    keys = reader.uint32_array(cache_count)
+    values = reader.uint32_array(cache_count)
+    node_cache = {strings[k]: strings[v] for k, v in zip(keys, values)}
+    return graph, node_cache, metadata
+
+def atomic_write(path, data: bytes):
+    """
+    Write `data` to `path` through an fsynced temporary file that is renamed into place,
+    so readers see either the previous file or the complete new one, even after a crash.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    try:
+        # Persist the rename itself
+        dir_fd = os.open(path.parent, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    except OSError:
+        pass  # directories can't be opened/fsynced on every platform
+
+def write_snapshot(path, graph: nx.DiGraph, node_cache: Optional[Dict[str, str]] = None,
+                   metadata: Optional[Dict] = None, codec: Optional[int] = None):
+    atomic_write(path, encode_snapshot(graph, node_cache, metadata, codec))
+
+def read_snapshot(path) -> Tuple[nx.DiGraph, Dict[str, str], Dict]:
+    with open(path, 'rb') as f:
+        return decode_snapshot(f.read())
+
+def to_json_dict(graph: nx.DiGraph, node_cache: Optional[Dict[str, str]] = None,
+                 metadata: Optional[Dict] = None) -> Dict:
+    """The JSON snapshot layout consumed by topology_analyzer, path_finder and taxonomy_creator."""
+    return {
+        'nodes': [{'id': node_id, 'attributes': dict(attrs)}
+                  for node_id, attrs in graph.nodes(data=True)],
+        'edges': [{'source': source, 'target': target, 'attributes': dict(attrs)}
+                  for source, target, attrs in graph.edges(data=True)],
+        'node_cache': dict(node_cache or {}),
+        'metadata': dict(metadata or {})
+    }
+
+def export_json(snapshot_path, output_path):
+    """Convert a binary snapshot into a JSON file for the offline tools."""
+    graph, node_cache, metadata = read_snapshot(snapshot_path)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(to_json_dict(graph, node_cache, metadata), f, indent=2, default=str)
+
+def _compress(payload: bytes, codec: int) -> bytes:
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstd snapshots require the 'zstandard' package")
+        return zstandard.ZstdCompressor(level=3).compress(payload)
+    if codec == CODEC_GZIP:
+        return gzip.compress(payload, compresslevel=5)
+    return payload
+
+def _decompress(payload: bytes, codec: int) -> bytes:
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstd snapshots require the 'zstandard' package")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    if codec == CODEC_GZIP:
+        return gzip.decompress(payload)
+    if codec == CODEC_NONE:
+        return payload
+    raise ValueError(f"Unknown snapshot codec {codec}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert binary topology snapshots to JSON')
+    parser.add_argument('snapshot', help='Binary snapshot file (*.snap)')
+    parser.add_argument('output', help='Output JSON file')
+    args = parser.parse_args()
+    export_json(args.snapshot, args.output)
+
+if __name__ == "__main__":
+    main()
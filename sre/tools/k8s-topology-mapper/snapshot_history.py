@@ -0,0 +1,396 @@
+# snapshot_history.py
+
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from bisect import bisect_right, insort
+from collections import OrderedDict
+from itertools import chain
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+import networkx as nx
+
+from snapshot_format import SNAPSHOT_SUFFIX, read_snapshot, write_snapshot
+
+# Delta record framing: timestamp (float64) + length of the zlib-compressed JSON body
+DELTA_HEADER = struct.Struct("<dI")
+
+CHECKPOINT_PREFIX = "checkpoint_"
+DELTA_PREFIX = "deltas_"
+DELTA_SUFFIX = ".log"
+CATALOG_FILE = "catalog.log"
+
+class CatalogEntry(NamedTuple):
+    """One recorded state: a checkpoint file, or a delta record at `offset` in a segment."""
+    timestamp: float
+    kind: str  # "checkpoint" or "delta"
+    file: str
+    offset: int
+
+def diff_graphs(old: nx.DiGraph, new: nx.DiGraph, nodes: Optional[Iterable] = None) -> Dict:
+    """
+    Changes turning `old` into `new`. Added or updated nodes and edges carry their
+    full attribute dicts; removals only their IDs.
+    Only `nodes` and their out-edges are compared if given, so it must include every
+    node whose attributes or adjacency changed (e.g. a TrackedGraph change set).
+    """
+    old_nodes, new_nodes = old.nodes, new.nodes
+    old_adj, new_adj = old.adj, new.adj
+    if nodes is None:
+        nodes = chain(new_nodes, (n for n in old_nodes if n not in new_nodes))
+    delta = {'nodes_set': {}, 'nodes_removed': [], 'edges_set': [], 'edges_removed': []}
+    for n in nodes:
+        if n in new_nodes:
+            attrs = new_nodes[n]
+            if n not in old_nodes or old_nodes[n] != attrs:
+                delta['nodes_set'][n] = dict(attrs)
+            new_targets = new_adj[n]
+        else:
+            if n in old_nodes:
+                delta['nodes_removed'].append(n)
+            new_targets = {}
+        old_targets = old_adj[n] if n in old_adj else {}
+        for target, attrs in new_targets.items():
+            if target not in old_targets or old_targets[target] != attrs:
+                delta['edges_set'].append([n, target, dict(attrs)])
+        for target in old_targets:
+            if target not in new_targets:
+                delta['edges_removed'].append([n, target])
+    return delta
+
+def delta_is_empty(delta: Dict) -> bool:
+    return not any(delta[key] for key in ('nodes_set', 'nodes_removed', 'edges_set', 'edges_removed'))
+
+def apply_delta(graph: nx.DiGraph, delta: Dict):
+    """Apply a delta produced by diff_graphs to a mutable graph, in place."""
+    for node_id in delta['nodes_removed']:
+        if node_id in graph:
+            graph.remove_node(node_id)
+    for node_id, attrs in delta['nodes_set'].items():
+        if node_id in graph:
+            graph.nodes[node_id].clear()
+        graph.add_node(node_id, **attrs)
+    for source, target in delta['edges_removed']:
+        if graph.has_edge(source, target):
+            graph.remove_edge(source, target)
+    for source, target, attrs in delta['edges_set']:
+        if graph.has_edge(source, target):
+            graph.edges[source, target].clear()
+        graph.add_edge(source, target, **attrs)
+
+def scan_delta_headers(path: Path) -> Iterator[Tuple[float, int]]:
+    """Yield (timestamp, offset) of each complete delta record without decoding bodies."""
+    size = path.stat().st_size
+    offset = 0
+    with open(path, 'rb') as f:
+        while offset + DELTA_HEADER.size <= size:
+            f.seek(offset)
+            timestamp, length = DELTA_HEADER.unpack(f.read(DELTA_HEADER.size))
+            if offset + DELTA_HEADER.size + length > size:
+                return
+            yield timestamp, offset
+            offset += DELTA_HEADER.size + length
+
+def read_deltas(path: Path, offset: int = 0) -> Iterator[Tuple[float, int, Dict]]:
+    """
+    Yield (timestamp, offset, delta) for each record of a delta log, starting at byte
+    `offset`. A truncated trailing record (e.g. after a crash mid-append) ends the log.
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while True:
+            header = f.read(DELTA_HEADER.size)
+            if len(header) < DELTA_HEADER.size:
+                return
+            timestamp, length = DELTA_HEADER.unpack(header)
+            body = f.read(length)
+            if len(body) < length:
+                return
+            yield timestamp, offset, json.loads(zlib.decompress(body))
+            offset += DELTA_HEADER.size + length
+
+class SnapshotHistory:
+    """
+    Topology history as periodic full checkpoints plus an append-only delta log.
+      - record() diffs the given graph against the previously recorded one and appends
+        the changes to the current delta segment; given the IDs of the nodes changed
+        since then, only those are compared.
+      - Every `checkpoint_interval` seconds a full binary checkpoint is written instead
+        and a new segment is started; segment and checkpoint share a timestamp
+        (deltas_<ms>.log belongs to checkpoint_<ms>.snap).
+      - Checkpoints (with their segments) older than `retention` seconds are removed,
+        as long as a newer checkpoint still covers the retention window.
+      - A catalog (catalog.log, one JSON line per record) maps every recorded timestamp
+        to its checkpoint file or segment offset. It is kept sorted in memory, so finding
+        the state for a time is a bisect; it is rebuilt from the file headers if missing.
+      - Files are written outside `_lock`, which only guards the catalog; readers pin the
+        files they replay so prune() leaves them in place until the read finishes.
+    The graphs handed to record() must not be mutated afterwards (e.g. topology views).
+    """
+    MAX_CACHED_STATES = 4
+
+    def __init__(self, directory: str, checkpoint_interval: float = 3600.0,
+                 retention: float = 3 * 24 * 3600.0):
+        self.logger = logging.getLogger("snapshot_history")
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.checkpoint_interval = checkpoint_interval
+        self.retention = retention
+        self._lock = threading.Lock()
+        # Serializes record() so the baseline and current segment are written by one caller
+        self._write_lock = threading.Lock()
+        # Files currently being read by graph_at(), with their reader count (under _lock)
+        self._readers: Dict[str, int] = {}
+        self._baseline: Optional[nx.DiGraph] = None
+        self._segment: Optional[Path] = None
+        self._checkpoint_time = 0.0
+        self._catalog: List[CatalogEntry] = []
+        self._catalog_times: List[float] = []
+        # Recently reconstructed (frozen) graphs by catalog entry, for view_at()
+        self._states: "OrderedDict[CatalogEntry, Tuple[nx.DiGraph, Dict[str, str]]]" = OrderedDict()
+        self._load_catalog()
+
+    def record(self, graph: nx.DiGraph, node_cache: Optional[Dict[str, str]] = None,
+               timestamp: Optional[float] = None, changed: Optional[Set] = None) -> str:
+        """
+        Persist the state of `graph` at `timestamp`. `changed` holds the nodes changed
+        since the graph last passed to record() (None to compare the whole graph).
+        Returns "checkpoint", "delta", or "unchanged" if nothing changed since the last record.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._write_lock:
+            if self._baseline is None or timestamp - self._checkpoint_time >= self.checkpoint_interval:
+                entry = self._write_checkpoint(graph, node_cache, timestamp)
+                kind = "checkpoint"
+            else:
+                delta = diff_graphs(self._baseline, graph, changed)
+                if delta_is_empty(delta):
+                    return "unchanged"
+                entry = self._append_delta(delta, timestamp)
+                kind = "delta"
+            self._baseline = graph
+            with self._lock:
+                self._add_to_catalog(entry)
+        if kind == "checkpoint":
+            self.prune(timestamp)
+        return kind
+
+    def _write_checkpoint(self, graph: nx.DiGraph, node_cache: Optional[Dict[str, str]],
+                          timestamp: float) -> CatalogEntry:
+        stamp = int(timestamp * 1000)
+        path = self.directory / f"{CHECKPOINT_PREFIX}{stamp}{SNAPSHOT_SUFFIX}"
+        write_snapshot(path, graph, node_cache, {'timestamp': timestamp, 'version': '2.0'})
+        self._segment = self.directory / f"{DELTA_PREFIX}{stamp}{DELTA_SUFFIX}"
+        self._segment.touch()
+        self._checkpoint_time = timestamp
+        self.logger.info(f"Wrote topology checkpoint {path.name}")
+        return CatalogEntry(timestamp, "checkpoint", path.name, 0)
+
+    def _append_delta(self, delta: Dict, timestamp: float) -> CatalogEntry:
+        body = zlib.compress(json.dumps(delta, separators=(',', ':'), default=str).encode('utf-8'))
+        with open(self._segment, 'ab') as f:
+            offset = f.tell()
+            f.write(DELTA_HEADER.pack(timestamp, len(body)) + body)
+            f.flush()
+            os.fsync(f.fileno())
+        self.logger.debug(f"Appended delta to {self._segment.name}: "
+                          f"{len(delta['nodes_set'])} nodes set, {len(delta['nodes_removed'])} removed, "
+                          f"{len(delta['edges_set'])} edges set, {len(delta['edges_removed'])} removed")
+        return CatalogEntry(timestamp, "delta", self._segment.name, offset)
+
+    def checkpoints(self) -> List[Tuple[float, Path]]:
+        """(timestamp, path) of every checkpoint, oldest first."""
+        result = []
+        for path in self.directory.glob(f"{CHECKPOINT_PREFIX}*{SNAPSHOT_SUFFIX}"):
+            stamp = path.name[len(CHECKPOINT_PREFIX):-len(SNAPSHOT_SUFFIX)]
+            if stamp.isdigit():
+                result.append((int(stamp) / 1000.0, path))
+        return sorted(result)
+
+    def segment_for(self, checkpoint: Path) -> Path:
+        stamp = checkpoint.name[len(CHECKPOINT_PREFIX):-len(SNAPSHOT_SUFFIX)]
+        return self.directory / f"{DELTA_PREFIX}{stamp}{DELTA_SUFFIX}"
+
+    def _add_to_catalog(self, entry: CatalogEntry):
+        """Caller holds _lock."""
+        with open(self.directory / CATALOG_FILE, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(list(entry)) + "\n")
+        insort(self._catalog, entry)
+        self._catalog_times = [e.timestamp for e in self._catalog]
+
+    def _load_catalog(self):
+        catalog_file = self.directory / CATALOG_FILE
+        try:
+            with open(catalog_file, 'r', encoding='utf-8') as f:
+                entries = [CatalogEntry(*json.loads(line)) for line in f if line.strip()]
+        except FileNotFoundError:
+            entries = None
+        except (ValueError, TypeError) as e:
+            self.logger.warning(f"Rebuilding unreadable history catalog {catalog_file}: {e}")
+            entries = None
+        if entries is None:
+            entries = self._scan_catalog()
+            self._write_catalog(entries)
+        self._catalog = sorted(entries)
+        self._catalog_times = [e.timestamp for e in self._catalog]
+
+    def _scan_catalog(self) -> List[CatalogEntry]:
+        """Rebuild catalog entries from checkpoint names and delta record headers."""
+        entries = []
+        for timestamp, checkpoint in self.checkpoints():
+            entries.append(CatalogEntry(timestamp, "checkpoint", checkpoint.name, 0))
+            segment = self.segment_for(checkpoint)
+            if segment.exists():
+                entries.extend(CatalogEntry(delta_time, "delta", segment.name, offset)
+                               for delta_time, offset in scan_delta_headers(segment))
+        return entries
+
+    def _write_catalog(self, entries: List[CatalogEntry]):
+        catalog_file = self.directory / CATALOG_FILE
+        tmp_file = catalog_file.with_name(catalog_file.name + ".tmp")
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps(list(entry)) + "\n" for entry in entries)
+        os.replace(tmp_file, catalog_file)
+
+    def catalog(self) -> List[CatalogEntry]:
+        with self._lock:
+            return list(self._catalog)
+
+    def locate(self, timestamp: Optional[float] = None) -> Optional[Tuple[CatalogEntry, CatalogEntry]]:
+        """
+        (checkpoint entry, state entry) describing the latest recorded state at or before
+        `timestamp` (latest overall if None), or None if nothing was recorded that early.
+        """
+        with self._lock:
+            return self._locate(timestamp)
+
+    def _locate(self, timestamp: Optional[float]) -> Optional[Tuple[CatalogEntry, CatalogEntry]]:
+        """locate() for callers holding _lock."""
+        if timestamp is None:
+            i = len(self._catalog) - 1
+        else:
+            i = bisect_right(self._catalog_times, timestamp) - 1
+        if i < 0:
+            return None
+        state = self._catalog[i]
+        # Walk back to the checkpoint that starts the state's segment
+        segment = self._segment_name_of(state)
+        while i >= 0 and not (self._catalog[i].kind == "checkpoint" and
+                              self._segment_name_of(self._catalog[i]) == segment):
+            i -= 1
+        if i < 0:
+            return None
+        return self._catalog[i], state
+
+    @staticmethod
+    def _segment_name_of(entry: CatalogEntry) -> str:
+        if entry.kind == "delta":
+            return entry.file
+        stamp = entry.file[len(CHECKPOINT_PREFIX):-len(SNAPSHOT_SUFFIX)]
+        return f"{DELTA_PREFIX}{stamp}{DELTA_SUFFIX}"
+
+    def graph_at(self, timestamp: Optional[float] = None) -> Optional[Tuple[nx.DiGraph, Dict[str, str], float]]:
+        """
+        Reconstruct the topology as of `timestamp` (latest if None) from the nearest
+        earlier checkpoint and only the deltas recorded after it. Returns
+        (mutable graph, node_cache, state timestamp) or None if no state is that old.
+        """
+        with self._lock:
+            located = self._locate(timestamp)
+            if located is None:
+                return None
+            checkpoint, state = located
+            # Pin the files so a concurrent prune() cannot delete them mid-replay
+            pinned = {checkpoint.file, state.file}
+            for name in pinned:
+                self._readers[name] = self._readers.get(name, 0) + 1
+        try:
+            graph, node_cache, _ = read_snapshot(self.directory / checkpoint.file)
+            if state.kind == "delta":
+                for _, offset, delta in read_deltas(self.directory / state.file):
+                    if offset > state.offset:
+                        break
+                    apply_delta(graph, delta)
+        finally:
+            with self._lock:
+                for name in pinned:
+                    self._readers[name] -= 1
+                    if not self._readers[name]:
+                        del self._readers[name]
+        return graph, node_cache, state.timestamp
+
+    def view_at(self, timestamp: Optional[float] = None) -> Optional[Tuple[nx.DiGraph, Dict[str, str], float]]:
+        """Like graph_at, but returns a frozen graph shared with other callers (cached)."""
+        located = self.locate(timestamp)
+        if located is None:
+            return None
+        state = located[1]
+        with self._lock:
+            cached = self._states.get(state)
+            if cached is not None:
+                self._states.move_to_end(state)
+                return cached[0], cached[1], state.timestamp
+        graph, node_cache, _ = self.graph_at(state.timestamp)
+        graph = nx.freeze(graph)
+        with self._lock:
+            self._states[state] = (graph, node_cache)
+            while len(self._states) > self.MAX_CACHED_STATES:
+                self._states.popitem(last=False)
+        return graph, node_cache, state.timestamp
+
+    def diff(self, from_time: float, to_time: Optional[float] = None) -> Optional[Dict]:
+        """
+        Changes between the states recorded at `from_time` and `to_time` (latest if None),
+        split into added, updated and removed nodes and edges.
+        """
+        before, after = self.view_at(from_time), self.view_at(to_time)
+        if before is None or after is None:
+            return None
+        old, new = before[0], after[0]
+        delta = diff_graphs(old, new)
+        nodes_set, edges_set = delta['nodes_set'], delta['edges_set']
+        return {
+            'from': before[2],
+            'to': after[2],
+            'nodes_added': {n: a for n, a in nodes_set.items() if n not in old},
+            'nodes_updated': {n: a for n, a in nodes_set.items() if n in old},
+            'nodes_removed': delta['nodes_removed'],
+            'edges_added': [e for e in edges_set if not old.has_edge(e[0], e[1])],
+            'edges_updated': [e for e in edges_set if old.has_edge(e[0], e[1])],
+            'edges_removed': delta['edges_removed']
+        }
+
+    def prune(self, now: Optional[float] = None):
+        """
+        Remove checkpoints and segments no longer needed to cover the retention window.
+        Files pinned by an in-progress graph_at() are kept and retried on the next prune.
+        """
+        cutoff = (time.time() if now is None else now) - self.retention
+        checkpoints = self.checkpoints()
+        expired = []
+        for (_, path), (next_time, _) in zip(checkpoints, checkpoints[1:]):
+            if next_time > cutoff:
+                break
+            expired.append((path, self.segment_for(path)))
+        if not expired:
+            return
+        with self._lock:
+            # Dropped from the catalog first, so no new reader can locate them afterwards
+            expired = [pair for pair in expired if not any(p.name in self._readers for p in pair)]
+            removed = {p.name for pair in expired for p in pair}
+            if removed:
+                self._catalog = [e for e in self._catalog if e.file not in removed]
+                self._catalog_times = [e.timestamp for e in self._catalog]
+                self._write_catalog(self._catalog)
+        for pair in expired:
+            for stale in pair:
+                try:
+                    stale.unlink()
+                except FileNotFoundError:
+                    pass
+            self.logger.debug(f"Removed expired checkpoint {pair[0].name}")
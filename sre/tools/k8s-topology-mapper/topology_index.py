@@ -0,0 +1,106 @@
+# topology_index.py
+
+import ast
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import networkx as nx
+
+def node_labels(attrs: Dict) -> Dict:
+    """Labels of a node; snapshots store them as their string repr."""
+    labels = attrs.get('labels')
+    if isinstance(labels, str):
+        try:
+            labels = ast.literal_eval(labels)
+        except (ValueError, SyntaxError):
+            return {}
+    return labels if isinstance(labels, dict) else {}
+
+class NodeIndex:
+    """
+    Hash indexes over the nodes of a topology graph:
+      - primary: (kind, namespace, name) -> node IDs (normally exactly one)
+      - (kind, name) -> node IDs, for lookups without a namespace
+      - kind -> node IDs and namespace -> node IDs
+      - label key -> node IDs and (label key, value) -> node IDs
+    Namespaces are normalized to "" for cluster-scoped nodes. The index is built
+    once from `graph`; rebuild it if the graph changes.
+    """
+
+    def __init__(self, graph: nx.DiGraph):
+        self.graph = graph
+        self._by_key: Dict[Tuple[str, str, str], List[str]] = defaultdict(list)
+        self._by_kind_name: Dict[Tuple[str, str], List[str]] = defaultdict(list)
+        self._by_kind: Dict[str, Set[str]] = defaultdict(set)
+        self._by_namespace: Dict[str, Set[str]] = defaultdict(set)
+        self._by_label_key: Dict[str, Set[str]] = defaultdict(set)
+        self._by_label: Dict[Tuple[str, str], Set[str]] = defaultdict(set)
+        for node_id, attrs in graph.nodes(data=True):
+            self._add(node_id, attrs)
+
+    def _add(self, node_id: str, attrs: Dict):
+        kind = attrs.get('kind')
+        namespace = attrs.get('namespace') or ""
+        name = attrs.get('name')
+        self._by_key[(kind, namespace, name)].append(node_id)
+        self._by_kind_name[(kind, name)].append(node_id)
+        self._by_kind[kind].add(node_id)
+        self._by_namespace[namespace].add(node_id)
+        for key, value in node_labels(attrs).items():
+            self._by_label_key[key].add(node_id)
+            self._by_label[(key, str(value))].add(node_id)
+
+    def lookup(self, kind: str, name: str, namespace: Optional[str] = None) -> List[str]:
+        """
+        Node IDs for a resource. Without a namespace, any namespace matches (cluster-scoped
+        resources are stored under "").
+        """
+        if namespace is not None:
+            return list(self._by_key.get((kind, namespace, name), ()))
+        return list(self._by_kind_name.get((kind, name), ()))
+
+    def find(self, kind: str, name: str, namespace: Optional[str] = None) -> Optional[str]:
+        """
+        The node ID for a resource, or None if absent. Raises ValueError when the
+        resource is ambiguous (same kind and name in several namespaces).
+        """
+        matches = self.lookup(kind, name, namespace)
+        if len(matches) > 1 and namespace is None:
+            cluster_scoped = self._by_key.get((kind, "", name))
+            if cluster_scoped and len(cluster_scoped) == 1:
+                return cluster_scoped[0]
+            namespaces = sorted(self.graph.nodes[node_id].get('namespace') or "" for node_id in matches)
+            raise ValueError(f"{kind} {name} exists in several namespaces ({', '.join(namespaces)}); "
+                             f"specify a namespace")
+        return matches[0] if matches else None
+
+    def with_label(self, key: str, value: Optional[str] = None) -> Set[str]:
+        """Node IDs carrying label `key` (with `value`, if given)."""
+        if value is None:
+            return set(self._by_label_key.get(key, ()))
+        return set(self._by_label.get((key, str(value)), ()))
+
+    def select(self, kind: Optional[str] = None, namespace: Optional[str] = None,
+               labels: Optional[Dict[str, Optional[str]]] = None) -> List[str]:
+        """
+        Sorted IDs of nodes matching every given predicate. A label value of None
+        only requires the key to be present.
+        """
+        candidates: List[Iterable[str]] = []
+        if kind:
+            candidates.append(self._by_kind.get(kind, ()))
+        if namespace is not None:
+            candidates.append(self._by_namespace.get(namespace, ()))
+        for key, value in (labels or {}).items():
+            if value is None:
+                candidates.append(self._by_label_key.get(key, ()))
+            else:
+                candidates.append(self._by_label.get((key, str(value)), ()))
+        if not candidates:
+            return sorted(self.graph.nodes)
+
+        candidates.sort(key=len)
+        selected = set(candidates[0])
+        for other in candidates[1:]:
+            selected.intersection_update(other)
+        return sorted(selected)
@@ -2,7 +2,7 @@ import networkx as nx
 import json
 import pickle
 import time
-from typing import Optional, Dict, Any, Tuple, List
+from typing import Optional, Dict, Any, Tuple, List, Set, Callable
 import logging
 from pathlib import Path
 import hashlib
@@ -11,12 +11,19 @@ import time
 from typing import Optional
 from kubernetes import client, config
 from openshift.dynamic import DynamicClient
+from kubernetes.dynamic.resource import ResourceInstance
 import logging
 import yaml 
 import os
 import sys
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from types import MappingProxyType
 import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import defaultdict
+from discovery_cache import DiscoveryCache
+from snapshot_format import SNAPSHOT_SUFFIX, atomic_write, is_binary_snapshot, read_snapshot, write_snapshot
+from snapshot_history import SnapshotHistory
 
 def LINE():
     return sys._getframe(1).f_lineno
@@ -32,27 +39,98 @@ CLUSTER_SCOPED_RESOURCES = {
     'PodPreset', 'InitializerConfiguration'
 }
 
-@dataclass
+# Accept header asking the API server for object metadata only
+PARTIAL_METADATA_LIST = 'application/json;as=PartialObjectMetadataList;g=meta.k8s.io;v=v1'
+
+# Shared read-only empty mapping for resources without labels/spec/status
+EMPTY_MAPPING = MappingProxyType({})
+
+@dataclass(frozen=True, slots=True)
 class K8sResource:
-    """Represents a Kubernetes resource with its basic attributes."""
+    """
+    Represents a Kubernetes resource with its basic attributes.
+    Immutable and slotted to keep per-resource memory low; kind, group, version
+    and namespace strings are interned by the collector.
+    """
     group: str
     version: str
     kind: str
     namespace: Optional[str]
     name: str
-    owner_refs: List[Dict[str, Any]]
-    labels: Dict[str, str]
-    spec: Dict[str, Any]
-    status: Dict[str, Any]
-    uid: str = ""  
-     
+    owner_refs: Tuple[Dict[str, Any], ...] = ()
+    labels: Dict[str, str] = field(default_factory=dict)
+    spec: Dict[str, Any] = field(default_factory=lambda: EMPTY_MAPPING)
+    status: Dict[str, Any] = field(default_factory=lambda: EMPTY_MAPPING)
+    uid: str = ""
+
+def make_node_id(kind: str, namespace: Optional[str], name: str) -> str:
+    """Generate a stable graph node ID from the (kind, namespace, name) key alone."""
+    key = f"{kind}:{namespace or ''}:{name}"
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if value else value
+
+# Paths (relative to the object root) that the GraphBuilder edge builders read, per kind.
+# The last path segment becomes the key in the projected spec/status dict.
+# Kinds without an entry keep neither spec nor status.
+FIELD_PROJECTIONS: Dict[str, Dict[str, Tuple[str, ...]]] = {
+    'Pod': {'spec': ('spec.nodeName', 'spec.volumes')},
+    'Service': {'spec': ('spec.selector', 'spec.ports')},
+    'PersistentVolume': {'spec': ('spec.claimRef',)},
+    # Endpoints carry their subsets at the top level, not under spec
+    'Endpoints': {'spec': ('subsets',)},
+}
+
+def register_projection(kind: str, spec: Tuple[str, ...] = (), status: Tuple[str, ...] = ()):
+    """Register the spec/status paths to keep for a kind (replaces any existing entry)."""
+    FIELD_PROJECTIONS[kind] = {'spec': tuple(spec), 'status': tuple(status)}
+
+def project_fields(kind: str, obj) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Extract the registered spec/status paths of a raw object as plain dicts."""
+    projection = FIELD_PROJECTIONS.get(kind)
+    if not projection:
+        return {}, {}
+    return (_extract_paths(obj, projection.get('spec', ())),
+            _extract_paths(obj, projection.get('status', ())))
+
+def _extract_paths(obj, paths: Tuple[str, ...]) -> Dict[str, Any]:
+    extracted = {}
+    for path in paths:
+        value = obj
+        for part in path.split('.'):
+            if value is None:
+                break
+            value = value.get(part) if isinstance(value, dict) else getattr(value, part, None)
+        if value is not None:
+            extracted[path.rsplit('.', 1)[-1]] = _to_plain(value)
+    return extracted
+
+def _to_plain(value):
+    """Convert dynamic-client ResourceFields (and lists of them) to plain Python values."""
+    if hasattr(value, 'to_dict'):
+        return value.to_dict()
+    if isinstance(value, (list, tuple)):
+        return [_to_plain(v) for v in value]
+    return value
+
 class ResourceCollector:
     """Phase 1: Collects all raw Kubernetes resources."""
-    def __init__(self, k8s_client):
+    def __init__(self, k8s_client, max_workers: int = 8,
+                 kind_timeout: Optional[float] = 120.0):
         self.k8s_client = k8s_client
         self.resources: Dict[str, K8sResource] = {}
         self.logger = logging.getLogger("resource_collector")
 
+        # Number of kinds listed concurrently (1 = sequential) and the
+        # per-kind request timeout in seconds (None = no timeout).
+        self.max_workers = max(1, max_workers)
+        self.kind_timeout = kind_timeout
+
+        # Wall-clock seconds spent on each "api_version/kind" in the last collection
+        self.kind_timings: Dict[str, float] = {}
+        self._resources_lock = threading.Lock()
+
     def _make_id(self, group: str, version: str, kind: str, 
                  namespace: Optional[str], name: str) -> str:
         """Create a stable ID for a resource."""
@@ -62,75 +140,452 @@ class ResourceCollector:
     def collect_all_resources(self) -> Dict[str, K8sResource]:
         """
         Query cluster for all resources, store raw data (K8sResource objects).
+        Kinds are listed on a bounded worker pool of `max_workers` threads.
+        Every call starts from an empty map, so deleted objects are not carried over.
         Returns a dictionary: stable_id -> K8sResource
         """
-        for api_version, kind in self.k8s_client.get_api_resources():
-            self._collect_resource_type(api_version, kind)
+        start = time.time()
+        kinds = list(self.k8s_client.get_api_resources())
+        self.resources = {}
+        self.kind_timings = {}
+
+        # Resolve every kind here, so the workers never touch the discoverer
+        resolved = []
+        for api_version, kind in kinds:
+            try:
+                resolved.append((api_version, kind, self.k8s_client.get_resource(api_version, kind)))
+            except Exception as e:
+                self.logger.error(f"Error collecting {kind}: {e}")
+
+        if self.max_workers == 1:
+            for api_version, kind, resource in resolved:
+                self._collect_resource_type(api_version, kind, resource)
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_workers,
+                                    thread_name_prefix="collector") as pool:
+                futures = {
+                    pool.submit(self._collect_resource_type, api_version, kind, resource): kind
+                    for api_version, kind, resource in resolved
+                }
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        self.logger.error(f"Error collecting {futures[future]}: {e}", exc_info=True)
+
+        self._log_kind_timings(time.time() - start)
         return self.resources
+
+    def _log_kind_timings(self, total: float, top_n: int = 5):
+        """Log the overall collection time and the slowest kinds."""
+        slowest = sorted(self.kind_timings.items(), key=lambda kv: kv[1], reverse=True)[:top_n]
+        self.logger.info(
+            f"Collected {len(self.resources)} resources from {len(self.kind_timings)} kinds "
+            f"in {total:.2f}s; slowest: "
+            + ", ".join(f"{key}={elapsed:.2f}s" for key, elapsed in slowest)
+        )
+        for key, elapsed in sorted(self.kind_timings.items()):
+            self.logger.debug(f"Collected {key} in {elapsed:.3f}s")
     
-    def _collect_resource_type(self, api_version: str, kind: str):
+    def _collect_resource_type(self, api_version: str, kind: str, resource=None):
         """Collect all resources of a specific type and store them in self.resources."""
+        start = time.time()
+        collected: Dict[str, K8sResource] = {}
         try:
-            if '/' in api_version:
-                group, version = api_version.split('/')
-            else:
-                group, version = "", api_version
-                
-            resources = self.k8s_client.get_resources(api_version, kind)
+            # Consume items page by page as they arrive from the API server
+            resources = self.k8s_client.iter_resources(api_version, kind,
+                                                       timeout=self.kind_timeout,
+                                                       resource=resource)
             
             for resource in resources:
-                stable_id = self._make_id(
-                    group=group,
-                    version=version,
-                    kind=kind,
-                    namespace=getattr(resource.metadata, 'namespace', None),
-                    name=resource.metadata.name
-                )
-                # Populate UID from metadata
-                uid_val = getattr(resource.metadata, 'uid', "")
-                
-                self.resources[stable_id] = K8sResource(
-                    group=group,
-                    version=version,
-                    kind=kind,
-                    namespace=getattr(resource.metadata, 'namespace', None),
-                    name=resource.metadata.name,
-                    owner_refs=getattr(resource.metadata, 'ownerReferences', []) or [],
-                    labels=getattr(resource.metadata, 'labels', {}) or {},
-                    spec=resource.spec.to_dict() if hasattr(resource, 'spec') and resource.spec else {},
-                    status=resource.status.to_dict() if hasattr(resource, 'status') and resource.status else {},
-                    uid=uid_val
-                )
+                stable_id, k8s_resource = self.to_resource(api_version, kind, resource)
+                collected[stable_id] = k8s_resource
         except Exception as e:
-            self.logger.error(f"Error collecting {kind}: {e}", exc_info=True)
+            if getattr(e, 'status', None) is not None:
+                # API errors (e.g. forbidden kinds) are expected on some clusters
+                self.logger.debug(f"API error collecting {kind}: {e}")
+            else:
+                self.logger.error(f"Error collecting {kind}: {e}", exc_info=True)
+        finally:
+            with self._resources_lock:
+                self.resources.update(collected)
+                self.kind_timings[f"{api_version}/{kind}"] = time.time() - start
+
+    def to_resource(self, api_version: str, kind: str, resource) -> Tuple[str, K8sResource]:
+        """Convert a raw API object (list item or watch event object) to (stable_id, K8sResource)."""
+        if '/' in api_version:
+            group, version = api_version.split('/')
+        else:
+            group, version = "", api_version
+        group, version, kind = _intern(group), _intern(version), sys.intern(kind)
+
+        namespace = _intern(getattr(resource.metadata, 'namespace', None))
+        stable_id = self._make_id(
+            group=group,
+            version=version,
+            kind=kind,
+            namespace=namespace,
+            name=resource.metadata.name
+        )
+        # Keep only the spec/status fields the graph builder needs
+        spec, status = project_fields(kind, resource)
+
+        return stable_id, K8sResource(
+            group=group,
+            version=version,
+            kind=kind,
+            namespace=namespace,
+            name=resource.metadata.name,
+            owner_refs=self._owner_refs(resource),
+            labels=self._labels(resource),
+            spec=spec or EMPTY_MAPPING,
+            status=status or EMPTY_MAPPING,
+            # Populate UID from metadata
+            uid=getattr(resource.metadata, 'uid', "")
+        )
+
+    @staticmethod
+    def _owner_refs(resource) -> Tuple[Dict[str, Any], ...]:
+        """Owner references reduced to the fields used for ownership edges."""
+        refs = getattr(resource.metadata, 'ownerReferences', None) or []
+        return tuple(
+            {
+                'apiVersion': _intern(ref['apiVersion']),
+                'kind': _intern(ref['kind']),
+                'name': ref['name'],
+                'uid': ref['uid']
+            }
+            for ref in refs
+        )
+
+    @staticmethod
+    def _labels(resource) -> Dict[str, str]:
+        """Labels as a plain dict with interned keys and values (they repeat heavily)."""
+        labels = _to_plain(getattr(resource.metadata, 'labels', None)) or {}
+        return {sys.intern(k): sys.intern(str(v)) for k, v in labels.items()}
+
+class LabelIndex:
+    """
+    Per-namespace inverted index from (label key, value) to the graph node IDs of
+    one resource kind. Label selectors are answered by intersecting posting sets
+    instead of scanning every resource.
+    """
+    def __init__(self):
+        self._postings: Dict[Tuple[str, str, str], Set[str]] = defaultdict(set)
+        self._key_postings: Dict[Tuple[str, str], Set[str]] = defaultdict(set)
+        self._by_namespace: Dict[str, Set[str]] = defaultdict(set)
+        self._labels: Dict[str, Tuple[str, Dict[str, str]]] = {}
+
+    @classmethod
+    def build(cls, resources: Dict[str, K8sResource], node_mapping: Dict[str, str],
+              kind: str) -> "LabelIndex":
+        """Index all resources of `kind`, keyed by their graph node IDs."""
+        index = cls()
+        for stable_id, resource in resources.items():
+            if resource.kind == kind:
+                index.add(node_mapping[stable_id], resource.namespace or "", resource.labels)
+        return index
+
+    def add(self, node_id: str, namespace: str, labels: Dict[str, str]):
+        """Add (or re-add) a node to the index."""
+        self.remove(node_id)
+        self._labels[node_id] = (namespace, labels)
+        self._by_namespace[namespace].add(node_id)
+        for key, value in labels.items():
+            self._postings[(namespace, key, value)].add(node_id)
+            self._key_postings[(namespace, key)].add(node_id)
+
+    def remove(self, node_id: str):
+        """Remove a node from the index, if present."""
+        entry = self._labels.pop(node_id, None)
+        if entry is None:
+            return
+        namespace, labels = entry
+        self._discard(self._by_namespace, namespace, node_id)
+        for key, value in labels.items():
+            self._discard(self._postings, (namespace, key, value), node_id)
+            self._discard(self._key_postings, (namespace, key), node_id)
+
+    @staticmethod
+    def _discard(postings: Dict, key, node_id: str):
+        ids = postings.get(key)
+        if ids is not None:
+            ids.discard(node_id)
+            if not ids:
+                del postings[key]
+
+    def match(self, namespace: str, selector: Dict[str, str]) -> Set[str]:
+        """
+        Node IDs in `namespace` whose labels contain every key/value of an equality
+        selector (e.g. Service spec.selector). An empty selector matches everything.
+        """
+        if not selector:
+            return set(self._by_namespace.get(namespace, ()))
+        postings = []
+        for key, value in selector.items():
+            ids = self._postings.get((namespace, key, value))
+            if not ids:
+                return set()
+            postings.append(ids)
+        postings.sort(key=len)
+        return set(postings[0]).intersection(*postings[1:])
+
+    def match_selector(self, namespace: str, label_selector: Dict[str, Any]) -> Set[str]:
+        """
+        Node IDs in `namespace` matching a metav1.LabelSelector (matchLabels and
+        matchExpressions), as used by NetworkPolicy, PodDisruptionBudget, etc.
+        """
+        label_selector = label_selector or {}
+        candidates = self.match(namespace, label_selector.get('matchLabels') or {})
+        for expr in label_selector.get('matchExpressions') or []:
+            key, operator = expr.get('key'), expr.get('operator')
+            values = set(expr.get('values') or [])
+            if operator == 'In':
+                selected = set()
+                for value in values:
+                    selected |= self._postings.get((namespace, key, value), set())
+                candidates &= selected
+            elif operator == 'Exists':
+                candidates &= self._key_postings.get((namespace, key), set())
+            elif operator == 'NotIn':
+                candidates = {n for n in candidates
+                              if self._labels[n][1].get(key) not in values}
+            elif operator == 'DoesNotExist':
+                candidates -= self._key_postings.get((namespace, key), set())
+            if not candidates:
+                break
+        return candidates
+
+# Edge builder plugins: kind -> functions called as builder(graph_builder, node_id, resource)
+# for every resource of that kind. Builders registered for ALL_KINDS run for every resource.
+ALL_KINDS = "*"
+EDGE_BUILDERS: Dict[str, List[Callable]] = defaultdict(list)
+
+def edge_builder(*kinds: str):
+    """Decorator registering a GraphBuilder edge builder for the given kinds."""
+    def register(func: Callable) -> Callable:
+        for kind in kinds:
+            EDGE_BUILDERS[kind].append(func)
+        return func
+    return register
 
 class GraphBuilder:
     """Phase 2: Builds the graph using collected resources."""
     
     def __init__(self):
-        self.graph = nx.DiGraph()
+        self.graph = TrackedGraph()
         self.logger = logging.getLogger("graph_builder")
+        self._resources: Dict[str, K8sResource] = {}
+        self._node_mapping: Dict[str, str] = {}
+        self._stable_ids: Dict[str, str] = {}
+        self._label_indexes: Dict[str, LabelIndex] = {}
+        self._reset_bookkeeping()
+
+    def _reset_bookkeeping(self):
+        """
+        Bookkeeping for incremental updates. Every edge remembers which resources
+        (by node ID) contributed it, and every resource remembers which node IDs its
+        builders looked up, so a change to one object only recomputes what depends on it.
+        """
+        self._contributor: Optional[str] = None
+        self._contributions: Dict[str, Set[Tuple[str, str]]] = defaultdict(set)
+        self._edge_contributors: Dict[Tuple[str, str], Set[str]] = defaultdict(set)
+        self._references: Dict[str, Set[str]] = defaultdict(set)
+        self._referrers: Dict[str, Set[str]] = defaultdict(set)
+        # namespace -> {service node ID -> selector}, to re-match Pods as they change
+        self._service_selectors: Dict[str, Dict[str, Dict[str, str]]] = defaultdict(dict)
         
     def build_graph(self, resources: Dict[str, K8sResource]):
         """Build the complete graph in a systematic way."""
         # 1. Create cluster node first
         cluster_node = self._create_cluster_node()
         
-        # 2. Create all nodes (but no edges yet)
+        # 2. Create all nodes (but no edges yet), grouping resources by kind
         node_mapping = {}
+        by_kind: Dict[str, List[str]] = defaultdict(list)
         for stable_id, resource in resources.items():
             node_id = self._create_node(resource)
             node_mapping[stable_id] = node_id
+            by_kind[resource.kind].append(stable_id)
+
+        # Label indexes are built lazily (once per build) by selector-based edges
+        self._resources = resources
+        self._node_mapping = node_mapping
+        self._stable_ids = {node_id: stable_id for stable_id, node_id in node_mapping.items()}
+        self._label_indexes = {}
+        self._reset_bookkeeping()
             
-        # 3. Create edges
-        self._create_ownership_edges(resources, node_mapping)
-        self._create_runtime_edges(resources, node_mapping)
-        self._create_network_edges(resources, node_mapping)
-        self._create_volume_edges(resources, node_mapping)
-        self._create_mount_edges(resources, node_mapping)
+        # 3. Create edges in a single pass, dispatching each resource to the
+        #    edge builders registered for its kind
+        for kind, stable_ids in by_kind.items():
+            builders = self.edge_builders_for(kind)
+            for stable_id in stable_ids:
+                self._run_builders(node_mapping[stable_id], resources[stable_id], builders)
 
         return self.graph
 
+    def apply_resource(self, stable_id: str, resource: K8sResource) -> str:
+        """
+        Incrementally upsert a single resource: create or update its node, recompute
+        the edges it contributes, and recompute resources that reference it if the
+        node is new. Returns the node ID.
+        """
+        node_id = self._make_node_id(resource)
+        is_new = node_id not in self.graph
+
+        self._resources[stable_id] = resource
+        self._node_mapping[stable_id] = node_id
+        self._stable_ids[node_id] = stable_id
+        self._create_node(resource)
+
+        index = self._label_indexes.get(resource.kind)
+        if index is not None:
+            index.add(node_id, resource.namespace or "", resource.labels)
+
+        touched = self._recompute(node_id)
+        if is_new:
+            # Resources that looked this node up before it existed (e.g. children
+            # whose owner arrives late) can now link to it
+            for referrer in list(self._referrers.get(node_id, ())):
+                if referrer != node_id:
+                    touched |= self._recompute(referrer)
+        if resource.kind == "Pod":
+            self._sync_selecting_services(node_id, resource)
+
+        self._remove_dangling(touched)
+        return node_id
+
+    def remove_resource(self, stable_id: str) -> Optional[str]:
+        """
+        Incrementally remove a single resource: drop its node and every edge touching
+        it, recompute resources that referenced it and remove Port nodes left dangling.
+        Returns the removed node ID, or None if the resource was unknown.
+        """
+        resource = self._resources.pop(stable_id, None)
+        node_id = self._node_mapping.pop(stable_id, None)
+        if resource is None or node_id is None:
+            return None
+        if self._stable_ids.get(node_id) != stable_id:
+            # Another resource with the same kind/namespace/name now owns the node
+            return node_id
+        del self._stable_ids[node_id]
+
+        index = self._label_indexes.get(resource.kind)
+        if index is not None:
+            index.remove(node_id)
+        self._service_selectors[resource.namespace or ""].pop(node_id, None)
+
+        touched = self._clear_contributions(node_id)
+        if node_id in self.graph:
+            # Edges contributed by other resources into or out of this node
+            for edge in list(self.graph.in_edges(node_id)) + list(self.graph.out_edges(node_id)):
+                touched.update(edge)
+                for contributor in self._edge_contributors.pop(edge, ()):
+                    self._contributions[contributor].discard(edge)
+            self.graph.remove_node(node_id)
+        touched.discard(node_id)
+
+        # Resources that pointed at the removed node may fall back to other edges
+        for referrer in list(self._referrers.get(node_id, ())):
+            touched |= self._recompute(referrer)
+
+        self._remove_dangling(touched)
+        return node_id
+
+    def _run_builders(self, node_id: str, resource: K8sResource,
+                      builders: Optional[List[Callable]] = None):
+        """Run the edge builders for one resource, attributing new edges to it."""
+        self._contributor = node_id
+        try:
+            for builder in builders if builders is not None else self.edge_builders_for(resource.kind):
+                builder(self, node_id, resource)
+        finally:
+            self._contributor = None
+
+    def _recompute(self, node_id: str) -> Set[str]:
+        """Drop and rebuild the edges contributed by one resource. Returns touched nodes."""
+        touched = self._clear_contributions(node_id)
+        stable_id = self._stable_ids.get(node_id)
+        resource = self._resources.get(stable_id) if stable_id else None
+        if resource is not None:
+            if resource.kind == "Service":
+                self._service_selectors[resource.namespace or ""].pop(node_id, None)
+            self._run_builders(node_id, resource)
+        return touched
+
+    def _add_edge(self, source: str, target: str, **attrs):
+        """Add an edge on behalf of the resource whose builders are running."""
+        self.graph.add_edge(source, target, **attrs)
+        edge = (source, target)
+        self._contributions[self._contributor].add(edge)
+        self._edge_contributors[edge].add(self._contributor)
+
+    def _ref(self, node_id: str) -> bool:
+        """Record that the running builder depends on `node_id`; True if it exists."""
+        self._references[self._contributor].add(node_id)
+        self._referrers[node_id].add(self._contributor)
+        return node_id in self.graph
+
+    def _remove_contribution(self, contributor: str, edge: Tuple[str, str]) -> bool:
+        """Withdraw one contributor from an edge; removes the edge if nobody else added it."""
+        self._contributions[contributor].discard(edge)
+        contributors = self._edge_contributors.get(edge)
+        if contributors is None:
+            return False
+        contributors.discard(contributor)
+        if contributors:
+            return False
+        del self._edge_contributors[edge]
+        if self.graph.has_edge(*edge):
+            self.graph.remove_edge(*edge)
+        return True
+
+    def _clear_contributions(self, contributor: str) -> Set[str]:
+        """Remove every edge (and lookup) recorded for a contributor. Returns touched nodes."""
+        touched = set()
+        for edge in list(self._contributions.pop(contributor, ())):
+            if self._remove_contribution(contributor, edge):
+                touched.update(edge)
+        for target in self._references.pop(contributor, ()):
+            referrers = self._referrers.get(target)
+            if referrers is not None:
+                referrers.discard(contributor)
+                if not referrers:
+                    del self._referrers[target]
+        return touched
+
+    def _sync_selecting_services(self, pod_id: str, resource: K8sResource):
+        """Add or drop SERVICE_SELECTS_POD edges for a changed Pod."""
+        for service_id, selector in self._service_selectors.get(resource.namespace or "", {}).items():
+            edge = (service_id, pod_id)
+            matches = all(resource.labels.get(k) == v for k, v in selector.items())
+            if matches and service_id not in self._edge_contributors.get(edge, ()):
+                self._contributor = service_id
+                try:
+                    self._add_edge(
+                        service_id,
+                        pod_id,
+                        type="SELECTS",
+                        verbose_type="SERVICE_SELECTS_POD"
+                    )
+                finally:
+                    self._contributor = None
+            elif not matches and service_id in self._edge_contributors.get(edge, ()):
+                self._remove_contribution(service_id, edge)
+
+    def _remove_dangling(self, node_ids: Set[str]):
+        """Remove Port nodes that no longer have any edges."""
+        for node_id in node_ids:
+            if (node_id in self.graph and
+                    self.graph.nodes[node_id].get('kind') == 'Port' and
+                    self.graph.degree(node_id) == 0):
+                self.graph.remove_node(node_id)
+
+    @staticmethod
+    def edge_builders_for(kind: str) -> List[Callable]:
+        """Edge builders that apply to a kind: the generic ones, then kind-specific ones."""
+        return EDGE_BUILDERS.get(ALL_KINDS, []) + EDGE_BUILDERS.get(kind, [])
+
     def _create_cluster_node(self) -> str:
         """Create the root cluster node."""
         node_id = "cluster"
@@ -160,304 +615,200 @@ class GraphBuilder:
           
     def _make_node_id(self, resource: K8sResource) -> str:
         """Generate a stable node ID."""
-        key = f"{resource.kind}:" \
-              f"{resource.namespace or ''}:{resource.name}"
-        return hashlib.sha256(key.encode()).hexdigest()[:16]
+        return make_node_id(resource.kind, resource.namespace, resource.name)
         
     def _get_owner_node_id(self, owner_ref: Dict[str, Any], resource_namespace: str) -> Optional[str]:
         """Get node ID for an owner reference."""
-        if '/' in owner_ref['apiVersion']:
-            owner_group, owner_version = owner_ref['apiVersion'].split('/')
-        else:
-            owner_group, owner_version = "", owner_ref['apiVersion']
-            
         owner_namespace = "" if owner_ref['kind'] in CLUSTER_SCOPED_RESOURCES else resource_namespace
         
-        temp_resource = K8sResource(
-            group=owner_group,
-            version=owner_version,
-            kind=owner_ref['kind'],
-            namespace=owner_namespace,
-            name=owner_ref['name'],
-            owner_refs=[],
-            labels={},
-            spec={},
-            status={},
-            uid=""
-        )
-        return self._make_node_id(temp_resource)
+        return make_node_id(owner_ref['kind'], owner_namespace, owner_ref['name'])
 
-    def _create_ownership_edges(self, 
-                                resources: Dict[str, K8sResource], 
-                                node_mapping: Dict[str, str]):
-        """Create all ownership-based edges."""
+    # --- Edge builders, dispatched per resource by kind (see EDGE_BUILDERS) ---
+
+    @edge_builder(ALL_KINDS)
+    def _build_ownership_edges(self, node_id: str, resource: K8sResource):
+        """Ownership edges: owner references, otherwise cluster or namespace ownership."""
         cluster_node = "cluster"
-        
-        for stable_id, resource in resources.items():
-            node_id = node_mapping[stable_id]
-            
-            # 1) Owner references
-            if resource.owner_refs:
-                for owner_ref in resource.owner_refs:
-                    owner_id = self._get_owner_node_id(owner_ref, resource.namespace or "")
-                    if owner_id and owner_id in self.graph:
-                        self.graph.add_edge(
-                            owner_id, 
-                            node_id,
-                            type="OWNS",
-                            verbose_type=f"{owner_ref['kind'].upper()}_OWNS_{resource.kind.upper()}"
-                        )
-                        continue
-                        
-            # 2) If no owners, cluster or namespace "owns" it
-            if not any(self.graph.in_edges(node_id)):
-                if resource.kind in CLUSTER_SCOPED_RESOURCES or not resource.namespace:
-                    self.graph.add_edge(
-                        cluster_node, 
-                        node_id, 
-                        type="OWNS",
-                        verbose_type="CLUSTER_OWN_RESOURCE"
-                    )
-                else:
-                    if resource.kind not in ("Endpoints", "EndpointSlice"):
-                        ns_id = self._get_namespace_node_id(resource.namespace)
-                        if ns_id in self.graph:
-                            self.graph.add_edge(
-                                ns_id, 
-                                node_id,
-                                type="OWNS",
-                                verbose_type=f"NAMESPACE_OWNS_{resource.kind.upper()}"
-                            )
-
-    def _create_volume_edges(self, 
-                             resources: Dict[str, K8sResource],
-                             node_mapping: Dict[str, str]):
+        owned = False
+
+        # 1) Owner references
+        for owner_ref in resource.owner_refs:
+            owner_id = self._get_owner_node_id(owner_ref, resource.namespace or "")
+            if owner_id and self._ref(owner_id):
+                self._add_edge(
+                    owner_id, 
+                    node_id,
+                    type="OWNS",
+                    verbose_type=f"{owner_ref['kind'].upper()}_OWNS_{resource.kind.upper()}"
+                )
+                owned = True
+
+        # 2) If no owners, cluster or namespace "owns" it
+        if owned:
+            return
+        if resource.kind in CLUSTER_SCOPED_RESOURCES or not resource.namespace:
+            self._add_edge(
+                cluster_node, 
+                node_id, 
+                type="OWNS",
+                verbose_type="CLUSTER_OWN_RESOURCE"
+            )
+        elif resource.kind not in ("Endpoints", "EndpointSlice"):
+            ns_id = self._get_namespace_node_id(resource.namespace)
+            if self._ref(ns_id):
+                self._add_edge(
+                    ns_id, 
+                    node_id,
+                    type="OWNS",
+                    verbose_type=f"NAMESPACE_OWNS_{resource.kind.upper()}"
+                )
+
+    @edge_builder("PersistentVolume")
+    def _build_volume_edges(self, node_id: str, resource: K8sResource):
         """Create edges between PVs and PVCs (PV_BOUND_TO_PVC)."""
-        for resource_id, resource in resources.items():
-            if resource.kind == "PersistentVolume":
-                if resource.spec.get('claimRef'):
-                    claim = resource.spec['claimRef']
-                    pvc_temp = K8sResource(
-                        group="", 
-                        version="v1",
-                        kind="PersistentVolumeClaim",
-                        namespace=claim.get('namespace', ""),
-                        name=claim.get('name', ""),
-                        owner_refs=[], 
-                        labels={},
-                        spec={}, 
-                        status={},
-                        uid=""
-                    )
-                    pvc_id = self._make_node_id(pvc_temp)
-                    if pvc_id in self.graph:
-                        self.graph.add_edge(
-                            resource_id, 
-                            pvc_id,
-                            type="OWNS",
-                            verbose_type="PV_BOUND_TO_PVC"
-                        )
+        claim = resource.spec.get('claimRef')
+        if not claim:
+            return
+        pvc_id = make_node_id("PersistentVolumeClaim",
+                              claim.get('namespace', ""),
+                              claim.get('name', ""))
+        if self._ref(pvc_id):
+            self._add_edge(
+                node_id, 
+                pvc_id,
+                type="OWNS",
+                verbose_type="PV_BOUND_TO_PVC"
+            )
 
-    def _create_runtime_edges(self,
-                              resources: Dict[str, K8sResource],
-                              node_mapping: Dict[str, str]):
+    @edge_builder("Pod")
+    def _build_runtime_edges(self, node_id: str, resource: K8sResource):
         """Create runtime relationships (e.g. Pod running on Node)."""
-        for stable_id, resource in resources.items():
-            if resource.kind == "Pod":
-                node_name = resource.spec.get("nodeName")
-                if node_name:
-                    pod_id = node_mapping[stable_id]
-                    node_temp = K8sResource(
-                        group="", 
-                        version="v1", 
-                        kind="Node",
-                        namespace=None, 
-                        name=node_name,
-                        owner_refs=[], 
-                        labels={},
-                        spec={}, 
-                        status={},
-                        uid=""
-                    )
-                    node_id = self._make_node_id(node_temp)
-                    if node_id in self.graph:
-                        self.graph.add_edge(
-                            node_id, 
-                            pod_id,
-                            type="OWNS",
-                            verbose_type="NODE_RUNS_POD"
-                        )
-
-    def _create_network_edges(self,
-                              resources: Dict[str, K8sResource],
-                              node_mapping: Dict[str, str]):
-        """Create networking relationships (Service->Pod->Port, Endpoints->Pod, etc.)."""
-        self._process_service_relationships(resources, node_mapping)
-        self._process_endpoint_relationships(resources, node_mapping)
+        node_name = resource.spec.get("nodeName")
+        if not node_name:
+            return
+        k8s_node_id = make_node_id("Node", None, node_name)
+        if self._ref(k8s_node_id):
+            self._add_edge(
+                k8s_node_id, 
+                node_id,
+                type="OWNS",
+                verbose_type="NODE_RUNS_POD"
+            )
 
     def _get_namespace_node_id(self, namespace: str) -> str:
         """Get node ID for a namespace."""
-        tmp_ns_resource = K8sResource(
-            group="", 
-            version="v1", 
-            kind="Namespace",
-            namespace="", 
-            name=namespace,
-            owner_refs=[], 
-            labels={}, 
-            spec={}, 
-            status={},
-            uid=""
-        )
-        return self._make_node_id(tmp_ns_resource)
+        return make_node_id("Namespace", "", namespace)
 
-    def _process_service_relationships(self, 
-                                       resources: Dict[str, K8sResource],
-                                       node_mapping: Dict[str, str]):
+    def label_index(self, kind: str) -> LabelIndex:
+        """Label index over all resources of `kind` in the current build."""
+        index = self._label_indexes.get(kind)
+        if index is None:
+            index = LabelIndex.build(self._resources, self._node_mapping, kind)
+            self._label_indexes[kind] = index
+        return index
+
+    @edge_builder("Service")
+    def _build_service_edges(self, service_id: str, resource: K8sResource):
         """Process Service->Pod selection and Service->Port relationships."""
-        for stable_id, resource in resources.items():
-            if resource.kind != "Service":
-                continue
-            service_id = node_mapping[stable_id]
-            selector = resource.spec.get("selector", {})
-            
-            if selector:
-                # service->pod edges
-                for pod_stable_id, pod_resource in resources.items():
-                    if pod_resource.kind == "Pod" and pod_resource.namespace == resource.namespace:
-                        # If all labels match
-                        if all(pod_resource.labels.get(k) == v for k, v in selector.items()):
-                            self.graph.add_edge(
-                                service_id,
-                                node_mapping[pod_stable_id],
-                                type="SELECTS",
-                                verbose_type="SERVICE_SELECTS_POD"
-                            )
-
-            # create "port nodes" for service ports
-            for port in resource.spec.get("ports", []):
-                port_node_id = self._create_port_node(
-                    namespace=resource.namespace or "",
-                    name=f"{resource.name}-{port.get('port')}-{port.get('protocol', 'TCP')}",
-                    port_data=port
-                )
-                # link service -> port
-                self.graph.add_edge(
-                    service_id, 
-                    port_node_id, 
-                    type="OWNS",
-                    verbose_type="SERVICE_OWNS_PORT"
+        selector = resource.spec.get("selector", {})
+        
+        if selector:
+            # Remember the selector so Pods changed later can be re-matched
+            self._service_selectors[resource.namespace or ""][service_id] = selector
+            # service->pod edges for pods whose labels match the selector
+            pod_index = self.label_index("Pod")
+            for pod_id in pod_index.match(resource.namespace or "", selector):
+                self._add_edge(
+                    service_id,
+                    pod_id,
+                    type="SELECTS",
+                    verbose_type="SERVICE_SELECTS_POD"
                 )
 
-    def _process_endpoint_relationships(self, 
-                                        resources: Dict[str, K8sResource],
-                                        node_mapping: Dict[str, str]):
+        # create "port nodes" for service ports
+        for port in resource.spec.get("ports", []):
+            port_node_id = self._create_port_node(
+                namespace=resource.namespace or "",
+                name=f"{resource.name}-{port.get('port')}-{port.get('protocol', 'TCP')}",
+                port_data=port
+            )
+            # link service -> port
+            self._add_edge(
+                service_id, 
+                port_node_id, 
+                type="OWNS",
+                verbose_type="SERVICE_OWNS_PORT"
+            )
+
+    @edge_builder("Endpoints")
+    def _build_endpoints_edges(self, endpoints_id: str, resource: K8sResource):
         """Process Endpoints->Pod and related Port relationships."""
-        for stable_id, resource in resources.items():
-            if resource.kind != "Endpoints":
-                continue
-            endpoints_id = node_mapping[stable_id]
-            
-            # Link Endpoints -> Service
-            service_temp = K8sResource(
-                group="",
-                version="v1",
-                kind="Service",
-                namespace=resource.namespace,
-                name=resource.name,  # Endpoints share name with Service
-                owner_refs=[],
-                labels={},
-                spec={},
-                status={},
-                uid=""
+        # Link Endpoints -> Service
+        service_id = make_node_id("Service", resource.namespace, resource.name)
+        if self._ref(service_id):
+            self._add_edge(
+                service_id, 
+                endpoints_id, 
+                type="OWNS",
+                verbose_type="SERVICE_HAS_ENDPOINTS"
             )
-            service_id = self._make_node_id(service_temp)
-            if service_id in self.graph:
-                self.graph.add_edge(
-                    service_id, 
+        
+        # Now link endpoints->pods, endpoints->ports
+        for subset in resource.spec.get("subsets", []):
+            for address in subset.get("addresses", []):
+                target_ref = address.get("targetRef")
+                if not (target_ref and target_ref.get("kind") == "Pod"):
+                    continue
+                pod_id = make_node_id("Pod", resource.namespace, target_ref["name"])
+                if not self._ref(pod_id):
+                    continue
+                self._add_edge(
                     endpoints_id, 
+                    pod_id,
                     type="OWNS",
-                    verbose_type="SERVICE_HAS_ENDPOINTS"
+                    verbose_type="ENDPOINTS_TARGET_POD"
                 )
-            
-            # Now link endpoints->pods, endpoints->ports
-            for subset in resource.spec.get("subsets", []):
-                for address in subset.get("addresses", []):
-                    target_ref = address.get("targetRef")
-                    if target_ref and target_ref.get("kind") == "Pod":
-                        pod_temp = K8sResource(
-                            group="", 
-                            version="v1",
-                            kind="Pod",
-                            namespace=resource.namespace,
-                            name=target_ref["name"],
-                            owner_refs=[],
-                            labels={},
-                            spec={},
-                            status={},
-                            uid=""
+                
+                # ports
+                for port in subset.get("ports", []):
+                    # create pod port
+                    pod_port_id = self._create_port_node(
+                        resource.namespace or "",
+                        f"{target_ref['name']}-{port.get('port')}-{port.get('protocol', 'TCP')}",
+                        port
+                    )
+                    # create service port (again)
+                    service_port_id = self._create_port_node(
+                        resource.namespace or "",
+                        f"{resource.name}-{port.get('port')}-{port.get('protocol', 'TCP')}",
+                        port
+                    )
+                    # link pod->port
+                    self._add_edge(
+                        pod_id, 
+                        pod_port_id, 
+                        type="OWNS",
+                        verbose_type="POD_OWNS_PORT"
+                    )
+                    # link service->port
+                    if self._ref(service_id):
+                        self._add_edge(
+                            service_id, 
+                            service_port_id, 
+                            type="OWNS",
+                            verbose_type="SERVICE_OWNS_PORT"
                         )
-                        pod_id = self._make_node_id(pod_temp)
-                        if pod_id in self.graph:
-                            self.graph.add_edge(
-                                endpoints_id, 
-                                pod_id,
-                                type="OWNS",
-                                verbose_type="ENDPOINTS_TARGET_POD"
-                            )
-                            
-                            # ports
-                            for port in subset.get("ports", []):
-                                # create pod port
-                                pod_port_id = self._create_port_node(
-                                    resource.namespace or "",
-                                    f"{target_ref['name']}-{port.get('port')}-{port.get('protocol', 'TCP')}",
-                                    port
-                                )
-                                # create service port (again)
-                                service_port_id = self._create_port_node(
-                                    resource.namespace or "",
-                                    f"{resource.name}-{port.get('port')}-{port.get('protocol', 'TCP')}",
-                                    port
-                                )
-                                # link pod->port
-                                self.graph.add_edge(
-                                    pod_id, 
-                                    pod_port_id, 
-                                    type="OWNS",
-                                    verbose_type="POD_OWNS_PORT"
-                                )
-                                # link service->port
-                                if service_id in self.graph:
-                                    self.graph.add_edge(
-                                        service_id, 
-                                        service_port_id, 
-                                        type="OWNS",
-                                        verbose_type="SERVICE_OWNS_PORT"
-                                    )
-                                # link service port->pod port
-                                self.graph.add_edge(
-                                    service_port_id, 
-                                    pod_port_id,
-                                    type="OWNS",
-                                    verbose_type="SERVICE_TARGETS_PORT"
-                                )
+                    # link service port->pod port
+                    self._add_edge(
+                        service_port_id, 
+                        pod_port_id,
+                        type="OWNS",
+                        verbose_type="SERVICE_TARGETS_PORT"
+                    )
 
     def _create_port_node(self, namespace: str, name: str, port_data: Dict):
         """Create a Port node with standardized attributes, returns the node ID."""
-        port_resource = K8sResource(
-            group="", 
-            version="v1", 
-            kind="Port",
-            namespace=namespace,
-            name=name,
-            owner_refs=[],
-            labels={},
-            spec={"port": port_data.get("port"), "protocol": port_data.get("protocol", "TCP")},
-            status={},
-            uid=""
-        )
-        node_id = self._make_node_id(port_resource)
+        node_id = make_node_id("Port", namespace, name)
         
         if node_id not in self.graph:
             self.graph.add_node(
@@ -472,115 +823,414 @@ class GraphBuilder:
             )
         return node_id
 
-    def _create_mount_edges(self,
-                            resources: Dict[str, K8sResource],
-                            node_mapping: Dict[str, str]):
+    # (volume key, name field, target kind, verbose edge type) for Pod volume mounts
+    MOUNT_SOURCES = (
+        ("configMap", "name", "ConfigMap", "POD_MOUNTS_CONFIGMAP"),
+        ("secret", "secretName", "Secret", "POD_MOUNTS_SECRET"),
+        ("persistentVolumeClaim", "claimName", "PersistentVolumeClaim", "POD_MOUNTS_PVC"),
+    )
+
+    @edge_builder("Pod")
+    def _build_mount_edges(self, pod_id: str, resource: K8sResource):
         """
         Create edges from Pod -> (ConfigMap, Secret, PVC, etc.) if the Pod's volumes
         reference any of those resources.
         """
-        for stable_id, resource in resources.items():
-            if resource.kind != "Pod":
-                continue
-            
-            pod_id = node_mapping[stable_id]
-            volumes = resource.spec.get("volumes", [])
-            for vol in volumes:
-                # Check for a configMap volume
-                if "configMap" in vol:
-                    cm_name = vol["configMap"].get("name")
-                    if cm_name:
-                        cm_res = K8sResource(
-                            group="",
-                            version="v1",
-                            kind="ConfigMap",
-                            namespace=resource.namespace or "",
-                            name=cm_name,
-                            owner_refs=[],
-                            labels={},
-                            spec={},
-                            status={},
-                            uid=""
-                        )
-                        cm_id = self._make_node_id(cm_res)
-                        if cm_id in self.graph:
-                            self.graph.add_edge(
-                                pod_id,
-                                cm_id,
-                                type="MOUNTS",
-                                verbose_type="POD_MOUNTS_CONFIGMAP"
-                            )
-                
-                # Check for a secret volume
-                if "secret" in vol:
-                    secret_name = vol["secret"].get("secretName")
-                    if secret_name:
-                        secret_res = K8sResource(
-                            group="",
-                            version="v1",
-                            kind="Secret",
-                            namespace=resource.namespace or "",
-                            name=secret_name,
-                            owner_refs=[],
-                            labels={},
-                            spec={},
-                            status={},
-                            uid=""
-                        )
-                        secret_id = self._make_node_id(secret_res)
-                        if secret_id in self.graph:
-                            self.graph.add_edge(
-                                pod_id,
-                                secret_id,
-                                type="MOUNTS",
-                                verbose_type="POD_MOUNTS_SECRET"
-                            )
-
-                # Check for a PVC volume
-                if "persistentVolumeClaim" in vol:
-                    claim_name = vol["persistentVolumeClaim"].get("claimName")
-                    if claim_name:
-                        pvc_res = K8sResource(
-                            group="",
-                            version="v1",
-                            kind="PersistentVolumeClaim",
-                            namespace=resource.namespace or "",
-                            name=claim_name,
-                            owner_refs=[],
-                            labels={},
-                            spec={},
-                            status={},
-                            uid=""
-                        )
-                        pvc_id = self._make_node_id(pvc_res)
-                        if pvc_id in self.graph:
-                            self.graph.add_edge(
-                                pod_id,
-                                pvc_id,
-                                type="MOUNTS",
-                                verbose_type="POD_MOUNTS_PVC"
-                            )
+        for vol in resource.spec.get("volumes", []):
+            for vol_key, name_field, target_kind, verbose_type in self.MOUNT_SOURCES:
+                if vol_key not in vol:
+                    continue
+                target_name = (vol[vol_key] or {}).get(name_field)
+                if not target_name:
+                    continue
+                target_id = make_node_id(target_kind, resource.namespace or "", target_name)
+                if self._ref(target_id):
+                    self._add_edge(
+                        pod_id,
+                        target_id,
+                        type="MOUNTS",
+                        verbose_type=verbose_type
+                    )
+
+
+class TrackedGraph(nx.DiGraph):
+    """
+    DiGraph that records which nodes changed (attributes or adjacency) since the
+    last take_changes(), so a read view can be derived from the previous one by
+    copying only those nodes. `changed` is None when everything must be assumed
+    changed: a new graph, or after a bulk operation.
+    """
 
+    def __init__(self, incoming_graph_data=None, **attr):
+        self.changed: Optional[Set] = None
+        super().__init__(incoming_graph_data, **attr)
+
+    def take_changes(self) -> Optional[Set]:
+        """Nodes changed since the last call (None for everything); resets tracking."""
+        changed, self.changed = self.changed, set()
+        return changed
+
+    def _touch(self, *nodes):
+        if self.changed is not None:
+            self.changed.update(nodes)
+
+    def _touch_all(self):
+        self.changed = None
+
+    def add_node(self, node_for_adding, **attr):
+        self._touch(node_for_adding)
+        super().add_node(node_for_adding, **attr)
+
+    def add_edge(self, u_of_edge, v_of_edge, **attr):
+        self._touch(u_of_edge, v_of_edge)
+        super().add_edge(u_of_edge, v_of_edge, **attr)
+
+    def remove_node(self, n):
+        if n in self._node:
+            self._touch(n, *self._succ[n], *self._pred[n])
+        super().remove_node(n)
+
+    def remove_edge(self, u, v):
+        self._touch(u, v)
+        super().remove_edge(u, v)
+
+    def add_nodes_from(self, nodes_for_adding, **attr):
+        self._touch_all()
+        super().add_nodes_from(nodes_for_adding, **attr)
+
+    def add_edges_from(self, ebunch_to_add, **attr):
+        self._touch_all()
+        super().add_edges_from(ebunch_to_add, **attr)
+
+    def remove_nodes_from(self, nodes):
+        self._touch_all()
+        super().remove_nodes_from(nodes)
+
+    def remove_edges_from(self, ebunch):
+        self._touch_all()
+        super().remove_edges_from(ebunch)
+
+    def clear(self):
+        self._touch_all()
+        super().clear()
+
+    def clear_edges(self):
+        self._touch_all()
+        super().clear_edges()
+
+def _copy_graph(graph: nx.DiGraph, graph_class=nx.DiGraph) -> nx.DiGraph:
+    """Like graph.copy(), but into `graph_class`."""
+    copied = graph_class()
+    copied.graph.update(graph.graph)
+    copied.add_nodes_from((n, attrs.copy()) for n, attrs in graph._node.items())
+    copied.add_edges_from((u, v, attrs.copy()) for u, nbrs in graph._succ.items()
+                          for v, attrs in nbrs.items())
+    return copied
+
+def _copy_changed_nodes(live: nx.DiGraph, changed: Set, node: dict, succ: dict, pred: dict):
+    """
+    Overwrite the entries of `changed` nodes in a view's node/successor/predecessor
+    dicts with copies taken from the live graph; entries of other nodes stay shared
+    with the view they came from.
+    """
+    edge_copies = {}
+
+    def copy_edge(u, v, attrs):
+        edge = (u, v)
+        copied = edge_copies.get(edge)
+        if copied is None:
+            copied = edge_copies[edge] = dict(attrs)
+        return copied
+
+    for n in changed:
+        if n in live._node:
+            node[n] = dict(live._node[n])
+            succ[n] = {v: copy_edge(n, v, attrs) for v, attrs in live._succ[n].items()}
+            pred[n] = {u: copy_edge(u, n, attrs) for u, attrs in live._pred[n].items()}
+        else:
+            node.pop(n, None)
+            succ.pop(n, None)
+            pred.pop(n, None)
+
+def _graph_from_dicts(node: dict, succ: dict, pred: dict) -> nx.DiGraph:
+    graph = nx.DiGraph()
+    graph._node = node
+    graph._adj = succ
+    graph._pred = pred
+    return graph
+
+class TopologyView:
+    """
+    Immutable, versioned snapshot of the topology graph handed to readers.
+      - `version` is the live graph's version when the view was published.
+      - `generation` is the full-refresh generation the graph derives from.
+      - `synced_at` is when the graph was last known to match the cluster: when it
+        was published, moved forward while no watch events are pending, or the
+        snapshot time for a view loaded from disk.
+      - `cache` holds data derived from this view and is dropped with it.
+    """
+    __slots__ = ('graph', 'version', 'generation', 'refreshed_at', 'synced_at', 'created_at', 'cache')
+
+    def __init__(self, graph: nx.DiGraph, version: int, generation: int, refreshed_at: float,
+                 synced_at: Optional[float] = None):
+        self.graph = nx.freeze(graph)
+        self.version = version
+        self.generation = generation
+        self.refreshed_at = refreshed_at
+        self.created_at = time.time()
+        self.synced_at = self.created_at if synced_at is None else synced_at
+        self.cache: Dict[str, Any] = {}
+
+    @property
+    def age(self) -> float:
+        """Seconds since the view was last known to match the cluster."""
+        return max(0.0, time.time() - self.synced_at)
 
 class K8sTopologyManager:
-    def __init__(self, k8s_client, persistence_dir: str = "./topology_data"):
+    SNAPSHOT_PATTERNS = ("topology_snapshot_*.json", f"topology_snapshot_*{SNAPSHOT_SUFFIX}")
+
+    def __init__(self, k8s_client, persistence_dir: str = "./topology_data",
+                 collect_workers: int = 8, collect_timeout: Optional[float] = 120.0,
+                 snapshot_format: str = "binary", history_dir: Optional[str] = None,
+                 checkpoint_interval: float = 3600.0, history_retention: float = 3 * 24 * 3600.0):
         self.k8s_client = k8s_client
         self.persistence_dir = Path(persistence_dir)
-        self.collector = ResourceCollector(k8s_client)
+        # "binary" (compact, see snapshot_format.py) or "json" (legacy, human readable)
+        self.snapshot_format = snapshot_format
+        # Checkpoint + delta log history, replacing periodic full snapshots when enabled
+        self.history = SnapshotHistory(history_dir, checkpoint_interval=checkpoint_interval,
+                                       retention=history_retention) if history_dir else None
+        self.collector = ResourceCollector(k8s_client,
+                                           max_workers=collect_workers,
+                                           kind_timeout=collect_timeout)
         self.builder = GraphBuilder()
-        self.graph = nx.DiGraph()
+        self.graph = TrackedGraph()
         self._node_cache = {}
         self.logger = logging.getLogger("topology_manager")
+        # Guards the live (writer) graph; held only for short mutations and swaps
         self._lock = threading.RLock()
+        # Serializes full refreshes, which collect and build without holding _lock
+        self._refresh_lock = threading.Lock()
+        # Serializes publishing views; taken before _lock
+        self._view_lock = threading.Lock()
+        # Serializes and writes snapshots off the graph lock
+        self._snapshot_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="snapshot-writer")
+
+        # Full-rebuild generation counter and time of the last full refresh
+        self.generation = 0
+        self.last_refresh = 0.0
+        # Bumped on every change to the live graph; views are published per batch
+        self.version = 0
+        self._view = TopologyView(nx.DiGraph(), 0, 0, 0.0, synced_at=0.0)
+        # The live graph the published view derives from; its changes are tracked since
+        self._view_source: nx.DiGraph = self.graph
+        self.graph.take_changes()
+        # Nodes changed across the views published since the last history record (None: all)
+        self._history_changes: Optional[Set] = None
+        # Watch events applied while a refresh is building, replayed onto the new generation
+        self._replay_log: Optional[List[Tuple[str, str, str, Any]]] = None
 
     def refresh_topology(self):
-        """Update the entire topology using the two-phase approach."""
+        """
+        Rebuild the entire topology into a fresh generation using the two-phase approach.
+        Each refresh collects into a new resource map and builds into a new GraphBuilder,
+        and the previous generation (graph, resources and incremental bookkeeping) is
+        released once replaced, so deleted objects and stale Port nodes never accumulate.
+
+        Collection and building happen without holding the graph lock. Watch events
+        applied meanwhile are replayed onto the new graph before it is swapped in, so
+        readers and incremental updates never wait on a refresh.
+
+        Concurrent callers coalesce: if a refresh is already in flight, this waits for
+        it to finish instead of starting another one.
+        """
+        if not self._refresh_lock.acquire(blocking=False):
+            with self._refresh_lock:
+                return
+        try:
+            self._refresh()
+        finally:
+            self._refresh_lock.release()
+
+    def refresh_if_stale(self, max_staleness: float) -> bool:
+        """
+        Refresh (coalescing with any in-flight refresh) if the published view was
+        last known to match the cluster more than `max_staleness` seconds ago. While
+        watch events keep the view current, that is never the case. Returns True if
+        a refresh was waited on.
+        """
+        if self._view.age <= max_staleness:
+            return False
+        self.refresh_topology()
+        return True
+
+    def mark_synced(self):
+        """
+        Record that the published view still matches the cluster, e.g. when the
+        watcher has applied every event it received. Ignored while changes are
+        unpublished or a graph loaded from a snapshot awaits its rebuild.
+        """
         with self._lock:
+            if self._view.version == self.version and not self.needs_rebuild():
+                self._view.synced_at = time.time()
+
+    def _refresh(self):
+        """Collect and build a new generation and swap it in (call with _refresh_lock held)."""
+        start = time.time()
+        with self._lock:
+            self._replay_log = []
+
+        try:
             # Phase 1: Collect all resources
             resources = self.collector.collect_all_resources()
             
-            # Phase 2: Build the graph
-            self.graph = self.builder.build_graph(resources)
+            # Phase 2: Build the graph into a new generation
+            builder = GraphBuilder()
+            graph = builder.build_graph(resources)
+            view_graph = _copy_graph(graph)
+            graph.take_changes()
+        except Exception:
+            with self._lock:
+                self._replay_log = None
+            raise
+
+        with self._view_lock, self._lock:
+            for event_type, api_version, kind, obj in self._replay_log:
+                self._apply_to_builder(builder, event_type, api_version, kind, obj)
+            replayed = len(self._replay_log)
+            self._replay_log = None
+
+            # Swap generations; the stable ID memo is rebuilt on demand
+            self.builder = builder
+            self.graph = graph
+            self._node_cache = {}
+            self.generation += 1
+            self.last_refresh = time.time()
+            self._mark_changed()
+            # Publish the copy made off-lock, patched with the replayed events
+            _copy_changed_nodes(graph, graph.take_changes(), view_graph._node,
+                                view_graph._succ, view_graph._pred)
+            self._publish(view_graph, graph)
+
+        self.logger.info(
+            f"Built topology generation {self.generation}: {graph.number_of_nodes()} nodes, "
+            f"{graph.number_of_edges()} edges in {self.last_refresh - start:.2f}s "
+            f"({replayed} events replayed)"
+        )
+
+    def get_view(self) -> TopologyView:
+        """
+        Return the last published immutable, versioned view of the graph, shared by
+        all readers. Changes to the live graph show up once publish_view() runs.
+        """
+        return self._view
+
+    def publish_view(self) -> TopologyView:
+        """
+        Publish the live graph's changes since the last view as a new view. Called
+        by the writer once per processed batch of events, so it runs at a bounded
+        cadence no matter the event rate.
+
+        The new view shares the previous one's per-node dicts and copies only the
+        nodes that changed, which is the only part done under the graph lock.
+        """
+        with self._view_lock:
+            view = self._view
+            if view.version == self.version:
+                return view
+            base = view.graph
+            node, succ, pred = dict(base._node), dict(base._succ), dict(base._pred)
+            with self._lock:
+                graph = self.graph
+                changed = graph.take_changes() if graph is self._view_source else None
+                if changed is None:
+                    # A graph replaced or bulk-modified outside refresh/load: copy it all
+                    view_graph = _copy_graph(graph)
+                else:
+                    _copy_changed_nodes(graph, changed, node, succ, pred)
+                    view_graph = _graph_from_dicts(node, succ, pred)
+                return self._publish(view_graph, graph, changed=changed)
+
+    def _publish(self, view_graph: nx.DiGraph, source: nx.DiGraph,
+                 synced_at: Optional[float] = None, changed: Optional[Set] = None) -> TopologyView:
+        """
+        Make `view_graph` the current view of `source` (call with both locks held).
+        `changed` holds the nodes that differ from the previous view (None for all).
+        """
+        self._view = TopologyView(view_graph, self.version, self.generation, self.last_refresh,
+                                  synced_at=synced_at)
+        self._view_source = source
+        if changed is None or self._history_changes is None:
+            self._history_changes = None
+        else:
+            self._history_changes.update(changed)
+        return self._view
+
+    def _mark_changed(self):
+        """Record a change to the live graph (call with _lock held)."""
+        self.version += 1
+
+    def needs_rebuild(self) -> bool:
+        """True until the live graph comes from a full refresh, e.g. after loading a snapshot."""
+        return self.graph is not self.builder.graph
+
+    def apply_event(self, event_type: str, api_version: str, kind: str, obj) -> Optional[str]:
+        """
+        Patch the graph in place for a single watch event instead of rebuilding it:
+        ADDED/MODIFIED upsert the object's node and recompute only the edges that
+        depend on it, DELETED removes it along with edges left dangling.
+        Returns the affected node ID.
+
+        Until a graph loaded from a snapshot has been rebuilt (see needs_rebuild()),
+        there is no base to patch: events are only kept for the replay log of a
+        refresh in flight, and otherwise left to the listing of the rebuild.
+        """
+        with self._lock:
+            if self._replay_log is not None:
+                self._replay_log.append((event_type, api_version, kind, obj))
+            if self.needs_rebuild():
+                return None
+            node_id = self._apply_to_builder(self.builder, event_type, api_version, kind, obj)
+            self._mark_changed()
+            return node_id
+
+    def reconcile_kind(self, api_version: str, kind: str, objects: List[Any]) -> Tuple[int, int]:
+        """
+        Bring one kind in line with a fresh LIST of it, after its watch may have
+        missed events (first start, 410 Gone). Listed objects that differ from the
+        graph are applied as ADDED and objects of the kind missing from the LIST
+        as DELETED, both through apply_event(). Call it from the thread applying
+        watch events, in order with them. Returns (applied, deleted).
+        """
+        listed = {}
+        for obj in objects:
+            stable_id, resource = self.collector.to_resource(api_version, kind, obj)
+            listed[stable_id] = (obj, resource)
+        group, version = api_version.split('/') if '/' in api_version else ("", api_version)
+        # Only this thread applies events, so the builder's resources can be read off-lock
+        current = {stable_id: resource for stable_id, resource in list(self.builder._resources.items())
+                   if resource.kind == kind and resource.version == version and resource.group == group}
+
+        applied = deleted = 0
+        for stable_id, (obj, resource) in listed.items():
+            if current.get(stable_id) != resource:
+                self.apply_event('ADDED', api_version, kind, obj)
+                applied += 1
+        for stable_id, resource in current.items():
+            if stable_id not in listed:
+                tombstone = ResourceInstance(None, {
+                    'apiVersion': api_version, 'kind': kind,
+                    'metadata': {'name': resource.name, 'namespace': resource.namespace}})
+                self.apply_event('DELETED', api_version, kind, tombstone)
+                deleted += 1
+        return applied, deleted
+
+    def _apply_to_builder(self, builder: GraphBuilder, event_type: str,
+                          api_version: str, kind: str, obj) -> Optional[str]:
+        stable_id, resource = self.collector.to_resource(api_version, kind, obj)
+        if event_type == 'DELETED':
+            return builder.remove_resource(stable_id)
+        return builder.apply_resource(stable_id, resource)
 
     def add_node(self, group: str, version: str, kind: str,
                  namespace: Optional[str], name: str, **attrs) -> str:
@@ -604,10 +1254,8 @@ class K8sTopologyManager:
             })
 
             # Create or update the node
-            if node_id not in self.graph:
-                self.graph.add_node(node_id, **sanitized_attrs)
-            else:
-                self.graph.nodes[node_id].update(sanitized_attrs)
+            self.graph.add_node(node_id, **sanitized_attrs)
+            self._mark_changed()
 
             # If there are no in-edges, set ownership unless this node is a Port.
             # That way, we won't get "Namespace -> Port" or "K8Cluster -> Port" edges automatically.
@@ -640,6 +1288,8 @@ class K8sTopologyManager:
                 
         for edge in edges_to_remove:
             self.graph.remove_edge(*edge)
+        if edges_to_remove:
+            self._mark_changed()
 
     def _ensure_namespace_exists(self, namespace: str) -> str:
         with self._lock:
@@ -688,6 +1338,7 @@ class K8sTopologyManager:
                     uid=cluster_id,  
                     last_seen=time.time()
                 )
+                self._mark_changed()
                 
             return cluster_id
 
@@ -713,25 +1364,30 @@ class K8sTopologyManager:
             if not all(isinstance(x, str) for x in [from_node, to_node]):
                 raise ValueError("Nodes must be strings (hashed IDs)")
             
+            edge_type = rel_type
             if self.graph.has_edge(from_node, to_node):
                 existing_type = self.graph[from_node][to_node].get('type')
                 if existing_type == rel_type:
                     return
                 if isinstance(existing_type, list):
-                    if rel_type not in existing_type:
-                        existing_type.append(rel_type)
+                    # Replace rather than append: views share attribute values
+                    edge_type = existing_type if rel_type in existing_type else existing_type + [rel_type]
                 else:
-                    self.graph[from_node][to_node]['type'] = [existing_type, rel_type]
-            else:
-                self.graph.add_edge(from_node, to_node, type=rel_type)
-                
-            self.graph[from_node][to_node]['last_seen'] = time.time()
+                    edge_type = [existing_type, rel_type]
 
+            # Through add_edge() so the change is tracked for the next view
+            self.graph.add_edge(from_node, to_node, type=edge_type, last_seen=time.time())
+            self._mark_changed()
 
-    def _serialize_graph(self) -> dict:
+
+    def _serialize_graph(self, graph: Optional[nx.DiGraph] = None) -> dict:
         """
         Serialize the graph into a JSON-friendly dictionary format with enhanced type handling.
+        Defaults to the last published view of the graph.
         """
+        if graph is None:
+            graph = self._view.graph
+
         def sanitize_attrs(attrs):
             """Helper to sanitize attribute dictionaries"""
             sanitized = {}
@@ -752,7 +1408,7 @@ class K8sTopologyManager:
                     'id': node_id,
                     'attributes': sanitize_attrs(attrs)
                 }
-                for node_id, attrs in self.graph.nodes(data=True)
+                for node_id, attrs in graph.nodes(data=True)
             ],
             'edges': [
                 {
@@ -760,9 +1416,9 @@ class K8sTopologyManager:
                     'target': target,
                     'attributes': sanitize_attrs(attrs)
                 }
-                for source, target, attrs in self.graph.edges(data=True)
+                for source, target, attrs in graph.edges(data=True)
             ],
-            'node_cache': self._node_cache,
+            'node_cache': dict(self._node_cache),
             'metadata': {
                 'timestamp': time.time(),
                 'version': '1.1'
@@ -774,124 +1430,219 @@ class K8sTopologyManager:
         Reconstruct the graph from a serialized dictionary format.
         """
         # Create a new empty graph
-        self.graph = nx.DiGraph()
+        graph = nx.DiGraph()
         
         # Add nodes
         for node_data in data['nodes']:
             node_id = node_data['id']  # Already a string
-            self.graph.add_node(node_id, **node_data['attributes'])
+            graph.add_node(node_id, **node_data['attributes'])
             
         # Add edges
         for edge_data in data['edges']:
             source = edge_data['source']  # Already a string
             target = edge_data['target']
-            self.graph.add_edge(source, target, **edge_data['attributes'])
+            graph.add_edge(source, target, **edge_data['attributes'])
             
         # Restore node cache
-        self._node_cache = data['node_cache']
+        self._install_loaded(graph, data['node_cache'], data.get('metadata', {}).get('timestamp'))
+
+    def _install_loaded(self, graph: nx.DiGraph, node_cache: Dict[str, str],
+                        state_time: Optional[float]):
+        """
+        Make a graph loaded from a snapshot or the history live, and publish it as
+        the view, current as of `state_time` (when the snapshot was taken).
+        """
+        live = _copy_graph(graph, TrackedGraph)
+        live.take_changes()
+        with self._view_lock, self._lock:
+            self.graph, self._node_cache = live, node_cache
+            self._mark_changed()
+            self._publish(graph, live, synced_at=float(state_time or 0.0))
 
-    def save_snapshot(self):
-        """Save current topology state."""
+    def save_snapshot(self, wait: bool = False) -> str:
+        """
+        Save current topology state and return the snapshot path.
+        The snapshot is the last published view, reused as is (no copy of the graph);
+        only copying the node cache happens under the lock. Serializing and the fsynced
+        temp-file-and-rename write run on a background writer thread, so snapshots never
+        stall watch events or API reads. Pass wait=True to block until the file is written.
+        """
+        view = self._view
         with self._lock:
-            timestamp = int(time.time())
-            filename = f"topology_snapshot_{timestamp}.json"
-            filepath = self.persistence_dir / filename
-            
-            # Convert the graph to a serializable format
-            data = {
-                'nodes': [
-                    {
-                        'id': node_id,
-                        'attributes': {k: str(v) for k, v in attrs.items()}  # Convert all values to strings
-                    }
-                    for node_id, attrs in self.graph.nodes(data=True)
-                ],
-                'edges': [
-                    {
-                        'source': source,
-                        'target': target,
-                        'attributes': {k: str(v) for k, v in attrs.items()}
-                    }
-                    for source, target, attrs in self.graph.edges(data=True)
-                ],
-                'node_cache': self._node_cache,
-                'metadata': {
-                    'timestamp': timestamp,
-                    'version': '1.0'
+            node_cache = dict(self._node_cache)
+        timestamp = int(time.time())
+        suffix = SNAPSHOT_SUFFIX if self.snapshot_format == "binary" else ".json"
+        filepath = self.persistence_dir / f"topology_snapshot_{timestamp}{suffix}"
+
+        future = self._snapshot_writer.submit(self._write_snapshot_file, filepath,
+                                              view.graph, node_cache, timestamp)
+        future.add_done_callback(self._log_snapshot_result)
+        if wait:
+            future.result()
+        return str(filepath)
+
+    def _write_snapshot_file(self, filepath: Path, graph: nx.DiGraph,
+                             node_cache: Dict[str, str], timestamp: int):
+        if self.snapshot_format == "binary":
+            write_snapshot(filepath, graph, node_cache, {'timestamp': timestamp, 'version': '2.0'})
+            return filepath
+
+        # Convert the graph to a serializable format
+        data = {
+            'nodes': [
+                {
+                    'id': node_id,
+                    'attributes': {k: str(v) for k, v in attrs.items()}  # Convert all values to strings
                 }
+                for node_id, attrs in graph.nodes(data=True)
+            ],
+            'edges': [
+                {
+                    'source': source,
+                    'target': target,
+                    'attributes': {k: str(v) for k, v in attrs.items()}
+                }
+                for source, target, attrs in graph.edges(data=True)
+            ],
+            'node_cache': node_cache,
+            'metadata': {
+                'timestamp': timestamp,
+                'version': '1.0'
             }
-            
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2)
-                
-            return str(filepath)
+        }
+        atomic_write(filepath, json.dumps(data, indent=2).encode('utf-8'))
+        return filepath
+
+    def _log_snapshot_result(self, future):
+        error = future.exception()
+        if error is not None:
+            self.logger.error(f"Error writing topology snapshot: {error}")
+        else:
+            self.logger.debug(f"Wrote topology snapshot {future.result()}")
 
     def load_snapshot(self, filepath: str):
         """
-        Load topology state from a JSON snapshot file.
+        Load topology state from a snapshot file, binary or JSON (detected from its header).
         """
-        with self._lock:
-            filepath = Path(filepath)
-            if not filepath.exists():
-                raise FileNotFoundError(f"Snapshot file not found: {filepath}")
-                
+        filepath = Path(filepath)
+        if not filepath.exists():
+            raise FileNotFoundError(f"Snapshot file not found: {filepath}")
+
+        if is_binary_snapshot(filepath):
+            graph, node_cache, metadata = read_snapshot(filepath)
+            self._install_loaded(graph, node_cache, metadata.get('timestamp'))
+        else:
             with open(filepath, 'r', encoding='utf-8') as f:
                 data = json.load(f)
-                
+
             self._deserialize_graph(data)
-            self.logger.info(f"Loaded topology snapshot from {filepath}")
+        self.logger.info(f"Loaded topology snapshot from {filepath}")
+
+    def _snapshot_files(self) -> List[Path]:
+        return [path for pattern in self.SNAPSHOT_PATTERNS
+                for path in self.persistence_dir.glob(pattern)]
+
+    def record_history(self) -> Optional[str]:
+        """
+        Record the last published view into the snapshot history (a delta against the
+        previous record, or a full checkpoint when one is due). Returns what was written.
+        The delta only compares the nodes changed by the views published in between.
+        """
+        if self.history is None:
+            return None
+        with self._view_lock:
+            view = self._view
+            changed, self._history_changes = self._history_changes, set()
+        with self._lock:
+            node_cache = dict(self._node_cache)
+        try:
+            return self.history.record(view.graph, node_cache, time.time(), changed)
+        except Exception:
+            # The history's baseline may not have advanced: compare everything next time
+            with self._view_lock:
+                self._history_changes = None
+            raise
+
+    def load_history(self, timestamp: Optional[float] = None) -> bool:
+        """
+        Restore the topology from the snapshot history as of `timestamp` (latest if None).
+        Returns False if the history has no state that old.
+        """
+        if self.history is None:
+            return False
+        restored = self.history.graph_at(timestamp)
+        if restored is None:
+            return False
+        graph, node_cache, state_time = restored
+        self._install_loaded(graph, node_cache, state_time)
+        self.logger.info(f"Restored topology from history as of {state_time:.0f}")
+        return True
 
     def get_latest_snapshot(self) -> Optional[str]:
         """
         Get the path to the most recent snapshot file.
         """
-        with self._lock:
-            snapshots = list(self.persistence_dir.glob("topology_snapshot_*.json"))
-            if not snapshots:
-                return None
-            return str(max(snapshots, key=lambda p: p.stat().st_mtime))
+        snapshots = self._snapshot_files()
+        if not snapshots:
+            return None
+        return str(max(snapshots, key=lambda p: p.stat().st_mtime))
 
     # TODO call
     def cleanup_old_nodes(self, max_age_seconds: float = 3600):
         """
-        Remove nodes that haven't been seen recently.
+        Remove nodes added through add_node() that haven't been seen recently.
+        Nodes built from collected resources carry no 'last_seen' and are reclaimed
+        by the next full refresh instead.
         """
         with self._lock:
             current_time = time.time()
             nodes_to_remove = []
             
             for node, attrs in self.graph.nodes(data=True):
-                last_seen = attrs.get('last_seen', 0)
+                last_seen = attrs.get('last_seen')
+                if last_seen is None:
+                    continue
                 if current_time - last_seen > max_age_seconds:
                     nodes_to_remove.append(node)
                     
             for node in nodes_to_remove:
                 self.graph.remove_node(node)
-                
-            return len(nodes_to_remove)
+            if nodes_to_remove:
+                self._mark_changed()
+
+        if nodes_to_remove:
+            self.publish_view()
+        return len(nodes_to_remove)
 
     # TODO call
     def cleanup_old_snapshots(self, max_snapshots: int = 10):
         """
-        Keep only the N most recent snapshots.
+        Keep only the N most recent snapshots. Only touches files, so it runs without
+        the graph lock.
         """
-        with self._lock:
-            snapshots = list(self.persistence_dir.glob("topology_snapshot_*.json"))
-            if len(snapshots) <= max_snapshots:
-                return
-                
-            # Sort by modification time
-            snapshots.sort(key=lambda p: p.stat().st_mtime)
+        snapshots = self._snapshot_files()
+        if len(snapshots) <= max_snapshots:
+            return
             
-            # Remove oldest snapshots
-            for snapshot in snapshots[:-max_snapshots]:
-                snapshot.unlink()
-                self.logger.debug(f"Removed old snapshot: {snapshot}")
+        # Sort by modification time
+        snapshots.sort(key=lambda p: p.stat().st_mtime)
+        
+        # Remove oldest snapshots
+        for snapshot in snapshots[:-max_snapshots]:
+            snapshot.unlink()
+            self.logger.debug(f"Removed old snapshot: {snapshot}")
 
 class K8sClient:
-    def __init__(self, kubeconfig_path: Optional[str] = None):
+    def __init__(self, kubeconfig_path: Optional[str] = None, list_page_size: int = 500,
+                 cache_dir: Optional[str] = None, discovery_ttl: float = 600.0):
        self.logger = logging.getLogger("k8s_client")
        self.kubeconfig_path = kubeconfig_path
+       self.list_page_size = list_page_size
+       cache_file = Path(cache_dir) / "discovery_cache.json" if cache_dir else None
+       self.discovery_cache = DiscoveryCache(cache_file, ttl=discovery_ttl)
+       # The dynamic client's LazyDiscoverer fills its cache (and rewrites its cache
+       # file) without locking, so lookups through it are serialized
+       self._discovery_lock = threading.Lock()
        self._initialize_client()
     
     def _initialize_client(self):
@@ -937,10 +1688,15 @@ class K8sClient:
                 f"Failed to initialize Kubernetes client: {str(e)}"
             ) from e
                  
+    def get_resource(self, api_version: str, kind: str):
+        """Resolve the dynamic client Resource of a kind (thread-safe)."""
+        with self._discovery_lock:
+            return self.dynamic_client.resources.get(api_version=api_version, kind=kind)
+
     def get_namespaces(self) -> List[str]:
         """Get list of all namespaces."""
         try:
-            namespaces = self.dynamic_client.resources.get(
+            namespaces = self.get_resource(
                 api_version='v1',
                 kind='Namespace'
             ).get()
@@ -950,7 +1706,10 @@ class K8sClient:
             return []
             
     def get_api_resources(self):
-        """Get all API resources."""
+        """
+        Get all API resources. Per group/version discovery results are served from
+        the discovery cache until they expire or the API groups / CRD set change.
+        """
         # Core API (v1)
         core_resources = {
             'Pod', 'Service', 'ConfigMap', 'Secret', 'PersistentVolumeClaim',
@@ -962,19 +1721,51 @@ class K8sClient:
             
         # API Groups
         api_groups = client.ApisApi(self._api_client).get_api_versions()
-        for group in api_groups.groups:
-            group_name = group.name
-            version = group.preferred_version.version
-            api_version = f"{group_name}/{version}"
-            
-            try:
-                resources = self.dynamic_client.resources.search(api_version=api_version)
-                for resource in resources:
-                    if not self._is_valid_resource(resource):
-                        continue
-                    yield api_version, resource.kind
-            except Exception as e:
-                self.logger.debug(f"Error processing API group {api_version}: {e}")
+        group_versions = [
+            f"{group.name}/{group.preferred_version.version}" for group in api_groups.groups
+        ]
+        self.discovery_cache.validate(self._discovery_fingerprint(group_versions))
+
+        cache_updated = False
+        for api_version in group_versions:
+            kinds = self.discovery_cache.get(api_version)
+            if kinds is None:
+                try:
+                    with self._discovery_lock:
+                        resources = self.dynamic_client.resources.search(api_version=api_version)
+                    kinds = [resource.kind for resource in resources
+                             if self._is_valid_resource(resource)]
+                except Exception as e:
+                    self.logger.debug(f"Error processing API group {api_version}: {e}")
+                    continue
+                self.discovery_cache.put(api_version, kinds)
+                cache_updated = True
+
+            for kind in kinds:
+                yield api_version, kind
+
+        if cache_updated:
+            self.discovery_cache.save()
+
+    def _discovery_fingerprint(self, group_versions: List[str]) -> str:
+        """
+        Fingerprint the served API groups and the CRD set (name + generation), so the
+        discovery cache can be invalidated when either changes.
+        """
+        fingerprint = hashlib.sha256("\n".join(sorted(group_versions)).encode())
+        try:
+            crds = self.get_resource(
+                api_version='apiextensions.k8s.io/v1',
+                kind='CustomResourceDefinition'
+            ).get(header_params={'Accept': PARTIAL_METADATA_LIST})
+            crd_keys = sorted(
+                f"{crd.metadata.name}:{crd.metadata.generation}" for crd in crds.items or []
+            )
+            fingerprint.update("\n".join(crd_keys).encode())
+        except Exception as e:
+            # Without CRD access we can only rely on the group list and the TTL
+            self.logger.debug(f"Error listing CRDs for discovery fingerprint: {e}")
+        return fingerprint.hexdigest()[:16]
                 
     def _is_valid_resource(self, resource) -> bool:
         """Check if a resource should be processed."""
@@ -1003,33 +1794,81 @@ class K8sClient:
             
         return True
 
-    def get_resources(self, api_version: str, kind: str, namespace: Optional[str] = None):
-        """Get resources of specified type."""
+    def get_resources(self, api_version: str, kind: str, namespace: Optional[str] = None,
+                      timeout: Optional[float] = None):
+        """Get resources of specified type. `timeout` bounds the LIST in seconds."""
         try:
-            resource = self.dynamic_client.resources.get(api_version=api_version, kind=kind)
-            
-            # Only use namespace if the resource is namespaced
+            return list(self.iter_resources(api_version, kind, namespace=namespace,
+                                            timeout=timeout))
+        except Exception as e:
+            self.logger.debug(f"Error getting resources {kind} in {namespace}: {e}")
+            return []
+
+    def iter_resources(self, api_version: str, kind: str, namespace: Optional[str] = None,
+                       page_size: Optional[int] = None, timeout: Optional[float] = None,
+                       list_info: Optional[Dict[str, Any]] = None, resource=None):
+        """
+        Yield resources of the specified type, listing them in chunks of `page_size`
+        using limit/continue tokens so only about one page is held in memory at a time.
+        `timeout` is a deadline in seconds for the whole listing (all pages); exceeding it
+        raises TimeoutError. A 404 for the resource type yields nothing.
+        If a continue token expires (410) mid-listing, the listing restarts from the first
+        page, so callers may see an object more than once and should key items by identity.
+        If given, `list_info['resourceVersion']` is set to the resourceVersion of the
+        listing (that of its first page), which a watch can resume from.
+        Pass the kind's already resolved `resource` to skip the discovery lookup.
+        """
+        page_size = page_size or self.list_page_size
+        deadline = time.time() + timeout if timeout else None
+        if resource is None:
+            resource = self.get_resource(api_version, kind)
+
+        list_kwargs = {'limit': page_size}
+        # Only use namespace if the resource is namespaced
+        if namespace and resource.namespaced and kind not in CLUSTER_SCOPED_RESOURCES:
+            list_kwargs['namespace'] = namespace
+
+        continue_token = None
+        restarts = 0
+        while True:
+            request_kwargs = dict(list_kwargs)
+            if continue_token:
+                request_kwargs['_continue'] = continue_token
+            if deadline:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise TimeoutError(f"Listing {api_version}/{kind} exceeded {timeout}s")
+                request_kwargs['_request_timeout'] = remaining
+
             try:
-                if namespace and resource.namespaced and kind not in CLUSTER_SCOPED_RESOURCES:
-                    response = resource.get(namespace=namespace)
-                else:
-                    response = resource.get()
-                    
-                # Ensure we return a list of items
-                if hasattr(response, 'items'):
-                    return response.items
-                elif isinstance(response, list):
-                    return response
-                else:
-                    # If single item returned, wrap in list
-                    return [response]
-                    
+                response = resource.get(**request_kwargs)
             except Exception as e:
                 # Check if resource type exists but returns error
                 if "404" in str(e):
-                    return []
+                    return
+                if getattr(e, 'status', None) == 410 and continue_token and restarts < 3:
+                    self.logger.info(f"Continue token expired while listing {kind}, restarting list")
+                    continue_token = None
+                    restarts += 1
+                    continue
                 raise
-                
-        except Exception as e:
-            self.logger.debug(f"Error getting resources {kind} in {namespace}: {e}")
-            return []
+
+            metadata = getattr(response, 'metadata', None)
+            if list_info is not None and not continue_token:
+                list_info['resourceVersion'] = getattr(metadata, 'resourceVersion', None)
+
+            # Ensure we yield individual items
+            if hasattr(response, 'items'):
+                for item in response.items or []:
+                    yield item
+            elif isinstance(response, list):
+                yield from response
+                return
+            else:
+                # If single item returned, yield it as-is
+                yield response
+                return
+
+            continue_token = getattr(metadata, 'continue', None) if metadata else None
+            if not continue_token:
+                return
@@ -0,0 +1,528 @@
+# watch_mux.py
+
+"""
+Multiplexed Kubernetes watches.
+
+Every watched kind is one long-lived HTTP watch stream. Instead of a blocking
+thread per kind, the streams are spread over a small fixed set of event loop
+threads, each waiting on its sockets with a selector and decoding the chunked
+NDJSON watch responses itself. Streams are opened (initial LIST + connect) by a
+small opener pool, throttled by a token bucket rather than fixed sleeps, so
+all kinds start concurrently without bursting the API server.
+
+The streams reuse the connection settings and credentials of the kubernetes
+ApiClient (host, CA, client certificates, every configured auth setting),
+including its proxy (and no_proxy exceptions): streams tunnel through an
+http:// proxy with CONNECT. Other proxy schemes (https://, socks5://) fall back
+to the client's own blocking watch, one thread per kind.
+"""
+
+import base64
+import json
+import logging
+import random
+import selectors
+import socket
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from urllib.parse import unquote, urlencode, urlparse
+
+from kubernetes.client.exceptions import ApiException
+from kubernetes.dynamic.resource import ResourceInstance
+from requests.utils import should_bypass_proxies
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, up to `burst` at once."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, stop_event: Optional[threading.Event] = None) -> bool:
+        """Wait for a token; returns False if `stop_event` is set first."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                delay = (1 - self._tokens) / self.rate
+            if stop_event is None:
+                time.sleep(delay)
+            elif stop_event.wait(delay):
+                return False
+
+class WatchError(Exception):
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+class WatchStream:
+    """State of the watch of one kind: the connection and an incremental HTTP/1.1 response parser."""
+
+    def __init__(self, api_version: str, kind: str):
+        self.api_version = api_version
+        self.kind = kind
+        self.resource = None
+        self.resource_version: Optional[str] = None
+        self.sock: Optional[socket.socket] = None
+        self.loop = 0
+        self.deadline = 0.0
+        self._reset_parser()
+
+    @property
+    def key(self) -> str:
+        return f"{self.api_version}/{self.kind}"
+
+    def _reset_parser(self):
+        self.status: Optional[int] = None
+        self.finished = False
+        self._raw = bytearray()
+        self._body = bytearray()
+        self._chunked = False
+        self._chunk_left = 0
+        self._need_crlf = False
+
+    def feed(self, data: bytes) -> List[Dict]:
+        """Consume bytes from the socket; returns the complete watch events (raw dicts) decoded so far."""
+        self._raw += data
+        if self.status is None:
+            end = self._raw.find(b"\r\n\r\n")
+            if end < 0:
+                return []
+            lines = self._raw[:end].decode('latin-1').split("\r\n")
+            del self._raw[:end + 4]
+            self.status = int(lines[0].split()[1])
+            headers = {}
+            for line in lines[1:]:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip().lower()
+            self._chunked = 'chunked' in headers.get('transfer-encoding', '')
+
+        if self._chunked:
+            self._decode_chunks()
+        else:
+            self._body += self._raw
+            self._raw.clear()
+
+        if self.status != 200:
+            return []  # error body, read in full on close
+        events = []
+        while True:
+            end = self._body.find(b"\n")
+            if end < 0:
+                break
+            line = bytes(self._body[:end])
+            del self._body[:end + 1]
+            if line.strip():
+                events.append(json.loads(line))
+        return events
+
+    def _decode_chunks(self):
+        raw = self._raw
+        while raw:
+            if self._chunk_left:
+                take = min(self._chunk_left, len(raw))
+                self._body += raw[:take]
+                del raw[:take]
+                self._chunk_left -= take
+                if self._chunk_left:
+                    return
+                self._need_crlf = True
+            if self._need_crlf:
+                if len(raw) < 2:
+                    return
+                del raw[:2]
+                self._need_crlf = False
+            end = raw.find(b"\r\n")
+            if end < 0:
+                return
+            size = int(bytes(raw[:end]).split(b";")[0], 16)
+            del raw[:end + 2]
+            if size == 0:
+                self.finished = True
+                return
+            self._chunk_left = size
+
+    def error(self) -> WatchError:
+        """The error carried by a non-200 response (a Kubernetes Status object)."""
+        message = bytes(self._body).decode('utf-8', 'replace').strip()
+        try:
+            message = json.loads(message).get('message', message)
+        except (ValueError, AttributeError):
+            pass
+        return WatchError(f"HTTP {self.status}: {message}", self.status)
+
+class _EventLoop:
+    """One thread multiplexing a set of watch streams with a selector."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.selector = selectors.DefaultSelector()
+        self.streams: List[WatchStream] = []
+        self._attach: List[WatchStream] = []
+        self._lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+
+    def attach(self, stream: WatchStream):
+        """Hand a connected stream to the loop (called from opener threads)."""
+        with self._lock:
+            self._attach.append(stream)
+
+    def take_attached(self) -> List[WatchStream]:
+        with self._lock:
+            attached, self._attach = self._attach, []
+        return attached
+
+class WatchMultiplexer:
+    """
+    Runs the watches of many kinds on `num_threads` event loop threads.
+    `on_event(api_version, kind, event_type, obj)` is called from a loop thread
+    for every watch event, with `obj` wrapped as a ResourceInstance.
+    `list_version(resource)` LISTs the kind, catching up on whatever the stream
+    missed, and returns the resourceVersion the stream starts from; it is only
+    called for new streams and after a 410. Otherwise a reconnecting stream
+    resumes from the resourceVersion of the last event or BOOKMARK it received.
+    """
+
+    SELECT_TIMEOUT = 0.25
+    CONNECT_TIMEOUT = 10.0
+    RETRY_DELAY = 5.0
+    READ_SIZE = 65536
+
+    def __init__(self, k8s_client, on_event: Callable, list_version: Callable,
+                 num_threads: int = 4, open_workers: int = 4,
+                 start_rate: float = 20.0, start_burst: int = 20,
+                 watch_timeout: int = 600):
+        self.logger = logging.getLogger("watch_mux")
+        self.k8s_client = k8s_client
+        self.on_event = on_event
+        self.list_version = list_version
+        self.watch_timeout = watch_timeout
+        self.limiter = TokenBucket(start_rate, start_burst)
+        self.stop_event = threading.Event()
+
+        self.streams: Dict[str, WatchStream] = {}
+        self._loops = [_EventLoop(f"watch-loop-{i}") for i in range(max(1, num_threads))]
+        self._opener = ThreadPoolExecutor(max_workers=max(1, open_workers),
+                                          thread_name_prefix="watch-open")
+        # Streams waiting to be (re)opened: key -> monotonic due time
+        self._retry: Dict[str, float] = {}
+        self._retry_lock = threading.Lock()
+
+        api_client = k8s_client.dynamic_client.client
+        self._api_client = api_client
+        config = api_client.configuration
+        url = urlparse(config.host)
+        self._tls = url.scheme == 'https'
+        self._host = url.hostname
+        self._port = url.port or (443 if self._tls else 80)
+        self._host_header = url.netloc
+        self._base_path = url.path.rstrip('/')
+        self._ssl_context = self._make_ssl_context(config) if self._tls else None
+        self._server_hostname = config.tls_server_name or self._host
+
+        # Proxy the ApiClient would use: http:// is tunneled through, anything
+        # else falls back to the client's own watch
+        self._proxy, self._proxy_headers = None, {}
+        self._client_watch = False
+        self._client_watch_threads: List[threading.Thread] = []
+        if config.proxy and not should_bypass_proxies(config.host, no_proxy=config.no_proxy or ''):
+            proxy = urlparse(config.proxy)
+            if proxy.scheme == 'http':
+                self._proxy, self._proxy_headers = self._proxy_settings(proxy, config)
+            else:
+                self.logger.warning(f"Watches cannot tunnel through a {proxy.scheme}:// proxy "
+                                    f"({proxy.hostname}); using the client's watch, one thread per kind")
+                self._client_watch = True
+
+    @staticmethod
+    def _proxy_settings(proxy, config):
+        """(host, port) of an http:// proxy to tunnel through and the headers to send it."""
+        headers = dict(config.proxy_headers or {})
+        if proxy.username and not any(k.lower() == 'proxy-authorization' for k in headers):
+            credentials = f"{unquote(proxy.username)}:{unquote(proxy.password or '')}"
+            headers['Proxy-Authorization'] = "Basic " + base64.b64encode(credentials.encode()).decode()
+        return (proxy.hostname, proxy.port or 80), headers
+
+    @staticmethod
+    def _make_ssl_context(config) -> ssl.SSLContext:
+        context = ssl.create_default_context(cafile=config.ssl_ca_cert)
+        if not config.verify_ssl:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        elif config.assert_hostname is False:
+            context.check_hostname = False
+        if config.cert_file:
+            context.load_cert_chain(config.cert_file, config.key_file)
+        return context
+
+    def start(self):
+        self.stop_event.clear()
+        for loop in self._loops:
+            loop.thread = threading.Thread(target=self._run_loop, args=(loop,),
+                                           name=loop.name, daemon=True)
+            loop.thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self.stop_event.set()
+        self._opener.shutdown(wait=False, cancel_futures=True)
+        for loop in self._loops:
+            if loop.thread:
+                loop.thread.join(timeout=timeout)
+
+    def add(self, api_version: str, kind: str):
+        """Start watching a kind (no-op if it is already watched)."""
+        stream = WatchStream(api_version, kind)
+        if stream.key in self.streams:
+            return
+        # Spread the streams evenly over the loops
+        stream.loop = len(self.streams) % len(self._loops)
+        self.streams[stream.key] = stream
+        self._submit_open(stream)
+
+    def resource_versions(self) -> Dict[str, str]:
+        """Latest resourceVersion seen per watched kind ("apiVersion/Kind")."""
+        return {key: stream.resource_version for key, stream in self.streams.items()
+                if stream.resource_version}
+
+    def active_streams(self) -> int:
+        return (sum(len(loop.streams) for loop in self._loops) +
+                sum(thread.is_alive() for thread in self._client_watch_threads))
+
+    # Opening streams
+
+    def _submit_open(self, stream: WatchStream):
+        try:
+            self._opener.submit(self._open, stream)
+        except RuntimeError:
+            pass  # shutting down
+
+    def _schedule_retry(self, stream: WatchStream, delay: float):
+        with self._retry_lock:
+            self._retry[stream.key] = time.monotonic() + delay
+
+    def _submit_due_retries(self):
+        now = time.monotonic()
+        with self._retry_lock:
+            due = [key for key, at in self._retry.items() if at <= now]
+            for key in due:
+                del self._retry[key]
+        for key in due:
+            self._submit_open(self.streams[key])
+
+    def _open(self, stream: WatchStream):
+        """Opener thread: resolve the resource, LIST for a resourceVersion, connect and send the watch request."""
+        if not self.limiter.acquire(self.stop_event):
+            return
+        if stream.resource is None:
+            try:
+                resource = self.k8s_client.get_resource(stream.api_version, stream.kind)
+            except Exception as e:
+                self.logger.error(f"Error setting up watch for {stream.kind}: {e}")
+                return
+            if 'watch' not in resource.verbs:
+                self.logger.debug(f"Resource {stream.kind} does not support watch operation")
+                return
+            stream.resource = resource
+        if self._client_watch:
+            thread = threading.Thread(target=self._watch_with_client, args=(stream,),
+                                      name=f"watch-{stream.kind}", daemon=True)
+            self._client_watch_threads.append(thread)
+            thread.start()
+            return
+        try:
+            if stream.resource_version is None:
+                stream.resource_version = self.list_version(stream.resource)
+            self._connect(stream)
+        except Exception as e:
+            self.logger.error(f"Error opening watch for {stream.kind}: {e}")
+            self._schedule_retry(stream, self.RETRY_DELAY)
+            return
+        if self.stop_event.is_set():
+            stream.sock.close()
+            return
+        self.logger.debug(f"Watching {stream.kind} from resourceVersion {stream.resource_version}")
+        self._loops[stream.loop].attach(stream)
+
+    def _connect(self, stream: WatchStream):
+        timeout = random.randint(self.watch_timeout // 2, self.watch_timeout)
+        query = [('watch', 'true'), ('resourceVersion', stream.resource_version),
+                 ('allowWatchBookmarks', 'true'), ('timeoutSeconds', str(timeout))]
+        headers = dict(self._api_client.default_headers)
+        headers.update({'Host': self._host_header, 'Accept': 'application/json',
+                        'Connection': 'close'})
+        # Every auth setting the client has; client certificates are in the SSL context
+        self._api_client.update_params_for_auth(headers, query,
+                                                list(self._api_client.configuration.auth_settings()))
+        path = f"{self._base_path}{stream.resource.path()}?{urlencode(query)}"
+        request = f"GET {path} HTTP/1.1\r\n" + "".join(f"{k}: {v}\r\n" for k, v in headers.items()) + "\r\n"
+
+        sock = socket.create_connection(self._proxy or (self._host, self._port),
+                                        timeout=self.CONNECT_TIMEOUT)
+        try:
+            if self._proxy is not None:
+                self._tunnel(sock)
+            if self._ssl_context is not None:
+                sock = self._ssl_context.wrap_socket(sock, server_hostname=self._server_hostname)
+            sock.sendall(request.encode('latin-1'))
+            sock.setblocking(False)
+        except Exception:
+            sock.close()
+            raise
+        stream._reset_parser()
+        stream.sock = sock
+        # The server ends the watch after `timeout`; a silent connection is dropped a bit later
+        stream.deadline = time.monotonic() + timeout + 60
+
+    def _tunnel(self, sock: socket.socket):
+        """Ask the proxy on `sock` for a tunnel to the API server (HTTP CONNECT)."""
+        target = f"{self._host}:{self._port}"
+        headers = {'Host': target, **self._proxy_headers}
+        sock.sendall((f"CONNECT {target} HTTP/1.1\r\n" +
+                      "".join(f"{k}: {v}\r\n" for k, v in headers.items()) + "\r\n").encode('latin-1'))
+        response = b""
+        # Nothing follows the proxy's reply until the tunnel is used, so this never over-reads
+        while b"\r\n\r\n" not in response:
+            data = sock.recv(4096)
+            if not data:
+                raise WatchError("Proxy closed the connection during CONNECT")
+            response += data
+        status_line = response.split(b"\r\n", 1)[0].decode('latin-1')
+        parts = status_line.split(None, 2)
+        status = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else None
+        if status != 200:
+            raise WatchError(f"Proxy refused CONNECT to {target}: {status_line}", status)
+
+    def _watch_with_client(self, stream: WatchStream):
+        """
+        Fallback for proxies the raw streams cannot tunnel through: the client's
+        own blocking watch of one kind, run on a thread of its own. Events go
+        through _dispatch() like those of multiplexed streams.
+        """
+        while not self.stop_event.is_set():
+            try:
+                if stream.resource_version is None:
+                    stream.resource_version = self.list_version(stream.resource)
+                timeout = random.randint(self.watch_timeout // 2, self.watch_timeout)
+                for event in self.k8s_client.dynamic_client.watch(
+                        stream.resource, resource_version=stream.resource_version, timeout=timeout):
+                    self._dispatch(stream, {'type': event['type'], 'object': event['raw_object']})
+                    if self.stop_event.is_set():
+                        break
+            except (ApiException, WatchError) as e:
+                if e.status == 410:
+                    self.logger.info(f"resourceVersion {stream.resource_version} of {stream.kind} expired; relisting")
+                    stream.resource_version = None
+                    continue
+                self.logger.error(f"API error watching {stream.kind}: {e}")
+                self.stop_event.wait(self.RETRY_DELAY)
+            except Exception as e:
+                self.logger.error(f"Error watching {stream.kind}: {e}")
+                self.stop_event.wait(self.RETRY_DELAY)
+
+    # Event loops
+
+    def _run_loop(self, loop: _EventLoop):
+        while not self.stop_event.is_set():
+            for stream in loop.take_attached():
+                loop.selector.register(stream.sock, selectors.EVENT_READ, stream)
+                loop.streams.append(stream)
+            if loop is self._loops[0]:
+                self._submit_due_retries()
+
+            if loop.streams:
+                ready = loop.selector.select(timeout=self.SELECT_TIMEOUT)
+            else:
+                ready = []
+                self.stop_event.wait(self.SELECT_TIMEOUT)
+            for key, _ in ready:
+                self._read(loop, key.data)
+
+            now = time.monotonic()
+            for stream in [s for s in loop.streams if s.deadline < now]:
+                self.logger.warning(f"Watch for {stream.kind} went silent; reconnecting")
+                self._close(loop, stream, 0)
+
+        for stream in list(loop.streams) + loop.take_attached():
+            if stream in loop.streams:
+                loop.selector.unregister(stream.sock)
+            stream.sock.close()
+        loop.streams.clear()
+        loop.selector.close()
+
+    def _read(self, loop: _EventLoop, stream: WatchStream):
+        chunks = []
+        closed = False
+        try:
+            while True:
+                data = stream.sock.recv(self.READ_SIZE)
+                if not data:
+                    closed = True
+                    break
+                chunks.append(data)
+        except (BlockingIOError, ssl.SSLWantReadError, ssl.SSLWantWriteError):
+            pass
+        except OSError as e:
+            self.logger.warning(f"Watch connection for {stream.kind} failed: {e}")
+            closed = True
+
+        try:
+            for event in stream.feed(b"".join(chunks)):
+                self._dispatch(stream, event)
+        except WatchError as e:
+            self._handle_error(loop, stream, e)
+            return
+        except ValueError as e:
+            self.logger.error(f"Malformed watch response for {stream.kind}: {e}")
+            self._close(loop, stream, self.RETRY_DELAY)
+            return
+
+        if closed or stream.finished:
+            if stream.status not in (None, 200):
+                self._handle_error(loop, stream, stream.error())
+            else:
+                self._close(loop, stream, 0)
+
+    def _dispatch(self, stream: WatchStream, event: Dict):
+        event_type = event.get('type')
+        obj = event.get('object') or {}
+        if event_type == 'ERROR':
+            raise WatchError(obj.get('message', 'watch error'), obj.get('code'))
+        resource_version = (obj.get('metadata') or {}).get('resourceVersion')
+        if resource_version:
+            stream.resource_version = resource_version
+        if event_type == 'BOOKMARK':
+            return  # only advances the resourceVersion
+        self.on_event(stream.api_version, stream.kind, event_type,
+                      ResourceInstance(self.k8s_client.dynamic_client, obj))
+
+    def _handle_error(self, loop: _EventLoop, stream: WatchStream, error: WatchError):
+        if error.status == 410:  # resourceVersion too old: LIST again
+            self.logger.info(f"resourceVersion {stream.resource_version} of {stream.kind} expired; relisting")
+            self._close(loop, stream, 0, relist=True)
+        else:
+            self.logger.error(f"API error watching {stream.kind}: {error}")
+            self._close(loop, stream, self.RETRY_DELAY)
+
+    def _close(self, loop: _EventLoop, stream: WatchStream, retry_delay: float, relist: bool = False):
+        """
+        Close a stream and schedule it to be reopened. It resumes from its last
+        resourceVersion unless `relist` is set.
+        """
+        loop.selector.unregister(stream.sock)
+        loop.streams.remove(stream)
+        stream.sock.close()
+        stream.sock = None
+        if relist:
+            stream.resource_version = None
+        if not self.stop_event.is_set():
+            self._schedule_retry(stream, retry_delay)